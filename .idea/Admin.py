@@ -1,71 +1,317 @@
 # Enhanced Admin Library System UI
 import sys
-import bcrypt
+import threading
 import mysql.connector
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLineEdit, QPushButton, QMessageBox,
     QStackedWidget, QLabel, QHBoxLayout, QInputDialog, QTableWidget, QTableWidgetItem,
     QMainWindow, QDialog, QFormLayout, QDialogButtonBox, QFrame, QScrollArea,
-    QDateEdit, QDoubleSpinBox, QComboBox, QCheckBox, QGroupBox
+    QDateEdit, QDoubleSpinBox, QComboBox, QCheckBox, QGroupBox, QFileDialog, QProgressDialog, QShortcut
 )
-from PyQt5.QtGui import QFont, QColor, QPalette, QIcon
+from PyQt5.QtGui import QColor, QPalette, QIcon, QKeySequence
 from PyQt5.QtCore import Qt, QDate
 from datetime import datetime, timedelta
 from functools import partial
 from PyQt5.QtGui import QRegExpValidator
 from PyQt5.QtCore import QRegExp
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QTimer, QObject, pyqtSignal
 from datetime import date
+from Database import get_db_connection, close_pool
+from Workers import QueryExecutor
+from Migrations import check_schema, SchemaError
+from Passwords import get_password_service
+from AdminTables import AdminTableModel, AdminTableView, TableSpec, Column, fetch_page
+from BookImport import import_books
+from Exports import export_report, export_format, ExportError
+from Fines import scan_overdue, member_fines, penalty, penalty_days, penalty_sql, SCAN_INTERVAL_MS, PAID
+from LoanHistory import fetch_member_history, maintain_partitions
+from ChangeFeed import ChangeFeed, BOOK_EVENTS, LOAN_EVENTS, MEMBER_EVENTS, RETURNED
+from Repositories import BookRepository, LoanRepository, UserRepository, AdminRepository
+from Instrumentation import get_recorder
+from Cache import get_cache, apply_events as invalidate_events, members_changed, BOOK_TABLE, MEMBER_TABLE
+from DiagnosticsPanel import DiagnosticsPanel
+from Theme import apply_theme, font, set_role
+
+
+def claimed_text(row):
+    return "Yes" if row[5] == 1 else "No"
+
+
+def claimed_color(row):
+    return "green" if row[5] == 1 else "blue"
+
+
+def overdue_params():
+    # One "now" for the computed columns and the WHERE
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return (now, now, now)
+
+
+def overdue_display(row):
+    seconds = row[5]
+    if seconds >= 86400:
+        return f"{seconds // 86400}"
+    return f"{seconds // 60} mins"
+
+
+BOOKS_TABLE = TableSpec(
+    select="id, title, author, available",
+    source="books",
+    key="id",
+    columns=[
+        Column("ID", "id", 0),
+        Column("Title", "title", 1),
+        Column("Author", "author", 2),
+        Column("Available", "available", 3, display=lambda row: "Yes" if row[3] else "No"),
+    ],
+    filter_columns=("title", "author"),
+)
+
+BORROWED_TABLE = TableSpec(
+    select="id, username, book_id, book_title, due_date, is_claimed",
+    source="borrowed_books",
+    key="id",
+    columns=[
+        Column("ID", "id", 0),
+        Column("User", "username", 1),
+        Column("Book ID", "book_id", 2),
+        Column("Book Title", "book_title", 3),
+        Column("Due Date", "due_date", 4),
+        Column("Claimed", "is_claimed", 5, display=claimed_text, color=claimed_color),
+    ],
+    filter_columns=("username", "book_title"),
+)
+
+OVERDUE_TABLE = TableSpec(
+    # Penalties come from the fines ledger. A loan the scanner hasn't
+    # reached yet is charged what the scanner would write for it.
+    select=f"""b.id, b.username, b.book_id, b.book_title, b.due_date,
+        TIMESTAMPDIFF(SECOND, b.due_date, %s) AS overdue_secs,
+        COALESCE(f.amount, {penalty_sql('b.due_date')}) AS penalty""",
+    source="borrowed_books b LEFT JOIN fines f ON f.loan_id = b.id",
+    key="b.id",
+    where="b.due_date < %s",
+    params=overdue_params,
+    columns=[
+        Column("ID", "b.id", 0),
+        Column("User", "b.username", 1),
+        Column("Book ID", "b.book_id", 2),
+        Column("Overdue Book", "b.book_title", 3),
+        Column("Due Date", "b.due_date", 4),
+        Column("Days Overdue", display=overdue_display),
+        Column("Penalty", display=lambda row: f"${row[6]:.2f}"),
+    ],
+    filter_columns=("b.username", "b.book_title"),
+    # Oldest first: a range scan of (due_date, id) that stops after a page
+    default_sort=4,
+)
+
+MEMBERS_TABLE = TableSpec(
+    select=f"""u.id, u.username, COUNT(b.id) AS borrowed,
+        (SELECT COALESCE(SUM(f.amount), 0) FROM fines f
+         WHERE f.username = u.username AND f.status != '{PAID}') AS fines_owed""",
+    source="users u LEFT JOIN borrowed_books b ON b.username = u.username",
+    group_by="u.id, u.username",
+    key="u.id",
+    columns=[
+        Column("ID", "u.id", 0),
+        Column("Username", "u.username", 1),
+        Column("Books Borrowed", "borrowed", 2, aggregate=True),
+        Column("Fines Owed", display=lambda row: f"${row[3]:.2f}"),
+    ],
+    filter_columns=("u.username",),
+)
+
+ADMINS_TABLE = TableSpec(
+    select="adminid, username",
+    source="admins",
+    key="adminid",
+    # The super admin can't be deleted from here
+    where="adminid != 2",
+    columns=[
+        Column("ID", "adminid", 0),
+        Column("Username", "username", 1),
+    ],
+)
+
+HISTORY_TABLE = TableSpec(
+    select="id, username, book_id, book_title, borrowed_at, due_date, returned_at, fine",
+    source="loan_history",
+    key="id",
+    columns=[
+        Column("Loan ID", "id", 0),
+        Column("User", field=1),
+        Column("Book ID", field=2),
+        Column("Book Title", field=3),
+        Column("Borrowed", field=4),
+        Column("Due Date", field=5),
+        Column("Returned", "returned_at", 6),
+        Column("Fine", display=lambda row: f"${row[7]:.2f}"),
+    ],
+    filter_columns=("username", "book_title"),
+    # Newest returns first, read from (returned_at, id)
+    default_sort=6,
+    default_descending=True,
+)
+
+# Reports the admin can export, by CLI name
+EXPORT_REPORTS = {
+    "loans": BORROWED_TABLE,
+    "overdue": OVERDUE_TABLE,
+    "members": MEMBERS_TABLE,
+    "history": HISTORY_TABLE,
+}
+
+# How change feed events reach each view: the kinds that touch it, the
+# column (SQL expression and row field) the rows are matched on, and the
+# event attribute holding its value
+VIEW_EVENTS = {
+    BOOKS_TABLE: (BOOK_EVENTS, "id", 0, "book_id"),
+    BORROWED_TABLE: (LOAN_EVENTS, "id", 0, "loan_id"),
+    OVERDUE_TABLE: (LOAN_EVENTS, "b.id", 0, "loan_id"),
+    MEMBERS_TABLE: (MEMBER_EVENTS, "u.username", 1, "username"),
+    HISTORY_TABLE: ((RETURNED,), "id", 0, "loan_id"),
+}
+
+# Views whose pages are kept in a read-through cache (see Cache.py), by
+# cache name. The others show loan times, which change by the minute.
+TABLE_CACHES = {
+    BOOKS_TABLE: BOOK_TABLE,
+    MEMBERS_TABLE: MEMBER_TABLE,
+}
+
+# Dashboard views as Instrumentation names them
+VIEW_NAMES = {
+    BOOKS_TABLE: "view_all_books",
+    BORROWED_TABLE: "view_borrowed",
+    OVERDUE_TABLE: "view_overdue",
+    MEMBERS_TABLE: "view_members",
+    HISTORY_TABLE: "view_history",
+}
+
+
+def fetch_table_page(spec, *args):
+    # fetch_page, through the view's cache if it has one
+    cache = TABLE_CACHES.get(spec)
+    if cache is None:
+        return fetch_page(spec, *args)
+    return get_cache(cache).get(args, partial(fetch_page, spec, *args))
+
+
+def authenticate_admin(username, password):
+    with get_db_connection() as conn:
+        admins = AdminRepository(conn)
+        admin = admins.credentials(username)
+        if not admin or not admin.password:
+            return None
+
+        ok, new_hash = get_password_service().verify_and_upgrade(password, admin.password)
+        if not ok:
+            return None
+        if new_hash:
+            admins.set_password(admin.id, new_hash)
+            conn.commit()
+        return admin.id
+
+
+def create_account(table, username, password):
+    # table is one of our own constants ("users" / "admins"), never user input
+    hashed = get_password_service().hash(password)
+
+    with get_db_connection() as conn:
+        repository = UserRepository(conn) if table == "users" else AdminRepository(conn)
+        repository.add(username, hashed)
+        conn.commit()
+
+
+# The dashboard's reads and writes, run on the executor. Each takes its own
+# connection and hands it back before the result reaches the GUI thread.
+def update_loan(loan_id, book_id, username, due_date, is_claimed):
+    with get_db_connection() as conn:
+        LoanRepository(conn).edit(loan_id, book_id, username, due_date, is_claimed)
+        conn.commit()
+
+
+def loan_claimed(loan_id):
+    with get_db_connection() as conn:
+        return LoanRepository(conn).is_claimed(loan_id)
+
+
+def return_loan(loan_id, paid=False):
+    # The returned book's id, or None if there was no such loan
+    with get_db_connection() as conn:
+        book_id = LoanRepository(conn).release(loan_id, paid=paid)
+        if book_id is not None:
+            conn.commit()
+        return book_id
+
+
+def insert_book(title, author):
+    with get_db_connection() as conn:
+        BookRepository(conn).add(title, author)
+        conn.commit()
+
+
+def update_book(book_id, title, author, available):
+    # A book out on loan stays unavailable whatever the checkbox says
+    with get_db_connection() as conn:
+        BookRepository(conn).edit(book_id, title, author, available)
+        conn.commit()
+
+
+def remove_book(book_id):
+    # False if the book is out on loan and so wasn't deleted
+    with get_db_connection() as conn:
+        books = BookRepository(conn)
+        if books.is_on_loan(book_id):
+            return False
+        books.delete(book_id)
+        conn.commit()
+        return True
+
+
+def rename_member(user_id, old_name, new_name):
+    with get_db_connection() as conn:
+        UserRepository(conn).rename(user_id, old_name, new_name)
+        conn.commit()
+
+
+def member_loan_count(username):
+    with get_db_connection() as conn:
+        return LoanRepository(conn).count_for_member(username)
+
+
+def remove_member(user_id, username):
+    with get_db_connection() as conn:
+        UserRepository(conn).delete(user_id, username)
+        conn.commit()
+
+
+def fetch_member_details(username):
+    # (current loans with their status, unpaid fines, recent returns)
+    with get_db_connection() as conn:
+        loans = LoanRepository(conn).statuses_for_member(username)
+    return loans, member_fines(username), fetch_member_history(username)
+
+
+def remove_admin(admin_id):
+    with get_db_connection() as conn:
+        AdminRepository(conn).delete(admin_id)
+        conn.commit()
+
+
+class TaskProgress(QObject):
+    changed = pyqtSignal(object)
 
-# Consistent styling
-BUTTON_STYLE = """
-    QPushButton {
-        background-color: #4CAF50;
-        color: white;
-        border-radius: 4px;
-        padding: 8px 16px;
-        font-weight: bold;
-    }
-    QPushButton:hover {
-        background-color: #45a049;
-    }
-    QPushButton:pressed {
-        background-color: #3e8e41;
-    }
-"""
-
-TABLE_STYLE = """
-    QTableWidget {
-        alternate-background-color: #f0f0f0;
-        border: 1px solid #d0d0d0;
-    }
-    QHeaderView::section {
-        background-color: #4CAF50;
-        color: white;
-        padding: 4px;
-        font-weight: bold;
-    }
-"""
-
-def get_db_connection():
-    return mysql.connector.connect(host="localhost", user="root", password="", database="librarydb")
 
 class StyledLineEdit(QLineEdit):
     def __init__(self, placeholder=""):
         super().__init__()
         self.setPlaceholderText(placeholder)
         self.setFixedHeight(40)
-        self.setStyleSheet("""
-            QLineEdit {
-                border: 1px solid #ccc;
-                border-radius: 8px;
-                padding: 0 10px;
-                font-size: 14px;
-            }
-            QLineEdit:focus {
-                border-color: #6c63ff;
-            }
-        """)
+        set_role(self, "adminField")
+
+
 class BookDialog(QDialog):
     def __init__(self, parent=None, book_data=None):
         super().__init__(parent)
@@ -283,7 +529,7 @@ class AdminLogin(QWidget):
 
         # Title
         self.title = QLabel("Admin Login")
-        self.title.setFont(QFont("Arial", 16, QFont.Bold))
+        self.title.setFont(font("form_title"))
         self.title.setAlignment(Qt.AlignCenter)
         form_layout.addWidget(self.title)
 
@@ -334,23 +580,23 @@ class AdminLogin(QWidget):
             QMessageBox.warning(self, "Error", "Please enter credentials.")
             return
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT adminid, password FROM admins WHERE username=%s", (user,))
-        result = cursor.fetchone()
+        self.login_btn.setEnabled(False)
+        self.admin_window.executor.submit("login", authenticate_admin, user, pwd,
+                                          on_result=partial(self.login_finished, user),
+                                          on_error=self.login_failed)
 
-        if result and result[1] and bcrypt.checkpw(pwd.encode(), result[1].encode()):
-            self.admin_window.current_admin_id = result[0]
+    def login_finished(self, user, admin_id):
+        self.login_btn.setEnabled(True)
+        if admin_id is not None:
+            self.admin_window.current_admin_id = admin_id
             self.admin_window.current_admin_username = user
             self.admin_window.show_dashboard()
-            QTimer.singleShot(0, self.admin_window.show_dashboard)
-            print("Login attempt for:", user)
-            print("DB hash:", result[1])
         else:
             QMessageBox.warning(self, "Error", "Invalid admin credentials.")
 
-        cursor.close()
-        conn.close()
+    def login_failed(self, error):
+        self.login_btn.setEnabled(True)
+        QMessageBox.critical(self, "Database Error", f"Login failed: {error}")
 
 
 class AdminDashboard(QWidget):
@@ -370,6 +616,7 @@ class AdminDashboard(QWidget):
             "View Borrowed Books": self.view_borrowed,
             "View Overdue Books": self.view_overdue,
             "View Members": self.view_members,
+            "Loan History": self.view_history,
             "Manage Admins": self.admin_window.manage_admins,
             "Logout": self.admin_window.logout
         }
@@ -382,7 +629,7 @@ class AdminDashboard(QWidget):
             btn = QPushButton(name)
             btn.clicked.connect(method)
             btn.setFixedHeight(40)
-            btn.setStyleSheet(BUTTON_STYLE)
+            set_role(btn, "admin")
             self.sidebar.addWidget(btn)
 
         sidebar_widget = QFrame()
@@ -395,8 +642,12 @@ class AdminDashboard(QWidget):
         # Add header and action buttons area
         self.header_layout = QHBoxLayout()
         self.page_title = QLabel("Dashboard")
-        self.page_title.setFont(QFont("Arial", 16, QFont.Bold))
+        self.page_title.setFont(font("form_title"))
         self.header_layout.addWidget(self.page_title)
+
+        self.status_label = QLabel()
+        set_role(self.status_label, "muted")
+        self.header_layout.addWidget(self.status_label)
         self.header_layout.addStretch()
         
         # Action buttons container
@@ -405,12 +656,38 @@ class AdminDashboard(QWidget):
         
         self.content_area.addLayout(self.header_layout)
         
-        # Add table
-        self.table = QTableWidget()
-        self.table.setStyleSheet(TABLE_STYLE)
-        self.table.setAlternatingRowColors(True)
-        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        # Filter box for the current view
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter...")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.setFixedWidth(220)
+        self.header_layout.insertWidget(self.header_layout.count() - 1, self.filter_edit)
+
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(300)
+        self.filter_timer.timeout.connect(
+            lambda: self.table_model.set_filter(self.filter_edit.text()))
+        self.filter_edit.textChanged.connect(self.filter_timer.start)
+
+        # Add table. Rows come from the server a page at a time as the user
+        # scrolls, and clicking a header re-sorts in SQL.
+        self.executor = admin_window.executor
+        self.recorder = get_recorder()
+        self.view_name = None
+        self.table_model = AdminTableModel(self.executor, fetch=fetch_table_page, parent=self)
+        self.table_model.pageLoaded.connect(self._page_loaded)
+        self.table_model.loadFailed.connect(self._view_failed)
+
+        # Changes from other clients are applied to the open view as they
+        # arrive
+        self.feed = ChangeFeed(self.executor, parent=self)
+        self.feed.eventsArrived.connect(self.apply_events)
+
+        self.table = AdminTableView()
+        self.table.setModel(self.table_model)
+        set_role(self.table, "admin")
+        self.table.setSortingEnabled(True)
         
         self.content_area.addWidget(self.table)
         
@@ -431,212 +708,117 @@ class AdminDashboard(QWidget):
                 widget.setParent(None)
                 widget.deleteLater()
 
-    def display_table(self, data, headers):
-        self.table.setSortingEnabled(False)
-        self.table.clearContents()
-        self.table.setRowCount(len(data))
-        self.table.setColumnCount(len(headers))
-        self.table.setHorizontalHeaderLabels(headers)
-
-        for i, row in enumerate(data):
-            for j, val in enumerate(row):
-                self.table.setItem(i, j, QTableWidgetItem(str(val)))
-
-        self.table.resizeColumnsToContents()
-        self.table.resizeRowsToContents()
-        self.table.setSortingEnabled(True)
-
-    def view_borrowed(self):
-        self.page_title.setText("Borrowed Books")
+    def open_view(self, title, spec, actions=()):
+        # Timed until the first page of rows is in (_page_loaded)
+        if self.view_name is not None:
+            self.recorder.cancel_view(self.view_name)
+        self.view_name = VIEW_NAMES.get(spec, title)
+        self.recorder.start_view(self.view_name)
+        self.page_title.setText(title)
         self.clear_action_buttons()
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, username, id, book_title, due_date, is_claimed FROM borrowed_books")
-        data = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        headers = ["ID", "User", "Book ID", "Book Title", "Due Date", "Claimed", "Actions"]
-        self.table.setSortingEnabled(False)
-        self.table.clearContents()
-        self.table.setRowCount(len(data))
-        self.table.setColumnCount(len(headers))
-        self.table.setHorizontalHeaderLabels(headers)
-
-        
-        for i, row in enumerate(data):
-            for j in range(5):
-                self.table.setItem(i, j, QTableWidgetItem(str(row[j])))
-            
-            # Add claimed status
-            claimed_status = "Yes" if row[5] == 1 else "No"
-            claimed_item = QTableWidgetItem(claimed_status)
-            if row[5] == 1:
-                claimed_item.setForeground(QColor("green"))
-            else:
-                claimed_item.setForeground(QColor("blue"))
-            self.table.setItem(i, 5, claimed_item)
-
-            from functools import partial
-            
-            edit_btn = QPushButton("Edit")
-            edit_btn.setStyleSheet(BUTTON_STYLE)
-            edit_btn.clicked.connect(partial(self.edit_borrowed_book, row))
-            
-            return_btn = QPushButton("Return")
-            return_btn.setStyleSheet(BUTTON_STYLE)
-            return_btn.clicked.connect(partial(self.return_book, row[0]))
-
-            action_widget = QWidget(self.table)
-            action_layout = QHBoxLayout(action_widget)
-            action_layout.setContentsMargins(0, 0, 0, 0)
-            action_layout.addWidget(edit_btn)
-            action_layout.addWidget(return_btn)
-            action_widget.setLayout(action_layout)
 
-            self.table.setCellWidget(i, 6, action_widget)
+        self.filter_timer.stop()
+        self.filter_edit.blockSignals(True)
+        self.filter_edit.clear()
+        self.filter_edit.blockSignals(False)
+        self.filter_edit.setVisible(bool(spec.filter_columns))
+
+        # Show the default order without making the view re-sort
+        header = self.table.horizontalHeader()
+        header.blockSignals(True)
+        header.setSortIndicator(spec.default_sort,
+                                Qt.DescendingOrder if spec.default_descending else Qt.AscendingOrder)
+        header.blockSignals(False)
+
+        self.status_label.setText("Loading...")
+        self.table_model.set_spec(spec, actions)
+
+    def _page_loaded(self, rows, exhausted):
+        self.recorder.finish_view(self.view_name, self, rows)
+        more = "" if exhausted else " (scroll for more)"
+        self.status_label.setText(f"{rows} rows{more}")
+
+    def apply_events(self, events):
+        invalidate_events(events)
+        spec = self.table_model.spec
+        if spec not in VIEW_EVENTS:
+            return
+        kinds, column, field, attribute = VIEW_EVENTS[spec]
+        values = [getattr(event, attribute) for event in events if event.kind in kinds]
+        if None in values:
+            # e.g. an import: too many rows to name one by one
+            self.table_model.reload()
+        elif values:
+            self.table_model.refresh_rows(field, column, list(dict.fromkeys(values)))
+
+    def _view_failed(self, error):
+        self.recorder.cancel_view(self.view_name)
+        self.recorder.record_error(self.view_name, error)
+        self.status_label.clear()
+        QMessageBox.critical(self, "Database Error", f"Error loading data: {error}")
 
-            self.table.resizeColumnsToContents()
-            self.table.resizeRowsToContents()
-            self.table.setSortingEnabled(True)
+    def view_borrowed(self):
+        self.open_view("Borrowed Books", BORROWED_TABLE, [
+            ("Edit", self.edit_borrowed_book),
+            ("Return", lambda row: self.return_book(row[0])),
+        ])
+        self.add_export_button("loans")
 
     
     def edit_borrowed_book(self, data):
         dialog = BorrowedBookDialog(self, data)
-
-
         if dialog.exec_() == QDialog.Accepted:
             borrowed_data = dialog.get_borrowed_data()
-            print(borrowed_data)
-
-            try:
-                with get_db_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                    "UPDATE borrowed_books SET due_date = %s, is_claimed = %s WHERE id = %s",
-                    (borrowed_data['due_date'], borrowed_data['is_claimed'], data[0])
-                    )
-                    conn.commit()
-
-                QMessageBox.information(self, "Success", "Borrowed book updated successfully!")
-                self.view_borrowed()
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to update borrowed book: {e}")
-
-
+            self.executor.submit("edit_loan", update_loan, data[0], data[2], data[1],
+                                 borrowed_data['due_date'], borrowed_data['is_claimed'],
+                                 on_result=self._loan_edited,
+                                 on_error=partial(self._write_failed, "Error", "Failed to update borrowed book"))
 
+    def _loan_edited(self, _):
+        QMessageBox.information(self, "Success", "Borrowed book updated successfully!")
+        self.table_model.reload()
 
+    def _write_failed(self, title, message, error):
+        QMessageBox.critical(self, title, f"{message}: {error}")
 
     def return_book(self, borrow_id):
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
-            # Check if the book is claimed
-            cursor.execute("SELECT is_claimed FROM borrowed_books WHERE id = %s", (borrow_id,))
-            result = cursor.fetchone()
+        # Whether the book was claimed decides if the admin is asked first
+        self.executor.submit("return_book", loan_claimed, borrow_id,
+                             on_result=partial(self._confirm_return, borrow_id),
+                             on_error=partial(self._write_failed, "Error", "Failed to return book"))
+
+    def _confirm_return(self, borrow_id, is_claimed):
+        if is_claimed is None:
+            QMessageBox.warning(self, "Warning", "Borrow record not found.")
+            return
 
-            if not result:
-                QMessageBox.warning(self, "Warning", "Borrow record not found.")
+        # If not claimed, ask for confirmation
+        if not is_claimed:
+            reply = QMessageBox.question(
+                self, "Not Claimed",
+                "This book has not been claimed yet. Are you sure you want to return it?",
+                QMessageBox.Yes | QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
                 return
 
-            is_claimed = result[0]
-
-            # If not claimed, ask for confirmation
-            if not is_claimed:
-                reply = QMessageBox.question(
-                    self, "Not Claimed",
-                    "This book has not been claimed yet. Are you sure you want to return it?",
-                    QMessageBox.Yes | QMessageBox.No
-                )
-                if reply != QMessageBox.Yes:
-                    return
-
-            # Proceed to delete the record
-            cursor.execute("DELETE FROM borrowed_books WHERE id = %s", (borrow_id,))
-            conn.commit()
-            cursor.close()
-            conn.close()
-
-            QMessageBox.information(self, "Success", "Book has been returned successfully!")
-            self.view_borrowed()
-
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to return book: {e}")
-
+        self.executor.submit("return_book", return_loan, borrow_id,
+                             on_result=partial(self._book_returned, "Book has been returned successfully!"),
+                             on_error=partial(self._write_failed, "Error", "Failed to return book"))
 
+    def _book_returned(self, message, book_id):
+        if book_id is None:
+            QMessageBox.warning(self, "Error", "Borrowed record not found.")
+            return
+        QMessageBox.information(self, "Success", message)
+        self.table_model.reload()
 
     def view_overdue(self):
-        self.page_title.setText("Overdue Books")
-        self.clear_action_buttons()
-
-        try:
-            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT id, username, book_id, book_title, due_date FROM borrowed_books WHERE due_date < %s",
-                (now,)
-            )
-            data = cursor.fetchall()
-            cursor.close()
-            conn.close()
-
-            # Define headers for 8 columns
-            headers = ["ID", "User", "Book ID", "Overdue Book", "Due Date", "Days Overdue", "Est. Penalty", "Actions"]
-            self.table.setSortingEnabled(False)
-            self.table.clearContents()
-            self.table.setRowCount(len(data))
-            self.table.setColumnCount(len(headers))  # Set column count to 8
-            self.table.setHorizontalHeaderLabels(headers)
-
-            current_time = datetime.now()
-
-            for i, row in enumerate(data):
-                for j in range(5):  # Loop over the first 6 columns
-                    self.table.setItem(i, j, QTableWidgetItem(str(row[j])))
-
-                # Calculate days overdue
-                due_datetime = datetime.strptime(str(row[4]), "%Y-%m-%d %H:%M:%S")
-                time_overdue = current_time - due_datetime
-                if time_overdue.days > 0:
-                    overdue_display = f"{time_overdue.days}"
-                else:
-                    minutes = int(time_overdue.total_seconds() // 60)
-                    overdue_display = f"{minutes} mins"
-
-
-                self.table.setItem(i, 5, QTableWidgetItem(overdue_display))
-
-
-            # Calculate penalty ($0.50 per day)
-                penalty = max(0.5, time_overdue.total_seconds() / 86400 * 0.5)  # 86400 secs in a day
-                self.table.setItem(i, 6, QTableWidgetItem(f"${penalty:.2f}"))# Column 6 is "Est. Penalty"
-
-                # Add action buttons in the last column (column index 7)
-                edit_btn = QPushButton("Edit")
-                edit_btn.setStyleSheet(BUTTON_STYLE)
-                edit_btn.clicked.connect(partial(self.edit_borrowed_book, row))
-
-                collect_btn = QPushButton("Collect & Return")
-                collect_btn.setStyleSheet(BUTTON_STYLE)
-                collect_btn.clicked.connect(partial(self.collect_and_return, row[0], penalty))
-
-                action_widget = QWidget()
-                action_layout = QHBoxLayout(action_widget)
-                action_layout.setContentsMargins(0, 0, 0, 0)
-                action_layout.addWidget(edit_btn)
-                action_layout.addWidget(collect_btn)
-                action_widget.setLayout(action_layout)
-
-                self.table.setCellWidget(i, 7, action_widget)  # Column 7 for actions
-
-            self.table.resizeColumnsToContents()
-            self.table.resizeRowsToContents()
-            self.table.setSortingEnabled(True)
-        except mysql.connector.Error as e:
-            QMessageBox.critical(self, "Database Error", f"Error displaying overdue books: {e}")
+        self.open_view("Overdue Books", OVERDUE_TABLE, [
+            ("Edit", self.edit_borrowed_book),
+            ("Collect & Return", lambda row: self.collect_and_return(row[0], float(row[6]))),
+        ])
+        self.add_export_button("overdue")
 
 
     def collect_and_return(self, borrow_id, penalty):
@@ -648,137 +830,142 @@ class AdminDashboard(QWidget):
         )
 
         if reply == QMessageBox.Yes:
-            try:
-                conn = get_db_connection()
-                cursor = conn.cursor()
-
-                # Get the correct book_id for updating book availability
-                cursor.execute("SELECT id FROM borrowed_books WHERE id = %s", (borrow_id,))
-                result = cursor.fetchone()
-                if result:
-                    book_id = result[0]
-
-
-                    # Remove borrowed record
-                    cursor.execute("DELETE FROM borrowed_books WHERE id = %s", (borrow_id,))
-
-                    conn.commit()
-
-                    QMessageBox.information(
-                        self,
-                        "Success",
-                        f"Penalty of ${penalty:.2f} collected and book has been returned!"
-                    )
-                    self.view_overdue()
-                else:
-                    QMessageBox.warning(self, "Error", "Borrowed record not found.")
-
-            except Exception as e:
-                QMessageBox.critical(self, "Database Error", f"Error returning book: {e}")
-            finally:
-                cursor.close()
-                conn.close()
+            # Removes the borrowed record and puts the book back on the shelf
+            self.executor.submit(
+                "return_book", return_loan, borrow_id, paid=True,
+                on_result=partial(self._book_returned,
+                                  f"Penalty of ${penalty:.2f} collected and book has been returned!"),
+                on_error=partial(self._write_failed, "Database Error", "Error returning book"))
 
+    def view_history(self):
+        self.open_view("Loan History", HISTORY_TABLE)
+        self.add_export_button("history")
 
     def view_all_books(self):
-        self.page_title.setText("All Books")
-        self.clear_action_buttons()
+        self.open_view("All Books", BOOKS_TABLE, [
+            ("Edit", self.edit_book),
+            ("Delete", lambda row: self.delete_book(row[0])),
+        ])
 
         # Add book button
         add_book_btn = QPushButton("Add Book")
-        add_book_btn.setStyleSheet(BUTTON_STYLE)
+        set_role(add_book_btn, "admin")
         add_book_btn.clicked.connect(self.add_book)
         self.action_buttons.addWidget(add_book_btn)
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Fetch all books
-        cursor.execute("SELECT id, title, author FROM books")
-        books = cursor.fetchall()
-
-        # Fetch borrowed book_ids
-        cursor.execute("SELECT DISTINCT book_id FROM borrowed_books")
-        borrowed_ids = set(row[0] for row in cursor.fetchall())
-
-        cursor.close()
-        conn.close()
-
-        headers = ["ID", "Title", "Author", "Available", "Actions"]
-        self.table.setRowCount(len(books))
-        self.table.setColumnCount(len(headers))
-        self.table.setHorizontalHeaderLabels(headers)
-
-        for i, book in enumerate(books):
-            book_id, title, author = book
-
-            is_available = "No" if book_id in borrowed_ids else "Yes"
-
-            self.table.setItem(i, 0, QTableWidgetItem(str(book_id)))
-            self.table.setItem(i, 1, QTableWidgetItem(title))
-            self.table.setItem(i, 2, QTableWidgetItem(author))
-            self.table.setItem(i, 3, QTableWidgetItem(is_available))
-
-            # Action buttons
-            action_layout = QHBoxLayout()
-            action_layout.setContentsMargins(0, 0, 0, 0)
-            action_layout.setSpacing(5)
-
-            edit_btn = QPushButton("Edit")
-            edit_btn.setStyleSheet(BUTTON_STYLE)
-            edit_btn.clicked.connect(lambda _, data=book: self.edit_book(data))
-
-            delete_btn = QPushButton("Delete")
-            delete_btn.setStyleSheet(BUTTON_STYLE)
-            delete_btn.clicked.connect(lambda _, id=book_id: self.delete_book(id))
-
-            action_layout.addWidget(edit_btn)
-            action_layout.addWidget(delete_btn)
+        import_btn = QPushButton("Import Books")
+        set_role(import_btn, "admin")
+        import_btn.clicked.connect(self.import_books)
+        self.action_buttons.addWidget(import_btn)
+
+    def run_with_progress(self, title, key, fn, *args, describe, on_result, on_error):
+        # Runs fn(*args, progress=..., should_stop=...) on the executor
+        # behind a progress dialog whose Stop button asks it to stop.
+        # describe(*progress_args) turns fn's progress report into
+        # (percent, label text). The task reports from a worker thread; the
+        # signal hands each update to the GUI thread.
+        self.task_stop = threading.Event()
+        self.task_dialog = QProgressDialog(f"{title}...", "Stop", 0, 100, self)
+        self.task_dialog.setWindowTitle(title)
+        self.task_dialog.setWindowModality(Qt.WindowModal)
+        self.task_dialog.setMinimumDuration(0)
+        self.task_dialog.canceled.connect(self.task_stop.set)
+
+        self.task_progress = TaskProgress(self)
+        self.task_progress.changed.connect(self._task_progressed)
+        signal = self.task_progress.changed
+        self.executor.submit(key, fn, *args,
+                             progress=lambda *report: signal.emit(describe(*report)),
+                             should_stop=self.task_stop.is_set,
+                             on_result=on_result, on_error=on_error)
+
+    def _task_progressed(self, update):
+        percent, text = update
+        self.task_dialog.setValue(percent)
+        self.task_dialog.setLabelText(text)
+
+    def import_books(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Import Books", "", "Book lists (*.csv *.jsonl);;All files (*)")
+        if not path:
+            return
 
-            action_widget = QWidget()
-            action_widget.setLayout(action_layout)
-            self.table.setCellWidget(i, 4, action_widget)
+        def describe(stats):
+            return (int(stats["bytes"] * 100 / max(1, stats["total_bytes"])),
+                    f"{stats['rows']:,} rows read, {stats['inserted']:,} new, "
+                    f"{stats['duplicates']:,} already in the catalog")
+
+        self.run_with_progress("Importing books", "import_books", import_books, path, describe=describe,
+                               on_result=self._import_finished, on_error=self._import_failed)
+
+    def _import_finished(self, stats):
+        self.task_dialog.reset()
+        message = (f"{stats['inserted']:,} books added, {stats['duplicates']:,} duplicates "
+                   f"and {stats['invalid']:,} invalid rows skipped.")
+        if stats["stopped"]:
+            message += f"\n\nStopped after row {stats['rows']:,}. Import the same file again to continue."
+        QMessageBox.information(self, "Import Books", message)
+        self.view_all_books()
+
+    def _import_failed(self, error):
+        self.task_dialog.reset()
+        QMessageBox.critical(self, "Import Books",
+                             f"Import failed: {error}\n\nImport the same file again to resume.")
+
+    def export_view(self, report):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export", f"{report}.csv", "CSV (*.csv);;JSON Lines (*.jsonl);;Parquet (*.parquet)")
+        if not path:
+            return
+        try:
+            export_format(path)
+        except ExportError as e:
+            QMessageBox.warning(self, "Export", str(e))
+            return
 
-        self.table.resizeColumnsToContents()
-        self.table.resizeRowsToContents()
+        def describe(rows, total):
+            return int(rows * 100 / max(1, total)), f"{rows:,} of {total:,} rows written"
+
+        # Exports what the view shows, filter included
+        self.run_with_progress("Exporting", "export", export_report,
+                               EXPORT_REPORTS[report], path, self.table_model.filter_text,
+                               describe=describe, on_result=self._export_finished,
+                               on_error=self._export_failed)
+
+    def add_export_button(self, report):
+        export_btn = QPushButton("Export")
+        set_role(export_btn, "admin")
+        export_btn.clicked.connect(lambda: self.export_view(report))
+        self.action_buttons.addWidget(export_btn)
+
+    def _export_finished(self, stats):
+        self.task_dialog.reset()
+        if stats["stopped"]:
+            QMessageBox.information(self, "Export", "Export stopped; no file was written.")
+        else:
+            QMessageBox.information(self, "Export", f"Wrote {stats['rows']:,} rows to {stats['path']}.")
 
+    def _export_failed(self, error):
+        self.task_dialog.reset()
+        QMessageBox.critical(self, "Export", f"Export failed: {error}")
 
     def add_book(self):
         dialog = BookDialog(self)
         if dialog.exec_() == QDialog.Accepted:
             book_data = dialog.get_book_data()
-            
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO books (title, author) VALUES (%s, %s)",
-                (book_data['title'], book_data['author'])
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            QMessageBox.information(self, "Success", "Book added successfully!")
-            self.view_all_books()
-    
+            self.executor.submit("add_book", insert_book, book_data['title'], book_data['author'],
+                                 on_result=partial(self._book_saved, "Book added successfully!"),
+                                 on_error=partial(self._write_failed, "Database Error", "Failed to add book"))
+
     def edit_book(self, book_data):
         dialog = BookDialog(self, book_data)
         if dialog.exec_() == QDialog.Accepted:
             updated_data = dialog.get_book_data()
-            
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE books SET title = %s, author = %s, available = %s WHERE id = %s",
-                (updated_data['title'], updated_data['author'], updated_data['available'], book_data[0])
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            QMessageBox.information(self, "Success", "Book updated successfully!")
-            self.view_all_books()
-    
+            self.executor.submit("edit_book", update_book, book_data[0], updated_data['title'],
+                                 updated_data['author'], updated_data['available'],
+                                 on_result=partial(self._book_saved, "Book updated successfully!"),
+                                 on_error=partial(self._write_failed, "Database Error", "Failed to update book"))
+
     def delete_book(self, id):
         reply = QMessageBox.question(
             self, 
@@ -788,85 +975,37 @@ class AdminDashboard(QWidget):
         )
         
         if reply == QMessageBox.Yes:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Check if book is borrowed
-            cursor.execute("SELECT COUNT(*) FROM borrowed_books WHERE id = %s", (id,))
-            if cursor.fetchone()[0] > 0:
-                QMessageBox.warning(
-                    self, 
-                    "Error", 
-                    "This book is currently borrowed and cannot be deleted!"
-                )
-                cursor.close()
-                conn.close()
-                return
-            
-            cursor.execute("DELETE FROM books WHERE id = %s", (id,))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            QMessageBox.information(self, "Success", "Book deleted successfully!")
-            self.view_all_books()
-            
+            self.executor.submit("delete_book", remove_book, id,
+                                 on_result=self._book_deleted,
+                                 on_error=partial(self._write_failed, "Database Error", "Failed to delete book"))
+
+    def _book_saved(self, message, _):
+        QMessageBox.information(self, "Success", message)
+        self.table_model.reload()
+
+    def _book_deleted(self, deleted):
+        if not deleted:
+            QMessageBox.warning(
+                self, 
+                "Error", 
+                "This book is currently borrowed and cannot be deleted!"
+            )
+            return
+        self._book_saved("Book deleted successfully!", None)
 
     def view_members(self):
-        self.page_title.setText("Library Members")
-        self.clear_action_buttons()
-        
+        self.open_view("Library Members", MEMBERS_TABLE, [
+            ("Edit", self.edit_member),
+            ("Delete", lambda row: self.delete_member(row[0], row[1])),
+            ("View Books", lambda row: self.view_member_books(row[1])),
+        ])
+
         # Add member button
         add_member_btn = QPushButton("Add Member")
-        add_member_btn.setStyleSheet(BUTTON_STYLE)
+        set_role(add_member_btn, "admin")
         add_member_btn.clicked.connect(self.add_member)
         self.action_buttons.addWidget(add_member_btn)
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, username FROM users")
-        data = cursor.fetchall()
-        
-        # For each member, get their borrowed books count
-        for i, row in enumerate(data):
-            cursor.execute("SELECT COUNT(*) FROM borrowed_books WHERE username = %s", (row[1],))
-            borrowed_count = cursor.fetchone()[0]
-            data[i] = data[i] + (borrowed_count,)
-        
-        cursor.close()
-        conn.close()
-        
-        headers = ["ID", "Username", "Books Borrowed", "Actions"]
-        self.table.setRowCount(len(data))
-        self.table.setColumnCount(len(headers))
-        self.table.setHorizontalHeaderLabels(headers)
-        
-        for i, row in enumerate(data):
-            for j in range(3):
-                self.table.setItem(i, j, QTableWidgetItem(str(row[j])))
-            
-            # Add action buttons
-            action_layout = QHBoxLayout()
-            
-            edit_btn = QPushButton("Edit")
-            edit_btn.setStyleSheet(BUTTON_STYLE)
-            edit_btn.clicked.connect(lambda _, idx=i, data=row: self.edit_member(data))
-            
-            delete_btn = QPushButton("Delete")
-            delete_btn.setStyleSheet(BUTTON_STYLE)
-            delete_btn.clicked.connect(lambda _, idx=i, id=row[0], name=row[1]: self.delete_member(id, name))
-            
-            view_books_btn = QPushButton("View Books")
-            view_books_btn.setStyleSheet(BUTTON_STYLE)
-            view_books_btn.clicked.connect(lambda _, username=row[1]: self.view_member_books(username))
-            
-            action_layout.addWidget(edit_btn)
-            action_layout.addWidget(delete_btn)
-            action_layout.addWidget(view_books_btn)
-            
-            action_widget = QWidget()
-            action_widget.setLayout(action_layout)
-            self.table.setCellWidget(i, 3, action_widget)
+        self.add_export_button("members")
     
     def add_member(self):
         dialog = MemberDialog(self)
@@ -877,69 +1016,52 @@ class AdminDashboard(QWidget):
                 QMessageBox.warning(self, "Error", "All fields are required!")
                 return
             
-            hashed_password = bcrypt.hashpw(member_data['password'].encode(), bcrypt.gensalt()).decode()
-            
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            try:
-                cursor.execute(
-                    "INSERT INTO users (username, password) VALUES (%s, %s)",
-                    (member_data['username'], hashed_password)
-                )
-                conn.commit()
-                QMessageBox.information(self, "Success", "Member added successfully!")
-            except mysql.connector.IntegrityError:
-                QMessageBox.warning(self, "Error", "Username already exists!")
-            
-            cursor.close()
-            conn.close()
-            self.view_members()
+            self.executor.submit("add_member", create_account, "users",
+                                 member_data['username'], member_data['password'],
+                                 on_result=self._member_added, on_error=self._member_add_failed)
+
+    def _member_added(self, _):
+        QMessageBox.information(self, "Success", "Member added successfully!")
+        self.view_members()
+
+    def _member_add_failed(self, error):
+        if isinstance(error, mysql.connector.IntegrityError):
+            QMessageBox.warning(self, "Error", "Username already exists!")
+        else:
+            QMessageBox.critical(self, "Database Error", f"Failed to add member: {error}")
+        self.view_members()
     
     def edit_member(self, member_data):
         dialog = MemberDialog(self, member_data)
         if dialog.exec_() == QDialog.Accepted:
             updated_data = dialog.get_member_data()
-            
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            try:
-                cursor.execute(
-                    "UPDATE users SET username = %s WHERE id = %s",
-                    (updated_data['username'], member_data[0])
-                )
-                
-                # Update username in borrowed_books table
-                cursor.execute(
-                    "UPDATE borrowed_books SET username = %s WHERE username = %s",
-                    (updated_data['username'], member_data[1])
-                )
-                conn.commit()
-                QMessageBox.information(self, "Success", "Member updated successfully!")
-            except mysql.connector.IntegrityError:
-                QMessageBox.warning(self, "Error", "Username already exists!")
-            
-            cursor.close()
-            conn.close()
-            self.view_members()
+            self.executor.submit("edit_member", rename_member, member_data[0], member_data[1],
+                                 updated_data['username'],
+                                 on_result=self._member_edited, on_error=self._member_edit_failed)
+
+    def _member_edited(self, _):
+        QMessageBox.information(self, "Success", "Member updated successfully!")
+        self.table_model.reload()
+
+    def _member_edit_failed(self, error):
+        if isinstance(error, mysql.connector.IntegrityError):
+            QMessageBox.warning(self, "Error", "Username already exists!")
+        else:
+            QMessageBox.critical(self, "Database Error", f"Failed to update member: {error}")
     
     def delete_member(self, member_id, username):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if member has borrowed books
-        cursor.execute("SELECT COUNT(*) FROM borrowed_books WHERE username = %s", (username,))
-        borrowed_count = cursor.fetchone()[0]
-        
+        # Members with books out can't be deleted; ask only once that's known
+        self.executor.submit("delete_member", member_loan_count, username,
+                             on_result=partial(self._confirm_member_deletion, member_id, username),
+                             on_error=partial(self._write_failed, "Database Error", "Failed to delete member"))
+
+    def _confirm_member_deletion(self, member_id, username, borrowed_count):
         if borrowed_count > 0:
             QMessageBox.warning(
                 self, 
                 "Error", 
                 f"This member has {borrowed_count} borrowed books and cannot be deleted!"
             )
-            cursor.close()
-            conn.close()
             return
         
         reply = QMessageBox.question(
@@ -950,15 +1072,21 @@ class AdminDashboard(QWidget):
         )
         
         if reply == QMessageBox.Yes:
-            cursor.execute("DELETE FROM users WHERE id = %s", (member_id,))
-            conn.commit()
-            QMessageBox.information(self, "Success", "Member deleted successfully!")
-            
-        cursor.close()
-        conn.close()
-        self.view_members()
+            self.executor.submit("delete_member", remove_member, member_id, username,
+                                 on_result=self._member_deleted,
+                                 on_error=partial(self._write_failed, "Database Error", "Failed to delete member"))
+
+    def _member_deleted(self, _):
+        QMessageBox.information(self, "Success", "Member deleted successfully!")
+        self.table_model.reload()
     
     def view_member_books(self, username):
+        self.executor.submit("member_books", fetch_member_details, username,
+                             on_result=partial(self._show_member_books, username),
+                             on_error=partial(self._write_failed, "Database Error", "Error loading data"))
+
+    def _show_member_books(self, username, details):
+        data, owed, history = details
         dialog = QDialog(self)
         dialog.setWindowTitle(f"Books Borrowed by {username}")
         dialog.resize(600, 400)
@@ -966,38 +1094,26 @@ class AdminDashboard(QWidget):
         layout = QVBoxLayout(dialog)
         
         table = QTableWidget()
-        table.setStyleSheet(TABLE_STYLE)
+        set_role(table, "admin")
         table.setAlternatingRowColors(True)
         table.setEditTriggers(QTableWidget.NoEditTriggers)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT book_title, due_date, is_claimed FROM borrowed_books WHERE username = %s", 
-            (username,)
-        )
-        data = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
         headers = ["Book Title", "Due Date", "Status", "Claimed"]
         table.setColumnCount(len(headers))
         table.setHorizontalHeaderLabels(headers)
         table.setRowCount(len(data))
         
-        today = datetime.today().date()
-        
-        for i, (title, due_date, is_claimed) in enumerate(data):
+        for i, (title, due_date, is_claimed, overdue_secs, days, amount) in enumerate(data):
             table.setItem(i, 0, QTableWidgetItem(title))
             table.setItem(i, 1, QTableWidgetItem(str(due_date)))
             
-            due_date_obj = datetime.strptime(str(due_date), "%Y-%m-%d").date()
             status = "On Time"
-            if due_date_obj < today:
-                status = "Overdue"
-                days_overdue = (today - due_date_obj).days
-                penalty = days_overdue * 0.5
-                status += f" ({days_overdue} days, ${penalty:.2f} penalty)"
+            if overdue_secs > 0:
+                # The ledger's figures, or the same rule for a loan the
+                # scanner hasn't reached yet
+                if days is None:
+                    days, amount = penalty_days(overdue_secs), penalty(overdue_secs)
+                status = f"Overdue ({days} days, ${amount:.2f} penalty)"
             
             status_item = QTableWidgetItem(status)
             if "Overdue" in status:
@@ -1017,9 +1133,27 @@ class AdminDashboard(QWidget):
         
         table.resizeColumnsToContents()
         layout.addWidget(table)
+
+        if owed:
+            owed_label = QLabel(f"Unpaid fines: ${owed:.2f}")
+            owed_label.setObjectName("owedLabel")
+            layout.addWidget(owed_label)
+
+        if history:
+            layout.addWidget(QLabel("Recently returned"))
+            history_table = QTableWidget(len(history), 5)
+            set_role(history_table, "admin")
+            history_table.setAlternatingRowColors(True)
+            history_table.setEditTriggers(QTableWidget.NoEditTriggers)
+            history_table.setHorizontalHeaderLabels(["Book Title", "Borrowed", "Due Date", "Returned", "Fine"])
+            for i, (title, borrowed_at, due_date, returned_at, fine) in enumerate(history):
+                for column, value in enumerate((title, str(borrowed_at), str(due_date), str(returned_at), f"${fine:.2f}")):
+                    history_table.setItem(i, column, QTableWidgetItem(value))
+            history_table.resizeColumnsToContents()
+            layout.addWidget(history_table)
         
         close_btn = QPushButton("Close")
-        close_btn.setStyleSheet(BUTTON_STYLE)
+        set_role(close_btn, "admin")
         close_btn.clicked.connect(dialog.accept)
         layout.addWidget(close_btn, alignment=Qt.AlignRight)
         
@@ -1031,9 +1165,19 @@ class AdminWindow(QMainWindow):
         super().__init__()
         self.setWindowTitle("KnowledgeHub Admin Panel")
         self.setGeometry(300, 150, 1000, 600)
+        apply_theme()
 
         self.current_admin_id = None
         self.current_admin_username = None
+        self.executor = QueryExecutor(self)
+        self.recorder = get_recorder()
+        self.diagnostics = None
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, activated=self.show_diagnostics)
+
+        # Overdue scanner: once at login, then every SCAN_INTERVAL_MS
+        self.scan_timer = QTimer(self)
+        self.scan_timer.setInterval(SCAN_INTERVAL_MS)
+        self.scan_timer.timeout.connect(self.scan_overdue)
 
         self.stack = QStackedWidget()
         self.setCentralWidget(self.stack)
@@ -1054,12 +1198,39 @@ class AdminWindow(QMainWindow):
 
     def show_dashboard(self):
         self.stack.setCurrentWidget(self.dashboard)
+        self.dashboard.feed.start()
+        self.executor.submit("history_partitions", maintain_partitions,
+                             on_error=partial(self.recorder.record_error, "history_partitions"))
+        self.scan_overdue()
+        self.scan_timer.start()
         self.dashboard.view_all_books()  # Default view
 
     def show_login(self):
         self.stack.setCurrentWidget(self.login_screen)
 
+    def show_diagnostics(self):
+        if self.diagnostics is None:
+            self.diagnostics = DiagnosticsPanel(self)
+        self.diagnostics.show()
+        self.diagnostics.raise_()
+
+    def scan_overdue(self):
+        # Skipped while a previous pass is still running
+        if not self.executor.is_busy("overdue_scan"):
+            self.executor.submit("overdue_scan", scan_overdue, on_result=self._scan_finished,
+                                 on_error=partial(self.recorder.record_error, "overdue_scan"))
+
+    def _scan_finished(self, stats):
+        # New figures for the open view, if it shows any
+        if stats["assessed"] or stats["accrued"]:
+            members_changed()
+        if (stats["assessed"] or stats["accrued"]) and self.dashboard.table_model.spec in (OVERDUE_TABLE, MEMBERS_TABLE):
+            self.dashboard.table_model.reload()
+
     def logout(self):
+        self.executor.cancel("table")
+        self.dashboard.feed.stop()
+        self.scan_timer.stop()
         self.current_admin_id = None
         self.current_admin_username = None
         self.show_login()
@@ -1068,16 +1239,15 @@ class AdminWindow(QMainWindow):
         dialog = CredentialDialog()
         if dialog.exec_() == QDialog.Accepted:
             user, pwd = dialog.get_credentials()
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT adminid, password FROM admins WHERE username=%s", (user,))
-            result = cursor.fetchone()
-            if result and result[0] == 2 and bcrypt.checkpw(pwd.encode(), result[1].encode()):
-                self._show_admin_management()
-            else:
-                QMessageBox.warning(self, "Access Denied", "Invalid or unauthorized credentials.")
-            cursor.close()
-            conn.close()
+            self.executor.submit("manage_admins", authenticate_admin, user, pwd,
+                                 on_result=self._super_admin_checked,
+                                 on_error=lambda e: QMessageBox.critical(self, "Database Error", str(e)))
+
+    def _super_admin_checked(self, admin_id):
+        if admin_id == 2:
+            self._show_admin_management()
+        else:
+            QMessageBox.warning(self, "Access Denied", "Invalid or unauthorized credentials.")
     
     def _show_admin_management(self):
         dialog = QDialog(self)
@@ -1088,50 +1258,26 @@ class AdminWindow(QMainWindow):
         
         # Add admin button
         add_admin_btn = QPushButton("Add Admin")
-        add_admin_btn.setStyleSheet(BUTTON_STYLE)
+        set_role(add_admin_btn, "admin")
         add_admin_btn.clicked.connect(lambda: self._add_admin(dialog))
         layout.addWidget(add_admin_btn, alignment=Qt.AlignLeft)
         
         # Admin table
-        table = QTableWidget()
-        table.setStyleSheet(TABLE_STYLE)
-        table.setAlternatingRowColors(True)
-        table.setEditTriggers(QTableWidget.NoEditTriggers)
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT adminid, username FROM admins WHERE adminid != 2")
-        data = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        headers = ["ID", "Username", "Actions"]
-        table.setColumnCount(len(headers))
-        table.setHorizontalHeaderLabels(headers)
-        table.setRowCount(len(data))
-        
-        for i, (admin_id, username) in enumerate(data):
-            table.setItem(i, 0, QTableWidgetItem(str(admin_id)))
-            table.setItem(i, 1, QTableWidgetItem(username))
-            
-            delete_btn = QPushButton("Delete")
-            delete_btn.setStyleSheet(BUTTON_STYLE)
-            delete_btn.clicked.connect(lambda _, id=admin_id: self._delete_admin(id, dialog))
-            
-            btn_layout = QHBoxLayout()
-            btn_layout.addWidget(delete_btn)
-            btn_layout.setContentsMargins(0, 0, 0, 0)
-            
-            btn_widget = QWidget()
-            btn_widget.setLayout(btn_layout)
-            table.setCellWidget(i, 2, btn_widget)
-        
-        table.resizeColumnsToContents()
+        model = AdminTableModel(self.executor, task_key="admins_table", parent=dialog)
+        model.loadFailed.connect(lambda e: QMessageBox.critical(dialog, "Database Error", str(e)))
+        table = AdminTableView()
+        set_role(table, "admin")
+        table.setModel(model)
+        table.horizontalHeader().setSortIndicator(ADMINS_TABLE.default_sort, Qt.AscendingOrder)
+        table.setSortingEnabled(True)
+        model.set_spec(ADMINS_TABLE, [
+            ("Delete", lambda row: self._delete_admin(row[0], dialog)),
+        ])
         layout.addWidget(table)
         
         # Close button
         close_btn = QPushButton("Close")
-        close_btn.setStyleSheet(BUTTON_STYLE)
+        set_role(close_btn, "admin")
         close_btn.clicked.connect(dialog.accept)
         layout.addWidget(close_btn, alignment=Qt.AlignRight)
         
@@ -1141,27 +1287,23 @@ class AdminWindow(QMainWindow):
         dialog = AdminDialog(parent_dialog)
         if dialog.exec_() == QDialog.Accepted:
             admin_data = dialog.get_admin_data()
-            
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            try:
-                hashed = bcrypt.hashpw(admin_data['password'].encode(), bcrypt.gensalt()).decode()
-                cursor.execute(
-                    "INSERT INTO admins (username, password) VALUES (%s, %s)", 
-                    (admin_data['username'], hashed)
-                )
-                conn.commit()
-                QMessageBox.information(parent_dialog, "Success", "Admin added successfully!")
-                
-                # Refresh admin list
-                parent_dialog.close()
-                self._show_admin_management()
-            except mysql.connector.IntegrityError:
-                QMessageBox.warning(parent_dialog, "Error", "Username already exists!")
-            
-            cursor.close()
-            conn.close()
+            self.executor.submit("add_admin", create_account, "admins",
+                                 admin_data['username'], admin_data['password'],
+                                 on_result=lambda _: self._admin_added(parent_dialog),
+                                 on_error=lambda e: self._admin_add_failed(parent_dialog, e))
+
+    def _admin_added(self, parent_dialog):
+        QMessageBox.information(parent_dialog, "Success", "Admin added successfully!")
+
+        # Refresh admin list
+        parent_dialog.close()
+        self._show_admin_management()
+
+    def _admin_add_failed(self, parent_dialog, error):
+        if isinstance(error, mysql.connector.IntegrityError):
+            QMessageBox.warning(parent_dialog, "Error", "Username already exists!")
+        else:
+            QMessageBox.critical(parent_dialog, "Database Error", f"Failed to add admin: {error}")
     
     def _delete_admin(self, admin_id, parent_dialog):
         reply = QMessageBox.question(
@@ -1172,20 +1314,25 @@ class AdminWindow(QMainWindow):
         )
         
         if reply == QMessageBox.Yes:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM admins WHERE adminid = %s", (admin_id,))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            # Refresh admin list
-            parent_dialog.close()
-            self._show_admin_management()
+            self.executor.submit("delete_admin", remove_admin, admin_id,
+                                 on_result=lambda _: self._admin_deleted(parent_dialog),
+                                 on_error=lambda e: QMessageBox.critical(parent_dialog, "Database Error",
+                                                                         f"Failed to delete admin: {e}"))
 
+    def _admin_deleted(self, parent_dialog):
+        # Refresh admin list
+        parent_dialog.close()
+        self._show_admin_management()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    app.aboutToQuit.connect(close_pool)
+
+    try:
+        check_schema()
+    except (SchemaError, mysql.connector.Error) as e:
+        QMessageBox.critical(None, "Database Error", str(e))
+        sys.exit(1)
 
     palette = QPalette()
     palette.setColor(QPalette.Window, QColor("#e0f7fa"))
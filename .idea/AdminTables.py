@@ -0,0 +1,392 @@
+# Server-side paged tables for the admin dashboard. Each view is described by
+# a TableSpec; AdminTableModel fetches it a page at a time with keyset
+# pagination, so opening a view costs the same however big the table is.
+# Row action buttons are painted by ActionDelegate rather than being real
+# widgets, so a row costs nothing beyond its data.
+from functools import partial
+from PyQt5.QtWidgets import QTableView, QStyledItemDelegate, QHeaderView
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QRect, QRectF, QEvent, pyqtSignal
+from PyQt5.QtGui import QColor, QFontMetrics, QPainter, QPainterPath
+from Database import get_db_connection
+from Theme import font
+
+PAGE_SIZE = 100
+
+
+class Column:
+    def __init__(self, header, expr=None, field=None, display=None, color=None, aggregate=False):
+        # expr: SQL expression to ORDER BY (None = not sortable)
+        # field: index into the fetched row holding this column's value
+        # display(row) / color(row): optional formatting for computed columns
+        # aggregate: expr is computed by GROUP BY, so it can only be
+        # compared in HAVING
+        self.header = header
+        self.expr = expr
+        self.field = field
+        self.display = display
+        self.color = color
+        self.aggregate = aggregate
+
+
+class TableSpec:
+    def __init__(self, select, source, columns, key, key_field=0, where=None,
+                 group_by=None, filter_columns=(), default_sort=0, default_descending=False, params=None):
+        self.select = select
+        self.source = source
+        self.columns = columns
+        self.key = key
+        self.key_field = key_field
+        self.where = where
+        self.group_by = group_by
+        self.filter_columns = filter_columns
+        self.default_sort = default_sort
+        self.default_descending = default_descending
+        # params() fills the %s in select and then where, in that order. It
+        # is called at fetch time so e.g. "now" is always current
+        self.params = params or (lambda: ())
+
+
+def base_query(spec, filter_text=""):
+    # SELECT ... FROM ... WHERE ... for the view and its filter, without
+    # grouping or order. Returns (query, conditions, args).
+    conditions, args = [], list(spec.params())
+    if spec.where:
+        conditions.append(spec.where)
+    if filter_text and spec.filter_columns:
+        pattern = "%" + filter_text.replace("%", r"\%").replace("_", r"\_") + "%"
+        conditions.append("(" + " OR ".join(f"{col} LIKE %s" for col in spec.filter_columns) + ")")
+        args += [pattern] * len(spec.filter_columns)
+    return f"SELECT {spec.select} FROM {spec.source}", conditions, args
+
+
+def fetch_page(spec, sort_column=None, descending=False, filter_text="", after=None, limit=PAGE_SIZE):
+    if sort_column is None:
+        sort_column = spec.default_sort
+    sort_expr = spec.columns[sort_column].expr
+    direction = "DESC" if descending else "ASC"
+
+    query, conditions, args = base_query(spec, filter_text)
+
+    # Keyset: continue strictly after the last (sort value, key) we have
+    keyset, keyset_args = None, []
+    if after is not None:
+        op = "<" if descending else ">"
+        keyset = f"({sort_expr} {op} %s OR ({sort_expr} = %s AND {spec.key} {op} %s))"
+        keyset_args = [after[0], after[0], after[1]]
+        if not spec.columns[sort_column].aggregate:
+            conditions.append(keyset)
+            args += keyset_args
+            keyset = None
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if spec.group_by:
+        query += f" GROUP BY {spec.group_by}"
+        if keyset:
+            query += f" HAVING {keyset}"
+            args += keyset_args
+    query += f" ORDER BY {sort_expr} {direction}, {spec.key} {direction} LIMIT %s"
+    args.append(limit)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(query, args)
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return rows
+
+
+def fetch_rows(spec, filter_text, column, values):
+    # The view's rows whose `column` is one of `values`, for applying a
+    # change without reloading
+    query, conditions, args = base_query(spec, filter_text)
+    conditions.append(f"{column} IN ({', '.join(['%s'] * len(values))})")
+    args += values
+    query += " WHERE " + " AND ".join(conditions)
+    if spec.group_by:
+        query += f" GROUP BY {spec.group_by}"
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(query, args)
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return rows
+
+
+def _sort_value(value):
+    # The tables' collation ignores case
+    return value.casefold() if isinstance(value, str) else value
+
+
+class AdminTableModel(QAbstractTableModel):
+    # Emitted after each page: (rows loaded, no more pages)
+    pageLoaded = pyqtSignal(int, bool)
+    loadFailed = pyqtSignal(object)
+
+    def __init__(self, executor=None, page_size=PAGE_SIZE, fetch=fetch_page, task_key="table",
+                 fetch_rows=fetch_rows, parent=None):
+        # fetch and fetch_rows have fetch_page's and fetch_rows' signatures;
+        # task_key names this model's work on the executor so two grids
+        # sharing one don't cancel each other.
+        super().__init__(parent)
+        self.executor = executor
+        self.page_size = page_size
+        self.fetch = fetch
+        self.fetch_rows = fetch_rows
+        self.task_key = task_key
+        self.spec = None
+        self.actions = ()
+        self.sort_column = 0
+        self.descending = False
+        self.filter_text = ""
+        self._rows = []
+        self._exhausted = True
+        self._loading = False
+        self._stale = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.spec is None:
+            return 0
+        return len(self.spec.columns) + (1 if self.actions else 0)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or orientation != Qt.Horizontal or self.spec is None:
+            return super().headerData(section, orientation, role)
+        if section < len(self.spec.columns):
+            return self.spec.columns[section].header
+        return "Actions"
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.column() >= len(self.spec.columns):
+            return None
+        row = self._rows[index.row()]
+        column = self.spec.columns[index.column()]
+        if role == Qt.DisplayRole:
+            if column.display is not None:
+                return column.display(row)
+            return str(row[column.field])
+        if role == Qt.ForegroundRole and column.color is not None:
+            color = column.color(row)
+            return QColor(color) if color else None
+        if role == Qt.UserRole:
+            return row
+        return None
+
+    def row_data(self, row):
+        return self._rows[row]
+
+    def is_action_column(self, column):
+        return bool(self.actions) and self.spec is not None and column == len(self.spec.columns)
+
+    def set_spec(self, spec, actions=()):
+        # actions: (label, callback(row)) pairs for a trailing Actions column
+        self.spec = spec
+        self.actions = actions
+        self.sort_column = spec.default_sort
+        self.descending = spec.default_descending
+        self.filter_text = ""
+        self.reload()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Called by the view when a header is clicked; ORDER BY goes to SQL
+        if self.spec is None or column >= len(self.spec.columns) or self.spec.columns[column].expr is None:
+            return
+        self.sort_column = column
+        self.descending = order == Qt.DescendingOrder
+        self.reload()
+
+    def set_filter(self, text):
+        self.filter_text = text.strip()
+        self.reload()
+
+    def reload(self):
+        if self.executor is not None:
+            self.executor.cancel(self.task_key)
+            self.executor.cancel(self.task_key + "_rows")
+        self.beginResetModel()
+        self._rows = []
+        self._stale = set()
+        self._exhausted = self.spec is None
+        self._loading = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        after = None
+        if self._rows:
+            last = self._rows[-1]
+            after = (last[self.spec.columns[self.sort_column].field], last[self.spec.key_field])
+
+        self._loading = True
+        args = (self.spec, self.sort_column, self.descending, self.filter_text, after, self.page_size)
+        if self.executor is None:
+            self._append_page(self.fetch(*args))
+        else:
+            self.executor.submit(self.task_key, self.fetch, *args,
+                                 on_result=self._append_page, on_error=self._page_failed)
+
+    def _append_page(self, rows):
+        self._loading = False
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        if rows:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+        self.pageLoaded.emit(len(self._rows), self._exhausted)
+
+    def refresh_rows(self, field, column, values):
+        # Re-reads the rows whose row[field] (SQL `column`) is in values and
+        # puts them in place: dropped if gone, updated, or inserted at their
+        # sort position if that falls within the rows loaded so far. Values
+        # waiting on an earlier refresh are read again with these.
+        if self.spec is None:
+            return
+        self._stale.update(values)
+        values = list(self._stale)
+        args = (self.spec, self.filter_text, column, values)
+        on_result = partial(self._apply_rows, self.spec, field, values)
+        if self.executor is None:
+            on_result(self.fetch_rows(*args))
+        else:
+            self.executor.submit(self.task_key + "_rows", self.fetch_rows, *args,
+                                 on_result=on_result, on_error=self._page_failed)
+
+    def _apply_rows(self, spec, field, values, rows):
+        if spec is not self.spec:
+            return
+        self._stale.difference_update(values)
+        values = set(values)
+        for row in reversed(range(len(self._rows))):
+            if self._rows[row][field] in values:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self._rows[row]
+                self.endRemoveRows()
+
+        sort_field = spec.columns[self.sort_column].field
+
+        def sort_key(row):
+            return _sort_value(row[sort_field]), row[spec.key_field]
+
+        for new_row in rows:
+            key = sort_key(new_row)
+            position = next((i for i, row in enumerate(self._rows)
+                             if (sort_key(row) < key if self.descending else sort_key(row) > key)),
+                            len(self._rows))
+            # Past the last loaded row it arrives with a later page
+            if position < len(self._rows) or self._exhausted:
+                self.beginInsertRows(QModelIndex(), position, position)
+                self._rows.insert(position, new_row)
+                self.endInsertRows()
+        self.pageLoaded.emit(len(self._rows), self._exhausted)
+
+    def _page_failed(self, error):
+        self._loading = False
+        self.loadFailed.emit(error)
+
+
+class ActionDelegate(QStyledItemDelegate):
+    # Draws the model's (label, callback) actions as buttons in the Actions
+    # column and calls callback(row) when one is clicked.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.font = font("row_action")
+        self.metrics = QFontMetrics(self.font)
+        self.button_color = QColor("#4CAF50")
+        self.hover_color = QColor("#45a049")
+        self._widths = {}
+
+    def button_rects(self, cell, labels):
+        rects, x = [], cell.x() + 4
+        for label in labels:
+            if label not in self._widths:
+                self._widths[label] = self.metrics.horizontalAdvance(label) + 24
+            rects.append(QRect(x, cell.y() + 4, self._widths[label], cell.height() - 8))
+            x += self._widths[label] + 5
+        return rects
+
+    def paint(self, painter, option, index):
+        model = index.model()
+        if not model.is_action_column(index.column()):
+            return super().paint(painter, option, index)
+
+        labels = [label for label, _ in model.actions]
+        hover_pos = getattr(option.widget, "hover_pos", None)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setFont(self.font)
+        for label, rect in zip(labels, self.button_rects(option.rect, labels)):
+            hovered = hover_pos is not None and rect.contains(hover_pos)
+            path = QPainterPath()
+            path.addRoundedRect(QRectF(rect), 4, 4)
+            painter.fillPath(path, self.hover_color if hovered else self.button_color)
+            painter.setPen(Qt.white)
+            painter.drawText(rect, Qt.AlignCenter, label)
+        painter.restore()
+
+    def action_at(self, model, index, cell, pos):
+        if not index.isValid() or not model.is_action_column(index.column()):
+            return None
+        for action, rect in zip(model.actions, self.button_rects(cell, [label for label, _ in model.actions])):
+            if rect.contains(pos):
+                return action
+        return None
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            action = self.action_at(model, index, option.rect, event.pos())
+            if action is not None:
+                action[1](model.row_data(index.row()))
+                return True
+        return super().editorEvent(event, model, option, index)
+
+
+class AdminTableView(QTableView):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setItemDelegate(ActionDelegate(self))
+        self.setAlternatingRowColors(True)
+        self.setEditTriggers(QTableView.NoEditTriggers)
+        self.setSelectionBehavior(QTableView.SelectRows)
+        self.setMouseTracking(True)
+        self.horizontalHeader().setStretchLastSection(True)
+        self.horizontalHeader().setDefaultSectionSize(140)
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.verticalHeader().setDefaultSectionSize(40)
+        self.hover_pos = None
+        self._hover_index = QModelIndex()
+
+    def mouseMoveEvent(self, event):
+        self.hover_pos = event.pos()
+        index = self.indexAt(event.pos())
+        over_button = self.itemDelegate().action_at(
+            self.model(), index, self.visualRect(index), event.pos()) is not None
+        self.viewport().setCursor(Qt.PointingHandCursor if over_button else Qt.ArrowCursor)
+
+        # Only the cell being left and the cell being entered need repainting
+        if self._hover_index.isValid() and self._hover_index != index:
+            self.viewport().update(self.visualRect(self._hover_index))
+        if index.isValid():
+            self.viewport().update(self.visualRect(index))
+        self._hover_index = index
+        super().mouseMoveEvent(event)
+
+    def leaveEvent(self, event):
+        self.hover_pos = None
+        if self._hover_index.isValid():
+            self.viewport().update(self.visualRect(self._hover_index))
+        self._hover_index = QModelIndex()
+        super().leaveEvent(event)
@@ -0,0 +1,162 @@
+# Book availability for scripts and both apps, replacing the
+# CheckBookAvailability C# tool.
+#
+#   python Availability.py <book_id> [<book_id> ...]
+#
+# With one id it prints "Available" or "Borrowed" exactly as the C# tool
+# did; with several it prints "<id> <status>" per line from one query.
+#
+# Answers come from books.available, the flag the catalog and checkout
+# use, and are cached for AVAILABILITY_TTL seconds. Every write that can
+# change a book's flag records a change feed event naming the book, and
+# Cache.invalidate_event drops that book's answer: on commit for writes in
+# this process, as the feed delivers them for the other app's. The TTL
+# bounds anything that arrives by neither route. An answer is a hint for
+# display and scripts, never a decision: checkout locks the book's row and
+# goes by that.
+import os
+import sys
+import threading
+import time
+from Database import get_db_connection
+
+AVAILABILITY_TTL = float(os.environ.get("LIBRARY_AVAILABILITY_TTL", "5"))
+
+
+MAX_IDS_PER_QUERY = 1000
+
+
+def fetch_borrowed(book_ids):
+    # The ids among book_ids that are off the shelf: one query per
+    # MAX_IDS_PER_QUERY ids. Ids with no book count as available, as they
+    # did for the C# tool.
+    book_ids = list(book_ids)
+    if not book_ids:
+        return set()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        borrowed = set()
+        for start in range(0, len(book_ids), MAX_IDS_PER_QUERY):
+            chunk = book_ids[start:start + MAX_IDS_PER_QUERY]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"SELECT id FROM books WHERE id IN ({placeholders}) AND NOT available", chunk)
+            borrowed.update(row[0] for row in cursor.fetchall())
+        return borrowed
+    finally:
+        cursor.close()
+        conn.close()
+
+
+class AvailabilityCache:
+    def __init__(self, ttl=AVAILABILITY_TTL, fetch=fetch_borrowed):
+        self.ttl = ttl
+        self.fetch = fetch
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "queries": 0}
+
+    def availability(self, book_ids):
+        # {book_id: True if available}. Only ids not cached (or expired)
+        # are looked up, together.
+        book_ids = list(dict.fromkeys(book_ids))
+        now = time.monotonic()
+        result, missing = {}, []
+        with self._lock:
+            for book_id in book_ids:
+                entry = self._entries.get(book_id)
+                if entry is not None and entry[1] > now:
+                    result[book_id] = entry[0]
+                else:
+                    missing.append(book_id)
+            self._stats["hits"] += len(result)
+            self._stats["misses"] += len(missing)
+            generation = self._generation
+
+        if missing:
+            borrowed = self.fetch(missing)
+            expires = time.monotonic() + self.ttl
+            with self._lock:
+                self._stats["queries"] += 1
+                # An invalidation while we were querying may mean our answer
+                # is already old, so it is returned but not cached
+                store = generation == self._generation
+                for book_id in missing:
+                    available = book_id not in borrowed
+                    if store:
+                        self._entries[book_id] = (available, expires)
+                    result[book_id] = available
+        return result
+
+    def is_available(self, book_id):
+        return self.availability([book_id])[book_id]
+
+    def invalidate(self, book_id=None):
+        # book_id None is an event that names no book, e.g. an import, which
+        # only adds books; the answers cached for other books still hold
+        if book_id is None:
+            return
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(book_id, None)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["entries"] = len(self._entries)
+        return snapshot
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_availability():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AvailabilityCache()
+        return _cache
+
+
+def is_available(book_id):
+    return get_availability().is_available(book_id)
+
+
+def availability(book_ids):
+    return get_availability().availability(book_ids)
+
+
+def invalidate(book_id=None):
+    get_availability().invalidate(book_id)
+
+
+def main(argv):
+    # Argument errors exit 0, like the C# tool
+    if not argv:
+        print("Error: No book ID provided.")
+        return 0
+    try:
+        book_ids = [int(arg) for arg in argv]
+    except ValueError:
+        print("Error: Invalid book ID.")
+        return 0
+
+    try:
+        result = availability(book_ids)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if len(book_ids) == 1:
+        print("Available" if result[book_ids[0]] else "Borrowed")
+    else:
+        for book_id in book_ids:
+            print(f"{book_id} {'Available' if result[book_id] else 'Borrowed'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,386 @@
+# Storage backends behind Database.ConnectionPool.
+#
+# The apps are written against MySQL: its SQL, its %s placeholders and
+# mysql.connector's connection and error API. MySQLBackend hands that
+# straight to the server. SQLiteBackend runs the same code on an embedded
+# database file, for a single branch or a laptop with no server: its
+# connections look like mysql.connector's, translate the few MySQL-only
+# constructs the queries use, and raise mysql.connector errors with the
+# MySQL error numbers the callers already check.
+#
+# The file is opened in WAL mode, so the member and admin apps (and the
+# worker threads of each) read while another connection writes. Writers are
+# serialized by SQLite; a SELECT ... FOR UPDATE takes the write lock up
+# front (BEGIN IMMEDIATE), which is what the row lock in checkout_book
+# relies on.
+#
+# GET_LOCK/RELEASE_LOCK, which keep migrations and the overdue scan to one
+# runner at a time, are an OS lock on a file next to the database, one per
+# lock name. Like MySQL's they belong to the connection, exclude every
+# other connection in this process or another, and go away with the
+# connection or the process.
+import math
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import mysql.connector
+from mysql.connector import errors
+
+BUSY_TIMEOUT = 10.0
+LOCK_POLL = 0.05
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(f):
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock(f):
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(f):
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+# MySQL error numbers for the SQLite failures callers handle
+DUPLICATE_KEY = 1062
+NO_REFERENCED_ROW = 1452
+LOCK_WAIT_TIMEOUT = 1205
+
+
+class MySQLBackend:
+    name = "mysql"
+
+    def __init__(self, config):
+        self.config = config
+
+    def connect(self):
+        return mysql.connector.connect(**self.config)
+
+    def create_database(self, name):
+        server_config = {k: v for k, v in self.config.items() if k != "database"}
+        conn = mysql.connector.connect(**server_config)
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{name}`")
+        cursor.close()
+        conn.close()
+
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        return SQLiteConnection(self.path)
+
+    def create_database(self, name):
+        # The file is created by the first connection
+        pass
+
+
+# Values are stored as text. Datetimes are written with milliseconds, the
+# precision of the strftime('%f') defaults in the SQLite schema, so stored
+# and passed-in times compare as strings.
+
+def _format_datetime(value):
+    text = value.strftime("%Y-%m-%d %H:%M:%S")
+    return f"{text}.{value.microsecond // 1000:03d}" if value.microsecond else text
+
+
+def _parse_datetime(value):
+    if isinstance(value, bytes):
+        value = value.decode()
+    return datetime.fromisoformat(value)
+
+
+sqlite3.register_adapter(datetime, _format_datetime)
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_converter("DATETIME", _parse_datetime)
+sqlite3.register_converter("TIMESTAMP", _parse_datetime)
+sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()[:10]))
+
+
+# MySQL functions the queries call
+
+_UNIT_SECONDS = {"SECOND": 1, "MINUTE": 60, "HOUR": 3600, "DAY": 86400}
+
+
+def _timestampdiff(unit, start, end):
+    if start is None or end is None:
+        return None
+    seconds = (_parse_datetime(end) - _parse_datetime(start)).total_seconds()
+    # MySQL truncates toward zero
+    return int(seconds / _UNIT_SECONDS[unit.upper()])
+
+
+def _greatest(*values):
+    return None if any(v is None for v in values) else max(values)
+
+
+def _ceil(value):
+    return None if value is None else math.ceil(value)
+
+
+def _add_days(value, days):
+    if value is None or days is None:
+        return None
+    return _format_datetime(_parse_datetime(value) + timedelta(days=days))
+
+
+def _now():
+    return _format_datetime(datetime.now())
+
+
+# Dialect translation, done once per distinct statement
+
+_TIMESTAMPDIFF_RE = re.compile(r"TIMESTAMPDIFF\(\s*(SECOND|MINUTE|HOUR|DAY)\s*,", re.IGNORECASE)
+_IF_RE = re.compile(r"\bIF\(", re.IGNORECASE)
+_FOR_UPDATE_RE = re.compile(r"\s+FOR\s+UPDATE\s*$", re.IGNORECASE)
+_LIKE_RE = re.compile(r"\bLIKE\s+\?", re.IGNORECASE)
+_ON_DUPLICATE_RE = re.compile(r"ON\s+DUPLICATE\s+KEY\s+UPDATE", re.IGNORECASE)
+_VALUES_RE = re.compile(r"(?:\w+\.)?(\w+)\s*=\s*VALUES\((\w+)\)", re.IGNORECASE)
+_INTERVAL_RE = re.compile(r"([\w.]+(?:\(\))?)\s*([+-])\s*INTERVAL\s+", re.IGNORECASE)
+_DAY_RE = re.compile(r"\s+DAY\b", re.IGNORECASE)
+# A string literal, which is left alone, or a division
+_DIVIDE_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|/")
+
+
+def _real_division(match):
+    # MySQL's / always gives a decimal; SQLite's truncates two integers
+    return " * 1.0 /" if match.group(0) == "/" else match.group(0)
+
+
+def _rewrite_intervals(sql):
+    # "x + INTERVAL <expr> DAY" -> "ADD_DAYS(x, +(<expr>))". <expr> may hold
+    # parentheses, so the DAY that ends it is the first one at depth 0.
+    while True:
+        match = _INTERVAL_RE.search(sql)
+        if not match:
+            return sql
+        depth = 0
+        end = None
+        for i in range(match.end(), len(sql)):
+            if sql[i] == "(":
+                depth += 1
+            elif sql[i] == ")":
+                depth -= 1
+            elif depth == 0 and sql[i].isspace():
+                end = _DAY_RE.match(sql, i)
+                if end:
+                    break
+        if end is None:
+            raise errors.ProgrammingError(msg="Only INTERVAL ... DAY is supported on SQLite")
+        amount = sql[match.end():end.start()]
+        sql = (sql[:match.start()] + f"ADD_DAYS({match.group(1)}, {match.group(2)}({amount}))"
+               + sql[end.end():])
+
+
+_translated = {}
+
+
+def translate(operation, has_params):
+    # Returns (sql, locks): locks is True for SELECT ... FOR UPDATE
+    key = (operation, has_params)
+    cached = _translated.get(key)
+    if cached is not None:
+        return cached
+    sql = operation
+    if has_params:
+        sql = sql.replace("%s", "?").replace("%%", "%")
+    locks = bool(_FOR_UPDATE_RE.search(sql))
+    sql = _FOR_UPDATE_RE.sub("", sql)
+    sql = _TIMESTAMPDIFF_RE.sub(lambda m: f"TIMESTAMPDIFF('{m.group(1).upper()}',", sql)
+    sql = _IF_RE.sub("iif(", sql)
+    sql = _DIVIDE_RE.sub(_real_division, sql)
+    # MySQL's LIKE escapes with a backslash by default
+    sql = _LIKE_RE.sub(r"LIKE ? ESCAPE '\\'", sql)
+    if _ON_DUPLICATE_RE.search(sql):
+        sql = _ON_DUPLICATE_RE.sub("ON CONFLICT DO UPDATE SET", sql)
+        sql = _VALUES_RE.sub(r"\1 = excluded.\2", sql)
+    sql = _rewrite_intervals(sql)
+    _translated[key] = (sql, locks)
+    return sql, locks
+
+
+def _mysql_error(e):
+    message = str(e)
+    if isinstance(e, sqlite3.IntegrityError):
+        # NOT NULL and CHECK failures have no errno callers look for
+        errno = None
+        if "FOREIGN KEY" in message:
+            errno = NO_REFERENCED_ROW
+        elif "UNIQUE constraint failed" in message:
+            errno = DUPLICATE_KEY
+        return errors.IntegrityError(msg=message, errno=errno)
+    if isinstance(e, sqlite3.OperationalError) and ("locked" in message or "busy" in message):
+        return errors.DatabaseError(msg=message, errno=LOCK_WAIT_TIMEOUT)
+    if isinstance(e, sqlite3.OperationalError):
+        return errors.ProgrammingError(msg=message)
+    return errors.DatabaseError(msg=message)
+
+
+class SQLiteCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursor = conn._conn.cursor()
+
+    def execute(self, operation, params=None):
+        sql, locks = translate(operation, bool(params))
+        try:
+            if locks and not self._conn.in_transaction:
+                self._cursor.execute("BEGIN IMMEDIATE")
+            self._cursor.execute(sql, tuple(params or ()))
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def executemany(self, operation, seq_params):
+        sql, _ = translate(operation, True)
+        try:
+            self._cursor.executemany(sql, [tuple(params) for params in seq_params])
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+_LOCK_NAME_RE = re.compile(r"[^\w.-]")
+
+
+class _AdvisoryLocks:
+    # The named locks one connection holds: {name: [lock file, count]}.
+    # Locks are re-entrant, as in MySQL 5.7+.
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._held = {}
+
+    def _path(self, name):
+        return f"{self.db_path}.{_LOCK_NAME_RE.sub('_', str(name))}.lock"
+
+    def get(self, name, timeout):
+        # 1 once held, 0 if still taken after timeout seconds (negative:
+        # wait for ever)
+        held = self._held.get(name)
+        if held is not None:
+            held[1] += 1
+            return 1
+        f = open(self._path(name), "a+b")
+        deadline = time.monotonic() + max(0.0, float(timeout))
+        while not _try_lock(f):
+            if timeout >= 0 and time.monotonic() >= deadline:
+                f.close()
+                return 0
+            time.sleep(LOCK_POLL)
+        self._held[name] = [f, 1]
+        return 1
+
+    def release(self, name):
+        # 1 if released, None if this connection didn't hold it
+        held = self._held.get(name)
+        if held is None:
+            return None
+        held[1] -= 1
+        if not held[1]:
+            del self._held[name]
+            _unlock(held[0])
+            held[0].close()
+        return 1
+
+    def release_all(self):
+        for f, _ in self._held.values():
+            _unlock(f)
+            f.close()
+        self._held.clear()
+
+
+class SQLiteConnection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.create_function("TIMESTAMPDIFF", 3, _timestampdiff, deterministic=True)
+        self._conn.create_function("GREATEST", -1, _greatest, deterministic=True)
+        self._conn.create_function("CEIL", 1, _ceil, deterministic=True)
+        self._conn.create_function("ADD_DAYS", 2, _add_days, deterministic=True)
+        self._conn.create_function("NOW", 0, _now)
+        self._locks = _AdvisoryLocks(path)
+        self._conn.create_function("GET_LOCK", 2, self._locks.get)
+        self._conn.create_function("RELEASE_LOCK", 1, self._locks.release)
+        self._conn.create_function("DATABASE", 0, lambda: "main")
+        self._closed = False
+
+    def cursor(self, *args, **kwargs):
+        # buffered/prepared make no difference here
+        return SQLiteCursor(self)
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def start_transaction(self):
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN")
+
+    def commit(self):
+        # Deferred foreign keys are checked here
+        try:
+            self._conn.commit()
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def is_connected(self):
+        return not self._closed
+
+    def close(self):
+        self._closed = True
+        self._locks.release_all()
+        self._conn.close()
@@ -0,0 +1,196 @@
+# Bulk import of books from CSV or JSON Lines.
+#
+#   python BookImport.py <file.csv|file.jsonl> [--batch N] [--restart]
+#
+# The file is read a line at a time and written in batches, one transaction
+# per batch. Books already in the catalog (same title and author) are
+# skipped, so re-running an import never duplicates anything. After each
+# batch the number of rows done is saved next to the file (<file>.progress),
+# and a later run resumes from there.
+import csv
+import json
+import os
+import sys
+import time
+from Database import get_db_connection
+from ChangeFeed import record_event, BOOKS_IMPORTED
+from Cache import books_changed
+
+BATCH_SIZE = 1000
+
+
+def _counted_lines(f, counter):
+    for line in f:
+        counter[0] += len(line.encode("utf-8"))
+        yield line
+
+
+def read_books(f, fmt, counter):
+    # Yields (title, author) or None for a row that has neither
+    if fmt == "jsonl":
+        for line in _counted_lines(f, counter):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield None
+                continue
+            yield _clean(record.get("title"), record.get("author"))
+    else:
+        for record in csv.DictReader(_counted_lines(f, counter)):
+            yield _clean(record.get("title"), record.get("author"))
+
+
+def _clean(title, author):
+    title = str(title or "").strip()[:255]
+    author = str(author or "").strip()[:255]
+    if not title or not author:
+        return None
+    return title, author
+
+
+def file_format(path):
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def checkpoint_path(path):
+    return path + ".progress"
+
+
+def load_checkpoint(path):
+    try:
+        with open(checkpoint_path(path)) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def save_checkpoint(path, rows_done):
+    tmp = checkpoint_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(str(rows_done))
+    os.replace(tmp, checkpoint_path(path))
+
+
+def _key(title, author):
+    # The catalog's collation ignores case, so duplicates do too
+    return title.casefold(), author.casefold()
+
+
+def insert_batch(conn, batch, seen):
+    # Inserts the books in `batch` that aren't in the catalog yet and
+    # returns how many were inserted
+    fresh = []
+    for title, author in batch:
+        key = _key(title, author)
+        if key not in seen:
+            seen.add(key)
+            fresh.append((title, author))
+    if not fresh:
+        return 0
+
+    cursor = conn.cursor()
+    try:
+        placeholders = ", ".join(["(%s, %s)"] * len(fresh))
+        cursor.execute(
+            f"SELECT title, author FROM books WHERE (title, author) IN ({placeholders})",
+            [value for pair in fresh for value in pair])
+        existing = {_key(title, author) for title, author in cursor.fetchall()}
+        rows = [pair for pair in fresh if _key(*pair) not in existing]
+        if rows:
+            cursor.executemany("INSERT INTO books (title, author) VALUES (%s, %s)", rows)
+            record_event(cursor, BOOKS_IMPORTED)
+            conn.after_commit(books_changed)
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def import_books(path, batch_size=BATCH_SIZE, resume=True, progress=None, should_stop=None):
+    # progress(stats) is called after each batch; should_stop() is checked
+    # between batches. Returns the stats dict.
+    skip = load_checkpoint(path) if resume else 0
+    total_bytes = os.path.getsize(path)
+    counter = [0]
+    stats = {"rows": skip, "inserted": 0, "duplicates": 0, "invalid": 0,
+             "resumed_from": skip, "bytes": 0, "total_bytes": total_bytes,
+             "elapsed": 0.0, "stopped": False}
+    seen = set()
+    batch = []
+    start = time.perf_counter()
+
+    def flush():
+        inserted = insert_batch(conn, batch, seen)
+        stats["inserted"] += inserted
+        stats["duplicates"] += len(batch) - inserted
+        stats["rows"] = row_number
+        stats["bytes"] = counter[0]
+        stats["elapsed"] = time.perf_counter() - start
+        save_checkpoint(path, row_number)
+        batch.clear()
+        if progress is not None:
+            progress(dict(stats))
+
+    conn = get_db_connection()
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            row_number = 0
+            for book in read_books(f, file_format(path), counter):
+                row_number += 1
+                if row_number <= skip:
+                    continue
+                if book is None:
+                    stats["invalid"] += 1
+                    continue
+                batch.append(book)
+                if len(batch) >= batch_size:
+                    flush()
+                    if should_stop is not None and should_stop():
+                        stats["stopped"] = True
+                        return stats
+            flush()
+    finally:
+        conn.close()
+
+    # Finished: the next import of this file starts from the top
+    try:
+        os.remove(checkpoint_path(path))
+    except OSError:
+        pass
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def main(argv):
+    if not argv:
+        print("usage: python BookImport.py <file.csv|file.jsonl> [--batch N] [--restart]")
+        return 1
+    path = argv[0]
+    batch_size = int(argv[argv.index("--batch") + 1]) if "--batch" in argv else BATCH_SIZE
+
+    def report(stats):
+        percent = stats["bytes"] * 100 / max(1, stats["total_bytes"])
+        rate = (stats["rows"] - stats["resumed_from"]) / max(stats["elapsed"], 1e-9)
+        print(f"\r{percent:5.1f}%  {stats['rows']} rows  {stats['inserted']} new  "
+              f"{stats['duplicates']} duplicates  {rate:,.0f} rows/sec", end="", flush=True)
+
+    try:
+        stats = import_books(path, batch_size, resume="--restart" not in argv, progress=report)
+    except KeyboardInterrupt:
+        print(f"\ninterrupted; run again to resume from row {load_checkpoint(path)}")
+        return 1
+    print()
+    if stats["resumed_from"]:
+        print(f"resumed from row {stats['resumed_from']}")
+    print(f"inserted {stats['inserted']}, skipped {stats['duplicates']} duplicates "
+          f"and {stats['invalid']} invalid rows in {stats['elapsed']:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,208 @@
+# Read-through caches for data both apps re-read on every navigation: the
+# member catalog, the admin's book and member tables, and each member's
+# loans. Each cache is an LRU bounded by entry count, and every entry also
+# expires after CACHE_TTL seconds.
+#
+# Entries are dropped by the writes that change them, not by time.
+# Repository write methods queue invalidate_event() for each change feed
+# event they record, and it runs when the connection commits
+# (PooledConnection.after_commit), so no reader can refill an entry from
+# before the write. Writes made by the other app arrive on the change feed
+# and go through apply_events(); the TTL bounds anything that arrives by
+# neither route.
+import os
+import threading
+import time
+from collections import OrderedDict
+from ChangeFeed import (
+    BOOK_EVENTS, LOAN_EVENTS, MEMBER_EVENTS, MEMBER_EDITED, MEMBER_DELETED,
+)
+from Availability import invalidate as invalidate_availability
+
+CACHE_TTL = float(os.environ.get("LIBRARY_CACHE_TTL", "60"))
+CACHE_SIZE = int(os.environ.get("LIBRARY_CACHE_SIZE", "256"))
+
+# Cache names. CATALOG keys:
+#   ("first", limit)          -> (change marker, first page), read together
+#   ("page", after_id, limit) -> a page of available books after after_id
+#   ("search", term, limit)   -> search results
+#   ("changes", marker, limit) -> an empty change set for marker
+CATALOG = "catalog"
+BOOK_TABLE = "book_table"
+MEMBER_TABLE = "member_table"
+MEMBER_LOANS = "member_loans"
+# (book id, title) -> cover QPixmap, filled by Covers.CoverStore
+COVERS = "covers"
+
+
+class LRUCache:
+    def __init__(self, name, max_entries=CACHE_SIZE, ttl=CACHE_TTL):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0,
+                       "invalidations": 0, "discarded": 0}
+
+    def _fresh(self, key, now):
+        # The live entry for key, or None; drops it if expired
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= now:
+            del self._entries[key]
+            self._stats["expirations"] += 1
+            return None
+        return entry
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._fresh(key, time.monotonic()) is not None
+
+    def get(self, key, load):
+        # The cached value for key, or load()'s, which is then cached
+        with self._lock:
+            entry = self._fresh(key, time.monotonic())
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+            self._stats["misses"] += 1
+            generation = self._generation
+
+        value = load()
+        with self._lock:
+            # An invalidation while we were loading may mean our value is
+            # already old, so it is returned but not cached
+            if generation != self._generation:
+                self._stats["discarded"] += 1
+                return value
+            self._store(key, value)
+        return value
+
+    def peek(self, key):
+        # The cached value for key or None, for callers that load in the
+        # background and fill the entry with put()
+        with self._lock:
+            entry = self._fresh(key, time.monotonic())
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def invalidate_where(self, predicate):
+        # Drops the entries for which predicate(key, value) is true
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, (value, _) in self._entries.items() if predicate(key, value)]
+            for key in stale:
+                del self._entries[key]
+            self._stats["invalidations"] += len(stale)
+
+    def clear(self):
+        self.invalidate_where(lambda key, value: True)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["entries"] = len(self._entries)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+        return snapshot
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, max_entries=CACHE_SIZE, ttl=CACHE_TTL):
+    # The size and TTL only apply when the cache is first asked for
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = LRUCache(name, max_entries, ttl)
+        return cache
+
+
+def cache_stats():
+    # {cache name: {hits, misses, hit_rate, entries, ...}}
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.stats() for cache in caches}
+
+
+def clear_caches():
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.clear()
+
+
+def is_catalog_page(key):
+    return key[0] in ("first", "page")
+
+
+def page_covers(key, value, book_id):
+    # Whether a catalog page entry holds, or would now hold, book_id: its id
+    # range runs from after its after_id to its last row, or on for ever if
+    # it is the last page
+    if key[0] == "first":
+        after_id, limit, rows = 0, key[1], value[1]
+    else:
+        after_id, limit, rows = key[1], key[2], value
+    return book_id > after_id and (len(rows) < limit or book_id <= rows[-1][0])
+
+
+def books_changed(book_id=None):
+    # book_id None: any number of books, e.g. an import
+    def stale(key, value):
+        if not is_catalog_page(key):
+            # Searches and change sets can't tell which books they would see
+            return True
+        return book_id is None or page_covers(key, value, book_id)
+
+    get_cache(CATALOG).invalidate_where(stale)
+    get_cache(BOOK_TABLE).clear()
+
+
+def members_changed():
+    get_cache(MEMBER_TABLE).clear()
+
+
+def loans_changed(username):
+    get_cache(MEMBER_LOANS).invalidate(username)
+
+
+def invalidate_event(kind, book_id=None, loan_id=None, username=None):
+    # Drops what a change feed event makes stale
+    if kind in BOOK_EVENTS:
+        books_changed(book_id)
+        invalidate_availability(book_id)
+    if kind in MEMBER_EVENTS:
+        members_changed()
+    if kind in LOAN_EVENTS or kind in (MEMBER_EDITED, MEMBER_DELETED):
+        loans_changed(username)
+
+
+def apply_events(events):
+    for event in events:
+        invalidate_event(event.kind, event.book_id, event.loan_id, event.username)
@@ -0,0 +1,373 @@
+# Model/view catalog for the member app: books are fetched a page at a time
+# and cards are painted by a delegate, so only the visible ones cost anything.
+# Once loaded, the model is kept up to date with deltas: changed books are
+# read by their change marker and inserted, updated or removed in place.
+#
+# A change marker is stamped when a statement runs, not when its
+# transaction commits, so a change can become visible behind a marker that
+# has already moved past it. Each sync therefore starts a window behind the
+# marker (rewind). The catalog is reloaded outright instead when that
+# window holds more changes than one read, and when going back to it once
+# the last full load is RELOAD_AFTER seconds old, which bounds anything the
+# window misses.
+import time
+from bisect import bisect_left
+from functools import partial
+from PyQt5.QtWidgets import QListView, QStyledItemDelegate
+from PyQt5.QtGui import QColor, QPen, QPainter, QPainterPath
+from PyQt5.QtCore import (
+    Qt, QAbstractListModel, QModelIndex, QRect, QRectF, QSize, QEvent, pyqtSignal
+)
+from Instrumentation import get_recorder
+from Theme import font, ACCENT, ACCENT_DARK, CLAIMED
+from Covers import CoverStore, cover_color, cover_path
+
+BookIdRole = Qt.UserRole + 1
+AuthorRole = Qt.UserRole + 2
+
+PAGE_SIZE = 200
+SEARCH_LIMIT = 50
+SYNC_LIMIT = 500
+RELOAD_AFTER = 600
+CARD_WIDTH = 200
+CARD_HEIGHT = 270
+COVER_HEIGHT = 100
+
+
+class BookListModel(QAbstractListModel):
+    # Emitted after every page: (rows in model, no more pages)
+    pageLoaded = pyqtSignal(int, bool)
+
+    def __init__(self, fetch_page, executor=None, page_size=PAGE_SIZE, search=None,
+                 search_limit=SEARCH_LIMIT, fetch_changes=None, fetch_first=None, rewind=None,
+                 reload_after=RELOAD_AFTER, parent=None):
+        # fetch_page(after_id, limit) returns [(id, title, author), ...]
+        # ordered by id; search(term, limit) returns the best matches for a
+        # search term. fetch_changes(marker, limit) returns
+        # (rows, new_marker) with rows (id, title, author, available) for the
+        # books changed after marker; with marker None it returns ([], the
+        # current marker). fetch_first(limit), if given, returns (current
+        # marker, first page) in one call. rewind(marker), if given, returns
+        # the marker a sync starts from. With an executor all run off the
+        # GUI thread.
+        super().__init__(parent)
+        self.fetch_page = fetch_page
+        self.executor = executor
+        self.page_size = page_size
+        self.search = search
+        self.search_limit = search_limit
+        self.fetch_changes = fetch_changes
+        self.fetch_first = fetch_first
+        self.rewind = rewind
+        self.reload_after = reload_after
+        self.search_term = ""
+        self.marker = None
+        self._loaded_at = None
+        self._rows = []
+        self._exhausted = False
+        self._loading = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        book_id, title, author = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return title
+        if role == AuthorRole:
+            return author
+        if role == BookIdRole:
+            return book_id
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._loading = True
+        on_result = self._append_page
+        if self.search_term:
+            # Search results are a single ranked top-N page
+            fn, args = self.search, (self.search_term, self.search_limit)
+        elif not self._rows and self.fetch_changes is not None:
+            # The marker is read before the first page so that no change
+            # can fall between the two
+            fn, args = self._first_page, (self.page_size,)
+            on_result = self._first_page_loaded
+        else:
+            after_id = self._rows[-1][0] if self._rows else 0
+            fn, args = self.fetch_page, (after_id, self.page_size)
+
+        if self.executor is None:
+            on_result(fn(*args))
+        else:
+            self.executor.submit("catalog_page", fn, *args,
+                                 on_result=on_result, on_error=self._page_failed)
+
+    def _first_page(self, limit):
+        if self.fetch_first is not None:
+            return self.fetch_first(limit)
+        marker = self.fetch_changes(None, 0)[1]
+        return marker, self.fetch_page(0, limit)
+
+    def _first_page_loaded(self, result):
+        self.marker, rows = result
+        self._loaded_at = time.monotonic()
+        self._append_page(rows)
+
+    def _append_page(self, rows):
+        self._loading = False
+        if self.search_term or len(rows) < self.page_size:
+            self._exhausted = True
+        if rows:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+        self.pageLoaded.emit(len(self._rows), self._exhausted)
+
+    def _page_failed(self, error):
+        self._loading = False
+        get_recorder().record_error("catalog_page", error)
+
+    def reload(self):
+        if self.executor is not None:
+            self.executor.cancel("catalog_page")
+            self.executor.cancel("catalog_sync")
+        self.beginResetModel()
+        self._rows = []
+        self._exhausted = False
+        self._loading = False
+        self.marker = None
+        self.endResetModel()
+        self.fetchMore()
+
+    def refresh(self):
+        # Back to the full catalog: a delta if it was loaded recently,
+        # otherwise a fresh load
+        stale = self._loaded_at is None or time.monotonic() - self._loaded_at > self.reload_after
+        if self.search_term or self.marker is None or stale:
+            self.set_search("")
+        else:
+            self.sync()
+            self.pageLoaded.emit(len(self._rows), self._exhausted)
+
+    def _find(self, book_id):
+        # Row of book_id, or None. The browse list is ordered by id; search
+        # results are ranked, so they are scanned.
+        if self.search_term:
+            for row, book in enumerate(self._rows):
+                if book[0] == book_id:
+                    return row
+            return None
+        row = bisect_left(self._rows, book_id, key=lambda book: book[0])
+        return row if row < len(self._rows) and self._rows[row][0] == book_id else None
+
+    def remove_book(self, book_id):
+        row = self._find(book_id)
+        if row is not None:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._rows[row]
+            self.endRemoveRows()
+
+    def apply_changes(self, changes):
+        # Applying the same change twice is harmless, so overlapping syncs
+        # need no coordination
+        for book_id, title, author, available in changes:
+            row = self._find(book_id)
+            if not available:
+                self.remove_book(book_id)
+            elif row is not None:
+                self._rows[row] = (book_id, title, author)
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+            elif not self.search_term and (self._exhausted or (self._rows and book_id < self._rows[-1][0])):
+                # Only inside the loaded range; later ids arrive with their page
+                row = bisect_left(self._rows, book_id, key=lambda book: book[0])
+                self.beginInsertRows(QModelIndex(), row, row)
+                self._rows.insert(row, (book_id, title, author))
+                self.endInsertRows()
+
+    def sync(self):
+        # Pull the books changed since (a window behind) the marker and
+        # apply them
+        if self.fetch_changes is None or self.marker is None:
+            return
+        if self.rewind is None:
+            self._fetch_changes(self.marker)
+        else:
+            self._fetch_changes(self.rewind(self.marker), rewound=True)
+
+    def _fetch_changes(self, since, rewound=False):
+        on_result = partial(self._changes_loaded, rewound)
+        if self.executor is None:
+            on_result(self.fetch_changes(since, SYNC_LIMIT))
+        else:
+            self.executor.submit("catalog_sync", self.fetch_changes, since, SYNC_LIMIT,
+                                 on_result=on_result, on_error=self._page_failed)
+
+    def _changes_loaded(self, rewound, result):
+        changes, marker = result
+        if self.marker is None:
+            # Reloaded meanwhile; the new load has its own marker
+            return
+        if rewound and len(changes) == SYNC_LIMIT:
+            # More changes around the marker than one read holds, e.g. an
+            # import: one page of a reload is cheaper than paging them all
+            self.reload()
+            return
+        self.apply_changes(changes)
+        # A rewound read can end behind the marker; it never moves back
+        self.marker = max(self.marker, marker)
+        if len(changes) == SYNC_LIMIT:
+            # The next page follows this one, not the marker
+            self._fetch_changes(marker)
+
+    def set_search(self, term):
+        term = term.strip()
+        if self.search is None:
+            term = ""
+        self.search_term = term
+        self.reload()
+
+
+class BookCardDelegate(QStyledItemDelegate):
+    borrowClicked = pyqtSignal(int, str)
+    # A cover finished loading; views repaint (see CatalogView)
+    coverReady = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.covers = CoverStore(CARD_WIDTH, COVER_HEIGHT, parent=self)
+        self.covers.coverReady.connect(self.coverReady)
+        # Fonts (shared with the rest of the app, see Theme) and colours
+        # are built once and reused for every card
+        self.title_font = font("tile_title")
+        self.author_font = font("tile_author")
+        self.status_font = font("tile_label")
+        self.button_font = font("tile_label")
+        self.border_pen = QPen(QColor("#e0e0e0"))
+        self.card_brush = QColor("#ffffff")
+        self.author_color = QColor("#666666")
+        self.status_color = QColor(CLAIMED)
+        self.button_color = QColor(ACCENT)
+        self.button_hover_color = QColor(ACCENT_DARK)
+        self.cover_shape = cover_path(QRect(0, 0, CARD_WIDTH, COVER_HEIGHT))
+
+    def sizeHint(self, option, index):
+        return QSize(CARD_WIDTH, CARD_HEIGHT)
+
+    def card_rect(self, item_rect):
+        return QRect(item_rect.x(), item_rect.y(), CARD_WIDTH, CARD_HEIGHT)
+
+    def button_rect(self, item_rect):
+        card = self.card_rect(item_rect)
+        return QRect(card.x() + 10, card.bottom() - 40, card.width() - 20, 30)
+
+    def paint(self, painter, option, index):
+        book_id = index.data(BookIdRole)
+        title = index.data(Qt.DisplayRole)
+        author = index.data(AuthorRole)
+        card = self.card_rect(option.rect)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        # Card background
+        path = QPainterPath()
+        path.addRoundedRect(QRectF(card).adjusted(0.5, 0.5, -0.5, -0.5), 8, 8)
+        painter.setPen(self.border_pen)
+        painter.fillPath(path, self.card_brush)
+        painter.drawPath(path)
+
+        # Book cover, or its colour until the cover is ready
+        cover = QRect(card.x(), card.y(), card.width(), COVER_HEIGHT)
+        pixmap = self.covers.pixmap(book_id, title)
+        if pixmap is not None:
+            painter.drawPixmap(cover.topLeft(), pixmap)
+        else:
+            painter.fillPath(self.cover_shape.translated(cover.x(), cover.y()), cover_color(title))
+        painter.setPen(Qt.black)
+
+        # Info area
+        text_rect = QRect(card.x() + 10, cover.bottom() + 10, card.width() - 20, 40)
+        painter.setFont(self.title_font)
+        painter.drawText(text_rect, Qt.TextWordWrap | Qt.AlignLeft | Qt.AlignTop, title)
+
+        author_rect = QRect(text_rect.x(), text_rect.bottom() + 5, text_rect.width(), 32)
+        painter.setFont(self.author_font)
+        painter.setPen(self.author_color)
+        painter.drawText(author_rect, Qt.TextWordWrap | Qt.AlignLeft | Qt.AlignTop, f"by {author}")
+
+        status_rect = QRect(text_rect.x(), author_rect.bottom() + 5, text_rect.width(), 16)
+        painter.setFont(self.status_font)
+        painter.setPen(self.status_color)
+        painter.drawText(status_rect, Qt.AlignLeft | Qt.AlignVCenter, "Available")
+
+        # Borrow button
+        button = self.button_rect(option.rect)
+        hover_pos = getattr(option.widget, "hover_pos", None)
+        hovered = hover_pos is not None and button.contains(hover_pos)
+        button_path = QPainterPath()
+        button_path.addRoundedRect(QRectF(button), 12, 12)
+        painter.fillPath(button_path, self.button_hover_color if hovered else self.button_color)
+        painter.setFont(self.button_font)
+        painter.setPen(Qt.white)
+        painter.drawText(button, Qt.AlignCenter, "Borrow Book")
+
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            if self.button_rect(option.rect).contains(event.pos()):
+                self.borrowClicked.emit(index.data(BookIdRole), index.data(Qt.DisplayRole))
+                return True
+        return super().editorEvent(event, model, option, index)
+
+
+class CatalogView(QListView):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setViewMode(QListView.IconMode)
+        self.setMovement(QListView.Static)
+        self.setResizeMode(QListView.Adjust)
+        self.setFlow(QListView.LeftToRight)
+        self.setWrapping(True)
+        self.setUniformItemSizes(True)
+        self.setSpacing(10)
+        self.setSelectionMode(QListView.NoSelection)
+        self.setMouseTracking(True)
+        self.setVerticalScrollMode(QListView.ScrollPerPixel)
+        self.setObjectName("catalogView")
+        self.hover_pos = None
+        self._hover_index = QModelIndex()
+
+    def setItemDelegate(self, delegate):
+        super().setItemDelegate(delegate)
+        delegate.coverReady.connect(self.viewport().update)
+
+    def mouseMoveEvent(self, event):
+        self.hover_pos = event.pos()
+        index = self.indexAt(event.pos())
+        over_button = index.isValid() and self.itemDelegate().button_rect(
+            self.visualRect(index)).contains(event.pos())
+        self.viewport().setCursor(Qt.PointingHandCursor if over_button else Qt.ArrowCursor)
+
+        # Only the card being left and the card being entered need repainting
+        if self._hover_index.isValid() and self._hover_index != index:
+            self.viewport().update(self.visualRect(self._hover_index))
+        if index.isValid():
+            self.viewport().update(self.visualRect(index))
+        self._hover_index = index
+        super().mouseMoveEvent(event)
+
+    def leaveEvent(self, event):
+        self.hover_pos = None
+        if self._hover_index.isValid():
+            self.viewport().update(self.visualRect(self._hover_index))
+        self._hover_index = QModelIndex()
+        super().leaveEvent(event)
@@ -0,0 +1,233 @@
+# Change feed shared by the member and admin apps.
+#
+#   python ChangeFeed.py tail [after_id]
+#   python ChangeFeed.py prune <days>
+#
+# Every write another client needs to know about (borrow, return, book and
+# member edits) appends a row to the events table in the same transaction,
+# so an event exists exactly when its change was committed. A client keeps
+# the id of the last event it has seen and reads only the ones after it, an
+# index range scan that is empty when nothing happened. What changed is then
+# applied to its views as a delta.
+import os
+import sys
+import time
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from Database import get_db_connection
+from Instrumentation import get_recorder
+
+# Event kinds
+BORROWED = "borrowed"
+RETURNED = "returned"
+LOAN_EDITED = "loan_edited"
+BOOK_ADDED = "book_added"
+BOOK_EDITED = "book_edited"
+BOOK_DELETED = "book_deleted"
+BOOKS_IMPORTED = "books_imported"
+MEMBER_ADDED = "member_added"
+MEMBER_EDITED = "member_edited"
+MEMBER_DELETED = "member_deleted"
+
+BOOK_EVENTS = (BORROWED, RETURNED, BOOK_ADDED, BOOK_EDITED, BOOK_DELETED, BOOKS_IMPORTED)
+LOAN_EVENTS = (BORROWED, RETURNED, LOAN_EDITED)
+MEMBER_EVENTS = (BORROWED, RETURNED, MEMBER_ADDED, MEMBER_EDITED, MEMBER_DELETED)
+
+FEED_INTERVAL_MS = int(os.environ.get("LIBRARY_FEED_INTERVAL_MS", "2000"))
+FEED_LIMIT = 500
+# Ids are handed out when a transaction inserts its event, not when it
+# commits, so a lower id can become visible after a higher one. A missing
+# id is waited for this long before it is taken to be a rollback.
+GAP_TIMEOUT = 10.0
+# Missing ids waited for at once. A longer run of them (an auto-increment
+# jump) can't all be open transactions; only the highest are kept.
+MAX_GAPS = FEED_LIMIT
+
+
+class Event:
+    __slots__ = ("id", "kind", "book_id", "loan_id", "username")
+
+    def __init__(self, id, kind, book_id=None, loan_id=None, username=None):
+        self.id = id
+        self.kind = kind
+        self.book_id = book_id
+        self.loan_id = loan_id
+        self.username = username
+
+    def __repr__(self):
+        return f"Event({self.id}, {self.kind!r}, book={self.book_id}, loan={self.loan_id}, user={self.username!r})"
+
+
+RECORD_EVENT = "INSERT INTO events (kind, book_id, loan_id, username) VALUES (%s, %s, %s, %s)"
+
+
+def record_event(cursor, kind, book_id=None, loan_id=None, username=None):
+    # Call inside the writer's transaction, before its commit
+    cursor.execute(RECORD_EVENT, (kind, book_id, loan_id, username))
+
+
+def fetch_events(after_id, limit=FEED_LIMIT, missing=()):
+    # Events with id > after_id, oldest first, plus any of the `missing`
+    # ids (gaps below after_id) that have since committed. With after_id
+    # None, no events and the id of the latest one (0 for an empty feed) to
+    # start from.
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if after_id is None:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM events")
+            return [], cursor.fetchone()[0]
+        events = []
+        if missing:
+            placeholders = ", ".join(["%s"] * len(missing))
+            cursor.execute(f"""
+                SELECT id, kind, book_id, loan_id, username FROM events
+                WHERE id IN ({placeholders}) ORDER BY id
+            """, tuple(missing))
+            events = [Event(*row) for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT id, kind, book_id, loan_id, username FROM events
+            WHERE id > %s ORDER BY id LIMIT %s
+        """, (after_id, limit))
+        return events + [Event(*row) for row in cursor.fetchall()], None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def prune_events(days):
+    # Events are only needed until every client has read them
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM events WHERE created_at < NOW() - INTERVAL %s DAY", (days,))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+        conn.close()
+
+
+class FeedCursor:
+    # Position in the feed. Every id up to `position` has been delivered or
+    # given up on, and every id up to `frontier` has been delivered except
+    # the gaps, each kept with when it was first noticed. The next read is
+    # for ids past the frontier plus the gaps, so a held position never
+    # makes the feed re-read what it already has.
+    def __init__(self, position=0, gap_timeout=GAP_TIMEOUT, clock=time.monotonic):
+        self.position = position
+        self.frontier = position
+        self.gap_timeout = gap_timeout
+        self.clock = clock
+        self._gaps = {}
+
+    def missing(self, limit=FEED_LIMIT):
+        # The gap ids to look for again, oldest first
+        return sorted(self._gaps)[:limit]
+
+    def accept(self, events):
+        # The events not delivered before, and advances the position
+        now = self.clock()
+        fresh = []
+        for event in sorted(events, key=lambda event: event.id):
+            if event.id > self.frontier:
+                for gap in range(max(self.frontier + 1, event.id - MAX_GAPS), event.id):
+                    self._gaps[gap] = now
+                self.frontier = event.id
+            elif self._gaps.pop(event.id, None) is None:
+                continue
+            fresh.append(event)
+        for gap in sorted(self._gaps)[:-MAX_GAPS]:
+            del self._gaps[gap]
+        self._advance(now)
+        return fresh
+
+    def _advance(self, now):
+        # Every gap open for gap_timeout is given up at once: the
+        # transactions that took those ids rolled back
+        expired = [gap for gap, since in self._gaps.items() if now - since >= self.gap_timeout]
+        for gap in expired:
+            del self._gaps[gap]
+        self.position = min(self._gaps) - 1 if self._gaps else self.frontier
+
+
+class ChangeFeed(QObject):
+    # Tails the events table on the executor and emits the new events on
+    # the GUI thread. start() begins at the current end of the feed.
+    eventsArrived = pyqtSignal(list)
+
+    def __init__(self, executor, interval_ms=FEED_INTERVAL_MS, fetch=fetch_events,
+                 limit=FEED_LIMIT, task_key="change_feed", parent=None):
+        super().__init__(parent)
+        self.executor = executor
+        self.fetch = fetch
+        self.limit = limit
+        self.task_key = task_key
+        self.cursor = None
+        self.running = False
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.poll)
+
+    def start(self):
+        self.stop()
+        self.running = True
+        self.executor.submit(self.task_key, self.fetch, None,
+                             on_result=self._started, on_error=self._failed)
+
+    def stop(self):
+        self.timer.stop()
+        self.executor.cancel(self.task_key)
+        self.cursor = None
+        self.running = False
+
+    def _started(self, result):
+        self.cursor = FeedCursor(result[1])
+        self.timer.start()
+
+    def poll(self):
+        # A read still in flight (slow server) is left to finish
+        if self.cursor is None or self.executor.is_busy(self.task_key):
+            return
+        self.executor.submit(self.task_key, self.fetch, self.cursor.frontier, self.limit,
+                             self.cursor.missing(self.limit),
+                             on_result=self._events_loaded, on_error=self._failed)
+
+    def _events_loaded(self, result):
+        events = result[0]
+        frontier = self.cursor.frontier
+        fresh = self.cursor.accept(events)
+        if fresh:
+            self.eventsArrived.emit(fresh)
+        # A full page past the frontier means more are waiting
+        if sum(event.id > frontier for event in events) == self.limit:
+            QTimer.singleShot(0, self.poll)
+
+    def _failed(self, error):
+        # The next tick tries again; a feed that can't be read only means
+        # views refresh when the user navigates
+        get_recorder().record_error("change_feed", error)
+        if self.running and self.cursor is None:
+            QTimer.singleShot(self.timer.interval(), self.start)
+
+
+def main(argv):
+    if not argv or argv[0] not in ("tail", "prune") or (argv[0] == "prune" and len(argv) < 2):
+        print("usage: python ChangeFeed.py tail [after_id] | prune <days>")
+        return 1
+
+    if argv[0] == "prune":
+        print(f"deleted {prune_events(int(argv[1]))} events")
+        return 0
+
+    cursor = FeedCursor(int(argv[1]) if len(argv) > 1 else fetch_events(None)[1])
+    try:
+        while True:
+            for event in cursor.accept(fetch_events(cursor.frontier, FEED_LIMIT, cursor.missing())[0]):
+                print(event, flush=True)
+            time.sleep(FEED_INTERVAL_MS / 1000)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
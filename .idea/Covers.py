@@ -0,0 +1,231 @@
+# Book covers for the catalog cards, each built once and then reused.
+#
+# A book's cover is its art, COVER_DIR/<book id>.jpg (or .jpeg/.png), cut
+# to the card's cover area; books without art get a cover drawn in a colour
+# derived from the title. Either way the finished image is made on a worker
+# thread: CoverStore.pixmap() returns what the memory cache has, or None
+# with the cover queued, and the card is painted with its plain placeholder
+# colour until coverReady fires. The covers missing from a paint pass go to
+# the workers in batches, most recently painted first. Art thumbnails are
+# also kept on disk in THUMB_DIR, named by a hash of the source file, its
+# size and mtime and the cover size, so a restart or a cover evicted from
+# memory only reads a small PNG instead of decoding the art again.
+#
+# Colours and file names use stable_hash(), never hash(): str hashes are
+# salted per process, so covers would change colour every run.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache, partial
+from PyQt5.QtGui import QImage, QImageReader, QPainter, QPainterPath, QPixmap, QColor
+from PyQt5.QtCore import Qt, QObject, QRect, QRectF, QSize, QTimer, pyqtSignal
+from Workers import QueryExecutor
+from Cache import get_cache, COVERS
+from Instrumentation import get_recorder
+from Theme import font
+
+COVER_DIR = os.environ.get("LIBRARY_COVER_DIR", "covers")
+THUMB_DIR = os.environ.get("LIBRARY_COVER_CACHE", "cover-cache")
+# Covers kept in memory, about 80 KB each at the catalog's size
+COVER_MEMORY = int(os.environ.get("LIBRARY_COVER_MEMORY", "300"))
+COVER_THREADS = 2
+COVER_BATCH = 8
+# Requests beyond this drop the oldest, i.e. cards scrolled past before
+# their cover was made
+MAX_QUEUED = 100
+# Covers finished within this long of each other share one repaint
+READY_DELAY_MS = 30
+ART_EXTENSIONS = (".jpg", ".jpeg", ".png")
+CORNER_RADIUS = 8
+
+
+def stable_hash(text):
+    # The same 64-bit value for the same text in every process
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+@lru_cache(maxsize=4096)
+def cover_color(title):
+    return QColor(f"#{stable_hash(title) % 0xffffff:06x}")
+
+
+def cover_path(rect):
+    # Rounded top corners, square bottom ones, like the card around it
+    path = QPainterPath()
+    path.setFillRule(Qt.WindingFill)
+    path.addRoundedRect(QRectF(rect), CORNER_RADIUS, CORNER_RADIUS)
+    path.addRect(QRectF(rect.x(), rect.y() + CORNER_RADIUS, rect.width(), rect.height() - CORNER_RADIUS))
+    return path.simplified()
+
+
+def find_art(book_id, cover_dir=COVER_DIR):
+    for extension in ART_EXTENSIONS:
+        path = os.path.join(cover_dir, f"{book_id}{extension}")
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _blank(size):
+    image = QImage(size, QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.transparent)
+    return image
+
+
+def render_cover(title, size):
+    # The drawn cover for a book without art
+    image = _blank(size)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    rect = QRect(0, 0, size.width(), size.height())
+    painter.fillPath(cover_path(rect), cover_color(title))
+    painter.setFont(font("tile_icon"))
+    painter.setPen(Qt.black)
+    painter.drawText(rect, Qt.AlignCenter, "📚")
+    painter.end()
+    return image
+
+
+def decode_art(path, size):
+    # The art scaled to fill size and cropped to it, or None if it can't be
+    # read. The reader scales while decoding, which for JPEGs skips most of
+    # the work of a full-size decode.
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    source = reader.size()
+    if source.isValid():
+        reader.setScaledSize(source.scaled(size, Qt.KeepAspectRatioByExpanding))
+    art = reader.read()
+    if art.isNull():
+        return None
+    if art.size() != size:
+        art = art.scaled(size, Qt.KeepAspectRatioByExpanding, Qt.SmoothTransformation)
+
+    image = _blank(size)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    rect = QRect(0, 0, size.width(), size.height())
+    painter.setClipPath(cover_path(rect))
+    painter.drawImage(rect, art, QRect((art.width() - size.width()) // 2,
+                                       (art.height() - size.height()) // 2,
+                                       size.width(), size.height()))
+    painter.end()
+    return image
+
+
+def thumbnail_path(source, size, thumb_dir=THUMB_DIR):
+    stat = os.stat(source)
+    key = f"{os.path.abspath(source)}|{stat.st_size}|{stat.st_mtime_ns}|{size.width()}x{size.height()}"
+    return os.path.join(thumb_dir, f"{stable_hash(key):016x}.png")
+
+
+def save_thumbnail(image, path):
+    # Written under a temporary name and renamed, so a reader in this or
+    # the other app never sees half a file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if image.save(partial_path, "PNG"):
+        os.replace(partial_path, path)
+
+
+def load_cover(book_id, title, size, cover_dir=COVER_DIR, thumb_dir=THUMB_DIR):
+    # Runs on a cover worker: the finished cover image for a book
+    source = find_art(book_id, cover_dir)
+    if source is None:
+        return render_cover(title, size)
+    thumbnail = thumbnail_path(source, size, thumb_dir)
+    image = QImage(thumbnail)
+    if not image.isNull() and image.size() == size:
+        return image
+    image = decode_art(source, size)
+    if image is None:
+        return render_cover(title, size)
+    try:
+        save_thumbnail(image, thumbnail)
+    except OSError as e:
+        get_recorder().record_error("cover_thumbnail", e)
+    return image
+
+
+def load_covers(requests, size, cover_dir=COVER_DIR, thumb_dir=THUMB_DIR):
+    # [(book id, title), ...] -> [((book id, title), image or error), ...];
+    # one bad cover doesn't lose the rest of the batch
+    covers = []
+    for book_id, title in requests:
+        try:
+            covers.append(((book_id, title), load_cover(book_id, title, size, cover_dir, thumb_dir)))
+        except Exception as e:
+            covers.append(((book_id, title), e))
+    return covers
+
+
+class CoverStore(QObject):
+    # Emitted on the GUI thread when a queued cover is ready
+    coverReady = pyqtSignal()
+
+    def __init__(self, width, height, cover_dir=COVER_DIR, thumb_dir=THUMB_DIR, parent=None):
+        super().__init__(parent)
+        self.size = QSize(width, height)
+        self.cover_dir = cover_dir
+        self.thumb_dir = thumb_dir
+        self.cache = get_cache(COVERS, COVER_MEMORY, float("inf"))
+        self.executor = QueryExecutor(self, max_threads=COVER_THREADS)
+        # Covers asked for, oldest first, and those with a worker
+        self._queued = OrderedDict()
+        self._loading = set()
+        self._batches = 0
+        self._batch_id = 0
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(0)
+        self._flush_timer.timeout.connect(self._flush)
+        self._ready_timer = QTimer(self)
+        self._ready_timer.setSingleShot(True)
+        self._ready_timer.setInterval(READY_DELAY_MS)
+        self._ready_timer.timeout.connect(self.coverReady)
+
+    def pixmap(self, book_id, title):
+        key = (book_id, title)
+        if key in self._queued or key in self._loading:
+            return None
+        pixmap = self.cache.peek(key)
+        if pixmap is None:
+            self._queued[key] = None
+            while len(self._queued) > MAX_QUEUED:
+                self._queued.popitem(last=False)
+            # Once the paint pass is over
+            self._flush_timer.start()
+        return pixmap
+
+    def _flush(self):
+        while self._queued and self._batches < COVER_THREADS:
+            batch = []
+            while self._queued and len(batch) < COVER_BATCH:
+                batch.append(self._queued.popitem()[0])
+            self._loading.update(batch)
+            self._batches += 1
+            self._batch_id += 1
+            self.executor.submit(("covers", self._batch_id), load_covers, batch, self.size,
+                                 self.cover_dir, self.thumb_dir,
+                                 on_result=self._loaded, on_error=partial(self._failed, batch))
+
+    def _loaded(self, covers):
+        # QPixmaps may only be made on the GUI thread, so the worker hands
+        # back QImages
+        self._batches -= 1
+        for key, image in covers:
+            self._loading.discard(key)
+            if isinstance(image, Exception):
+                get_recorder().record_error("cover", image)
+                image = render_cover(key[1], self.size)
+            self.cache.put(key, QPixmap.fromImage(image))
+        if not self._ready_timer.isActive():
+            self._ready_timer.start()
+        self._flush()
+
+    def _failed(self, batch, error):
+        self._loaded([(key, error) for key in batch])
+
+    def is_idle(self):
+        return not self._queued and not self._loading
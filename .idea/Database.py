@@ -0,0 +1,344 @@
+# Shared database access for the member and admin apps
+import os
+import queue
+import threading
+import time
+import weakref
+from mysql.connector.errors import PoolError
+from Backends import MySQLBackend, SQLiteBackend
+from Instrumentation import get_recorder
+
+DB_CONFIG = {
+    "host": os.environ.get("LIBRARY_DB_HOST", "localhost"),
+    "user": os.environ.get("LIBRARY_DB_USER", "root"),
+    "password": os.environ.get("LIBRARY_DB_PASSWORD", ""),
+    "database": os.environ.get("LIBRARY_DB_NAME", "LibraryDb"),
+}
+
+# "mysql", or "sqlite" for an embedded database file (see Backends.py) at
+# LIBRARY_DB_PATH, by default <database name>.sqlite3 next to the app
+BACKEND = os.environ.get("LIBRARY_DB_BACKEND", "mysql")
+SQLITE_PATH = os.environ.get("LIBRARY_DB_PATH")
+
+POOL_SIZE = int(os.environ.get("LIBRARY_DB_POOL_SIZE", "5"))
+POOL_TIMEOUT = float(os.environ.get("LIBRARY_DB_POOL_TIMEOUT", "10"))
+
+
+def get_backend():
+    if BACKEND == "sqlite":
+        return SQLiteBackend(SQLITE_PATH or f"{DB_CONFIG['database']}.sqlite3")
+    if BACKEND == "mysql":
+        return MySQLBackend(dict(DB_CONFIG))
+    raise ValueError(f"Unknown LIBRARY_DB_BACKEND {BACKEND!r}; use mysql or sqlite")
+
+
+class CountingCursor:
+    # Counts statements per pool so views can be checked for N+1 queries,
+    # and times each one, execute plus fetching its rows, for
+    # Instrumentation. A statement is reported when the cursor runs the next
+    # one or is closed, or when its connection goes back to the pool.
+    def __init__(self, pool, cursor, owner=None):
+        self._pool = pool
+        self._cursor = cursor
+        self._owner = owner
+        self._sample = None
+        if owner is not None:
+            owner._cursors.append(self)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    def _timed(self, operation, run):
+        self.finish()
+        wait = self._owner.take_wait() if self._owner is not None else 0.0
+        start = time.perf_counter()
+        try:
+            return run()
+        finally:
+            # [operation, elapsed, rows fetched, pool wait, rows touched]
+            self._sample = [operation, time.perf_counter() - start, None, wait,
+                            self._rowcount()]
+
+    def _rowcount(self):
+        try:
+            return max(self._cursor.rowcount, 0)
+        except Exception:
+            return 0
+
+    def execute(self, operation, *args, **kwargs):
+        self._pool.count_queries(1)
+        return self._timed(operation, lambda: self._cursor.execute(operation, *args, **kwargs))
+
+    def executemany(self, operation, seq_params):
+        self._pool.count_queries(1)
+        return self._timed(operation, lambda: self._cursor.executemany(operation, seq_params))
+
+    def _fetch(self, fetch, *args):
+        start = time.perf_counter()
+        result = fetch(*args)
+        sample = self._sample
+        if sample is not None:
+            sample[1] += time.perf_counter() - start
+            fetched = len(result) if isinstance(result, list) else int(result is not None)
+            sample[2] = (sample[2] or 0) + fetched
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def finish(self):
+        sample, self._sample = self._sample, None
+        if sample is None:
+            return
+        operation, elapsed, rows, wait, touched = sample
+        # Nothing fetched: a write, so report the rows it touched
+        get_recorder().record_query(operation, elapsed, touched if rows is None else rows, wait)
+
+    def close(self):
+        self.finish()
+        return self._cursor.close()
+
+
+class PooledConnection:
+    # Thin wrapper so the existing "conn.close()" calls hand the connection
+    # back to the pool instead of tearing down the socket.
+    def __init__(self, pool, conn, wait=0.0):
+        self._pool = pool
+        self._conn = conn
+        self._wait = wait
+        self._cursors = []
+        self._on_commit = []
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise PoolError("Connection has already been returned to the pool")
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        if self._conn is None:
+            raise PoolError("Connection has already been returned to the pool")
+        return CountingCursor(self._pool, self._conn.cursor(*args, **kwargs), self)
+
+    def statement(self, operation):
+        # A server-side prepared cursor for `operation`, kept with the
+        # connection: the statement is parsed once per connection, not per
+        # call. Read its results to the end and don't close it.
+        if self._conn is None:
+            raise PoolError("Connection has already been returned to the pool")
+        return CountingCursor(self._pool, self._pool.prepared(self._conn, operation), self)
+
+    def after_commit(self, callback):
+        # Runs callback() once the current transaction commits; dropped if
+        # it rolls back or the connection goes back to the pool first
+        self._on_commit.append(callback)
+
+    def commit(self):
+        if self._conn is None:
+            raise PoolError("Connection has already been returned to the pool")
+        self._conn.commit()
+        callbacks, self._on_commit = self._on_commit, []
+        for callback in callbacks:
+            callback()
+
+    def rollback(self):
+        if self._conn is None:
+            raise PoolError("Connection has already been returned to the pool")
+        self._on_commit = []
+        self._conn.rollback()
+
+    def take_wait(self):
+        # The pool wait is charged to the first statement on the connection
+        wait, self._wait = self._wait, 0.0
+        return wait
+
+    def _finish_cursors(self):
+        self._on_commit = []
+        cursors, self._cursors = self._cursors, []
+        for cursor in cursors:
+            cursor.finish()
+
+    def close(self):
+        if self._conn is not None:
+            self._finish_cursors()
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def discard(self):
+        # For a connection that can't be reused, e.g. one with a streamed
+        # result left unread: close it instead of returning it
+        if self._conn is not None:
+            self._finish_cursors()
+            conn, self._conn = self._conn, None
+            self._pool.discard(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT, backend=None, **config):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.size = size
+        self.timeout = timeout
+        self.backend = MySQLBackend(config) if config else backend or get_backend()
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # Prepared cursors by connection, then statement
+        self._statements = weakref.WeakKeyDictionary()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "reconnects": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "queries": 0,
+        }
+
+    def _connect(self):
+        return self.backend.connect()
+
+    def _is_healthy(self, conn):
+        # is_connected() pings the server, so a connection killed by a
+        # server restart is detected here rather than on the next query.
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def get_connection(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(f"No database connection available after {self.timeout:.1f}s")
+        waited = time.perf_counter() - start
+
+        try:
+            conn = None
+            reconnected = False
+            while conn is None:
+                try:
+                    candidate = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if self._is_healthy(candidate):
+                    conn = candidate
+                else:
+                    self._discard(candidate)
+                    reconnected = True
+
+            hit = conn is not None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats["hits" if hit else "misses"] += 1
+            if reconnected:
+                self._stats["reconnects"] += 1
+            if waited > 0.001:
+                self._stats["waits"] += 1
+            self._stats["wait_time"] += waited
+        get_recorder().record_wait(waited)
+
+        return PooledConnection(self, conn, waited)
+
+    def release(self, conn):
+        try:
+            # Handlers often SELECT without committing; end that transaction
+            # so the next borrower doesn't read from a stale snapshot.
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+        except Exception:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def discard(self, conn):
+        self._discard(conn)
+        self._slots.release()
+
+    def prepared(self, conn, operation):
+        with self._lock:
+            cursors = self._statements.setdefault(conn, {})
+        # Only the thread holding conn gets here, so cursors is ours
+        cursor = cursors.get(operation)
+        if cursor is None:
+            cursor = cursors[operation] = conn.cursor(prepared=True)
+        return cursor
+
+    def count_queries(self, n):
+        with self._lock:
+            self._stats["queries"] += n
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["idle"] = self._idle.qsize()
+        snapshot["size"] = self.size
+        return snapshot
+
+    def close_all(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+def dialect():
+    # "mysql" or "sqlite", for the few queries written per backend
+    return get_pool().backend.name
+
+
+def get_db_connection():
+    return get_pool().get_connection()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
@@ -0,0 +1,228 @@
+# Ctrl+Shift+D in either app: what Instrumentation has measured since start
+# (or the last Reset), per view and per statement, with the latency
+# histogram of the selected row, and the read-through caches' hit rates.
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QTabWidget, QTableWidget, QTableWidgetItem,
+    QHeaderView, QAbstractItemView, QLabel, QPushButton, QWidget, QSizePolicy
+)
+from PyQt5.QtGui import QColor, QPainter, QFont
+from PyQt5.QtCore import Qt, QTimer, QRectF
+from Database import pool_stats
+from Instrumentation import get_recorder, BUCKETS_MS
+from Cache import cache_stats
+from Theme import set_role
+
+REFRESH_MS = 1000
+
+VIEW_COLUMNS = [
+    ("View", None), ("Count", "count"), ("p50 ms", "p50_ms"), ("p95 ms", "p95_ms"),
+    ("p99 ms", "p99_ms"), ("Max ms", "max_ms"), ("Queries", "queries"), ("Rows", "rows"),
+    ("Wait ms", "wait_ms"), ("Widgets", "widgets"),
+]
+QUERY_COLUMNS = [
+    ("Statement", None), ("Count", "count"), ("p50 ms", "p50_ms"), ("p95 ms", "p95_ms"),
+    ("p99 ms", "p99_ms"), ("Max ms", "max_ms"), ("Rows", "rows"), ("Wait ms", "wait_ms"),
+]
+CACHE_COLUMNS = [
+    ("Cache", None), ("Entries", "entries"), ("Hits", "hits"), ("Misses", "misses"),
+    ("Hit rate %", "hit_pct"), ("Invalidated", "invalidations"), ("Expired", "expirations"),
+    ("Evicted", "evictions"),
+]
+
+PERCENTILE_COLORS = (("p50_ms", "#27ae60"), ("p95_ms", "#e67e22"), ("p99_ms", "#c0392b"))
+
+
+class _NumberItem(QTableWidgetItem):
+    # Sorts by value rather than by its text
+    def __init__(self, value, decimals):
+        super().__init__(f"{value:,.{decimals}f}")
+        self.value = value
+        self.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+
+    def __lt__(self, other):
+        if isinstance(other, _NumberItem):
+            return self.value < other.value
+        return super().__lt__(other)
+
+
+class HistogramWidget(QWidget):
+    # Samples per BUCKETS_MS bucket, with the p50/p95/p99 buckets marked
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumHeight(140)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.counts = []
+        self.summary = {}
+
+    def set_data(self, counts, summary):
+        self.counts = counts
+        self.summary = summary
+        self.update()
+
+    @staticmethod
+    def _bucket(ms):
+        return next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("#ffffff"))
+        painter.setFont(QFont("Arial", 8))
+        if not self.counts or not any(self.counts):
+            painter.setPen(QColor("#7f8c8d"))
+            painter.drawText(self.rect(), Qt.AlignCenter, "Select a row to see its latency histogram")
+            return
+
+        labels = [f"≤{bound}" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+        left, top, bottom = 10, 36, 20
+        width = (self.width() - 2 * left) / len(self.counts)
+        height = self.height() - top - bottom
+        peak = max(self.counts)
+
+        for i, count in enumerate(self.counts):
+            x = left + i * width
+            bar = height * count / peak
+            painter.fillRect(QRectF(x + 2, top + height - bar, width - 4, bar), QColor("#5dade2"))
+            painter.setPen(QColor("#34495e"))
+            painter.drawText(QRectF(x, top + height + 2, width, bottom - 2), Qt.AlignCenter, labels[i])
+            if count:
+                painter.drawText(QRectF(x, top + height - bar - 14, width, 14), Qt.AlignCenter, str(count))
+
+        # Percentile markers, in the middle of the bucket they fall in
+        legend = []
+        for key, color in PERCENTILE_COLORS:
+            ms = self.summary.get(key, 0.0)
+            x = left + (self._bucket(ms) + 0.5) * width
+            painter.setPen(QColor(color))
+            painter.drawLine(int(x), top, int(x), top + int(height))
+            legend.append((f"{key[:3]} {ms:,.2f} ms", color))
+        x = left
+        for text, color in legend:
+            painter.setPen(QColor(color))
+            painter.drawText(QRectF(x, 2, 120, 16), Qt.AlignLeft | Qt.AlignVCenter, text)
+            x += 120
+        painter.setPen(QColor("#7f8c8d"))
+        painter.drawText(QRectF(0, 2, self.width() - left, 16), Qt.AlignRight | Qt.AlignVCenter, "ms")
+
+
+class DiagnosticsPanel(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Diagnostics")
+        self.resize(900, 560)
+        self.recorder = get_recorder()
+
+        layout = QVBoxLayout(self)
+
+        self.tabs = QTabWidget()
+        self.views_table = self._make_table(VIEW_COLUMNS)
+        self.queries_table = self._make_table(QUERY_COLUMNS)
+        self.tabs.addTab(self.views_table, "Views")
+        self.tabs.addTab(self.queries_table, "Queries")
+        self.caches_table = self._make_table(CACHE_COLUMNS)
+        self.tabs.addTab(self.caches_table, "Caches")
+        self.tabs.currentChanged.connect(self._show_histogram)
+        layout.addWidget(self.tabs)
+
+        self.histogram = HistogramWidget()
+        layout.addWidget(self.histogram)
+
+        footer = QHBoxLayout()
+        self.pool_label = QLabel()
+        set_role(self.pool_label, "muted")
+        footer.addWidget(self.pool_label)
+        footer.addStretch()
+        reset_btn = QPushButton("Reset")
+        reset_btn.clicked.connect(self.reset)
+        footer.addWidget(reset_btn)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.close)
+        footer.addWidget(close_btn)
+        layout.addLayout(footer)
+
+        note = QLabel(f"Slow log: {self.recorder.log_path} (queries over {self.recorder.slow_query_ms:g} ms, "
+                      f"views over {self.recorder.slow_view_ms:g} ms)")
+        set_role(note, "muted")
+        layout.addWidget(note)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def _make_table(self, columns):
+        table = QTableWidget(0, len(columns))
+        table.setHorizontalHeaderLabels([label for label, _ in columns])
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.setSelectionMode(QAbstractItemView.SingleSelection)
+        table.setAlternatingRowColors(True)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        table.setSortingEnabled(True)
+        table.itemSelectionChanged.connect(self._show_histogram)
+        return table
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.timer.start()
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def _fill(self, table, columns, summaries):
+        selected = self._selected_name(table)
+        table.setSortingEnabled(False)
+        table.blockSignals(True)
+        table.setRowCount(len(summaries))
+        for row, (name, summary) in enumerate(summaries.items()):
+            item = QTableWidgetItem(name)
+            item.setToolTip(name)
+            table.setItem(row, 0, item)
+            for column, (_, key) in enumerate(columns[1:], start=1):
+                decimals = 0 if isinstance(summary[key], int) else 2 if key.endswith("_ms") else 1
+                table.setItem(row, column, _NumberItem(summary[key], decimals))
+        table.setSortingEnabled(True)
+        if selected is not None:
+            for row in range(table.rowCount()):
+                if table.item(row, 0).text() == selected:
+                    table.selectRow(row)
+                    break
+        table.blockSignals(False)
+
+    def _selected_name(self, table):
+        rows = table.selectionModel().selectedRows()
+        return table.item(rows[0].row(), 0).text() if rows else None
+
+    def refresh(self):
+        self._fill(self.views_table, VIEW_COLUMNS, self.recorder.views())
+        self._fill(self.queries_table, QUERY_COLUMNS, self.recorder.queries())
+        caches = cache_stats()
+        for stats in caches.values():
+            stats["hit_pct"] = stats["hit_rate"] * 100
+        self._fill(self.caches_table, CACHE_COLUMNS, caches)
+        stats = pool_stats()
+        self.pool_label.setText(
+            f"Pool of {stats['size']}: {stats['idle']} idle, {stats['queries']:,} statements, "
+            f"{stats['waits']:,} waits ({stats['wait_time'] * 1000:,.0f} ms)")
+        self._show_histogram()
+
+    def _show_histogram(self, *args):
+        if self.tabs.currentWidget() is self.views_table:
+            kind, table, summaries = "view", self.views_table, self.recorder.views
+        elif self.tabs.currentWidget() is self.queries_table:
+            kind, table, summaries = "query", self.queries_table, self.recorder.queries
+        else:
+            self.histogram.set_data([], {})
+            return
+        name = self._selected_name(table)
+        if name is None:
+            self.histogram.set_data([], {})
+            return
+        self.histogram.set_data(self.recorder.histogram(kind, name), summaries().get(name, {}))
+
+    def reset(self):
+        self.recorder.reset()
+        self.refresh()
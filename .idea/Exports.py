@@ -0,0 +1,180 @@
+# Streaming report exports for the admin app.
+#
+#   python Exports.py <loans|overdue|members> <file.csv|file.jsonl|file.parquet> [filter]
+#
+# Rows are read with an unbuffered cursor a batch at a time and written as
+# they arrive, so an export of millions of loans uses the same memory as
+# one of a hundred. The file is written under a temporary name and only
+# renamed into place once the export has finished.
+import csv
+import json
+import os
+import sys
+import time
+from Database import get_db_connection
+from AdminTables import base_query
+
+FETCH_SIZE = 5000
+FORMATS = ("csv", "jsonl", "parquet")
+
+
+class ExportError(Exception):
+    pass
+
+
+def export_format(path):
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    if ext == "ndjson":
+        return "jsonl"
+    if ext not in FORMATS:
+        raise ExportError(f"Unsupported export format '.{ext}' (use .csv, .jsonl or .parquet)")
+    return ext
+
+
+def report_query(spec, filter_text=""):
+    # The whole report in key order, plus a COUNT(*) for progress
+    query, conditions, args = base_query(spec, filter_text)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if spec.group_by:
+        query += f" GROUP BY {spec.group_by}"
+    return query + f" ORDER BY {spec.key}", f"SELECT COUNT(*) FROM ({query}) AS report", args
+
+
+class CsvWriter:
+    def __init__(self, f, columns):
+        self.writer = csv.writer(f)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class JsonLinesWriter:
+    def __init__(self, f, columns):
+        self.f = f
+        self.columns = columns
+
+    def write(self, rows):
+        for row in rows:
+            # Dates and decimals go out as their string form
+            self.f.write(json.dumps(dict(zip(self.columns, row)), default=str) + "\n")
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    # Each fetched batch becomes one row group, so only a batch is held in
+    # memory. Needs pyarrow.
+    def __init__(self, path, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.columns = columns
+        self.writer = None
+
+    def write(self, rows):
+        table = self.pa.table({name: [row[i] for row in rows] for i, name in enumerate(self.columns)})
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def export_report(spec, path, filter_text="", fetch_size=FETCH_SIZE, progress=None, should_stop=None):
+    # progress(rows_written, total_rows) is called after every batch and
+    # should_stop() is checked between them. Returns the stats dict.
+    fmt = export_format(path)
+    query, count_query, args = report_query(spec, filter_text)
+    tmp_path = path + ".part"
+    stats = {"rows": 0, "total": 0, "elapsed": 0.0, "stopped": False, "path": path}
+    start = time.perf_counter()
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(count_query, args)
+        stats["total"] = cursor.fetchone()[0]
+        cursor.close()
+
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(query, args)
+        columns = [d[0] for d in cursor.description]
+        if fmt == "parquet":
+            f, writer = None, ParquetWriter(tmp_path, columns)
+        else:
+            f = open(tmp_path, "w", newline="", encoding="utf-8")
+            writer = (CsvWriter if fmt == "csv" else JsonLinesWriter)(f, columns)
+        try:
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                writer.write(rows)
+                stats["rows"] += len(rows)
+                if progress is not None:
+                    progress(stats["rows"], stats["total"])
+                if should_stop is not None and should_stop():
+                    stats["stopped"] = True
+                    break
+            writer.close()
+        finally:
+            if f is not None:
+                f.close()
+
+        if stats["stopped"]:
+            # The rest of the result is still on the wire; dropping the
+            # connection is cheaper than reading it
+            conn.discard()
+            os.remove(tmp_path)
+        else:
+            cursor.close()
+            os.replace(tmp_path, path)
+    except Exception:
+        conn.discard()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        conn.close()
+
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def main(argv):
+    from Admin import EXPORT_REPORTS
+
+    if len(argv) < 2 or argv[0] not in EXPORT_REPORTS:
+        print("usage: python Exports.py <" + "|".join(EXPORT_REPORTS) + "> <file.csv|file.jsonl|file.parquet> [filter]")
+        return 1
+    spec = EXPORT_REPORTS[argv[0]]
+    filter_text = argv[2] if len(argv) > 2 else ""
+
+    def report(rows, total):
+        print(f"\r{rows:,} / {total:,} rows", end="", flush=True)
+
+    try:
+        stats = export_report(spec, argv[1], filter_text, progress=report)
+    except ExportError as e:
+        print(f"[error] {e}")
+        return 1
+    print()
+    print(f"wrote {stats['rows']:,} rows to {stats['path']} in {stats['elapsed']:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,236 @@
+# Overdue fines ledger.
+#
+#   python Fines.py scan [--batch N]
+#
+# A loan is charged PENALTY_PER_DAY for every day, or part of a day, it is
+# overdue. The scanner (run by the admin app every few minutes, or from
+# cron with the command above) writes a fine for each loan that fell due
+# since its last run and adds a day to the accruing fines whose next day
+# has started. Both passes work in batches of keys, so a run over millions
+# of loans holds one batch in memory. The admin views read the amounts
+# from the ledger instead of working them out per row.
+#
+# Fines are 'accruing' while the book is out; a return settles the fine as
+# 'owed', or 'paid' when it is collected at the desk.
+import math
+import os
+import sys
+import time
+from datetime import datetime
+from Database import get_db_connection
+
+PENALTY_PER_DAY = 0.5
+BATCH_SIZE = 5000
+SCAN_INTERVAL_MS = int(os.environ.get("LIBRARY_OVERDUE_SCAN_MS", "300000"))
+SCAN_JOB = "overdue_scan"
+SCAN_LOCK = "library_overdue_scan"
+
+ACCRUING = "accruing"
+OWED = "owed"
+PAID = "paid"
+
+
+def penalty_days(seconds):
+    # Days charged for a loan `seconds` past due
+    return max(1, math.ceil(seconds / 86400)) if seconds > 0 else 0
+
+
+def penalty(seconds):
+    return penalty_days(seconds) * PENALTY_PER_DAY
+
+
+def _days(due_date):
+    # penalty_days() in SQL; the %s is "now"
+    return f"GREATEST(1, CEIL(TIMESTAMPDIFF(SECOND, {due_date}, %s) / 86400))"
+
+
+def penalty_sql(due_date):
+    # penalty() in SQL; the %s is "now"
+    return f"{_days(due_date)} * {PENALTY_PER_DAY}"
+
+
+_ASSESS = f"""
+    INSERT INTO fines (loan_id, username, book_id, book_title, due_date, days, amount, next_accrual)
+    SELECT b.id, b.username, b.book_id, b.book_title, b.due_date, {_days("b.due_date")},
+           {_days("b.due_date")} * {PENALTY_PER_DAY}, b.due_date + INTERVAL {_days("b.due_date")} DAY
+    FROM borrowed_books b
+    WHERE {{where}} AND b.due_date < %s
+    ON DUPLICATE KEY UPDATE fines.due_date = VALUES(due_date), fines.days = VALUES(days),
+        fines.amount = VALUES(amount), fines.next_accrual = VALUES(next_accrual)
+"""
+
+_ACCRUE = f"""
+    UPDATE fines SET days = {_days("due_date")},
+        amount = {_days("due_date")} * {PENALTY_PER_DAY},
+        next_accrual = due_date + INTERVAL {_days("due_date")} DAY
+    WHERE id IN ({{ids}})
+"""
+
+
+def assess_loans(cursor, where, args, now):
+    # Brings the fines of the overdue loans matching `where` (on
+    # borrowed_books b) up to date, creating the missing ones
+    cursor.execute(_ASSESS.format(where=where), (now, now, now, *args, now))
+    return cursor.rowcount
+
+
+def reassess_fine(cursor, borrow_id, now=None):
+    # After a loan's due date was edited. Call inside the edit's transaction.
+    now = now or datetime.now()
+    cursor.execute("DELETE FROM fines WHERE loan_id = %s AND status = %s", (borrow_id, ACCRUING))
+    assess_loans(cursor, "b.id = %s", (borrow_id,), now)
+
+
+def settle_fine(cursor, borrow_id, paid, now=None):
+    # Final charge for a loan being returned, before its row is deleted.
+    # Returns the amount (0 if it wasn't overdue).
+    now = now or datetime.now()
+    assess_loans(cursor, "b.id = %s", (borrow_id,), now)
+    cursor.execute("UPDATE fines SET status = %s, settled_at = %s WHERE loan_id = %s AND status = %s",
+                   (PAID if paid else OWED, now, borrow_id, ACCRUING))
+    cursor.execute("SELECT amount FROM fines WHERE loan_id = %s", (borrow_id,))
+    row = cursor.fetchone()
+    return float(row[0]) if row else 0.0
+
+
+def _last_run(cursor):
+    cursor.execute("SELECT last_run FROM scheduled_jobs WHERE name = %s", (SCAN_JOB,))
+    row = cursor.fetchone()
+    return row[0] if row else datetime(1970, 1, 1)
+
+
+def _advance(after, last):
+    # The next keyset position; a page that doesn't move it would be read
+    # again for ever
+    if tuple(last) <= tuple(after):
+        raise RuntimeError(f"overdue scan stopped advancing at {tuple(after)}")
+    return tuple(last)
+
+
+def scan_overdue(batch_size=BATCH_SIZE, now=None, progress=None, should_stop=None):
+    # One scanner pass; returns the stats dict. Only one runs at a time
+    # across all clients: a pass that finds another running skips.
+    # progress(stats) is called after every batch, should_stop() checked
+    # between them.
+    now = now or datetime.now()
+    stats = {"assessed": 0, "accrued": 0, "batches": 0, "since": None,
+             "elapsed": 0.0, "skipped": False, "stopped": False}
+    start = time.perf_counter()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, 0)", (SCAN_LOCK,))
+    if cursor.fetchone()[0] != 1:
+        cursor.close()
+        conn.close()
+        stats["skipped"] = True
+        return stats
+
+    def batch_done():
+        conn.commit()
+        stats["batches"] += 1
+        stats["elapsed"] = time.perf_counter() - start
+        if progress is not None:
+            progress(dict(stats))
+        if should_stop is not None and should_stop():
+            stats["stopped"] = True
+        return stats["stopped"]
+
+    try:
+        since = stats["since"] = _last_run(cursor)
+
+        # Loans that fell due since the last run, in (due_date, id) order
+        after = (since, 0)
+        while True:
+            cursor.execute("""
+                SELECT due_date, id FROM borrowed_books
+                WHERE (due_date > %s OR (due_date = %s AND id > %s)) AND due_date < %s
+                ORDER BY due_date, id LIMIT %s
+            """, (after[0], after[0], after[1], now, batch_size))
+            keys = cursor.fetchall()
+            if not keys:
+                break
+            placeholders = ", ".join(["%s"] * len(keys))
+            assess_loans(cursor, f"b.id IN ({placeholders})", [key[1] for key in keys], now)
+            stats["assessed"] += len(keys)
+            after = _advance(after, keys[-1])
+            if batch_done() or len(keys) < batch_size:
+                break
+
+        # Fines whose next day has started, in (next_accrual, id) order. An
+        # update doesn't always move next_accrual past now (a loan exactly
+        # k days overdue gets due + k days == now), so the pages are read by
+        # key rather than by re-running the same query.
+        after = (datetime(1970, 1, 1), 0)
+        while not stats["stopped"]:
+            cursor.execute("""
+                SELECT next_accrual, id FROM fines
+                WHERE status = %s AND next_accrual <= %s
+                  AND (next_accrual > %s OR (next_accrual = %s AND id > %s))
+                ORDER BY next_accrual, id LIMIT %s
+            """, (ACCRUING, now, after[0], after[0], after[1], batch_size))
+            keys = cursor.fetchall()
+            if not keys:
+                break
+            ids = [key[1] for key in keys]
+            cursor.execute(_ACCRUE.format(ids=", ".join(["%s"] * len(ids))), (now, now, now, *ids))
+            stats["accrued"] += len(ids)
+            after = _advance(after, keys[-1])
+            if batch_done() or len(ids) < batch_size:
+                break
+
+        # A pass cut short starts again from the same point; fines already
+        # written are simply brought up to date
+        if not stats["stopped"]:
+            cursor.execute("""
+                INSERT INTO scheduled_jobs (name, last_run) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE last_run = VALUES(last_run)
+            """, (SCAN_JOB, now))
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (SCAN_LOCK,))
+        cursor.fetchone()
+        cursor.close()
+        conn.close()
+
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def member_fines(username):
+    # Total of a member's unpaid fines
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(SUM(amount), 0) FROM fines WHERE username = %s AND status != %s",
+                       (username, PAID))
+        return float(cursor.fetchone()[0])
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def main(argv):
+    if not argv or argv[0] != "scan":
+        print("usage: python Fines.py scan [--batch N]")
+        return 1
+    batch_size = int(argv[argv.index("--batch") + 1]) if "--batch" in argv else BATCH_SIZE
+
+    def report(stats):
+        print(f"\r{stats['assessed']:,} loans assessed, {stats['accrued']:,} fines accrued",
+              end="", flush=True)
+
+    stats = scan_overdue(batch_size, progress=report)
+    if stats["skipped"]:
+        print("another scan is already running")
+        return 1
+    print()
+    print(f"scanned loans due since {stats['since']} in {stats['elapsed']:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,204 @@
+# Timing for every SQL statement and view build in both apps.
+#
+# Database.CountingCursor reports each statement with its rows and the
+# time its connection waited in the pool; the windows report each view
+# from the click to the view being on screen, with the statements, pool
+# wait and widgets it took. The last SAMPLES of each are kept in memory for
+# the diagnostics panel (Ctrl+Shift+D), and anything slower than its
+# threshold is appended to the slow log, one JSON object per line:
+#
+#   {"ts": "...", "kind": "query", "name": "SELECT ... WHERE id = %s",
+#    "ms": 412.3, "rows": 1, "wait_ms": 0.0, "thread": "..."}
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+
+SLOW_QUERY_MS = float(os.environ.get("LIBRARY_SLOW_QUERY_MS", "200"))
+SLOW_VIEW_MS = float(os.environ.get("LIBRARY_SLOW_VIEW_MS", "1000"))
+SLOW_LOG = os.environ.get("LIBRARY_SLOW_LOG", "library-slow.log")
+
+SAMPLES = 1000
+# Distinct statements tracked; the rest are counted under OTHER
+MAX_SERIES = 500
+OTHER = "(other statements)"
+
+# Histogram bucket upper bounds, ms; the last bucket is everything slower
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_SPACE_RE = re.compile(r"\s+")
+_PLACEHOLDER_LIST_RE = re.compile(r"\(\s*%s(?:\s*,\s*%s)+\s*\)")
+
+
+@lru_cache(maxsize=2048)
+def statement_name(operation):
+    # One name per statement however its IN lists are sized
+    text = operation.decode() if isinstance(operation, bytes) else str(operation)
+    return _PLACEHOLDER_LIST_RE.sub("(%s, ...)", _SPACE_RE.sub(" ", text).strip())[:300]
+
+
+def count_widgets(widget):
+    from PyQt5.QtWidgets import QWidget
+    return len(widget.findChildren(QWidget)) + 1
+
+
+class Series:
+    __slots__ = ("count", "total", "max", "rows", "wait", "widgets", "queries", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.wait = 0.0
+        self.widgets = 0
+        self.queries = 0
+        self.samples = deque(maxlen=SAMPLES)
+
+    def add(self, elapsed, rows=0, wait=0.0, widgets=0, queries=0):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.rows += rows or 0
+        self.wait += wait
+        self.widgets += widgets or 0
+        self.queries += queries
+        self.samples.append(elapsed)
+
+    def percentile(self, pct):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def histogram(self):
+        # Sample counts per BUCKETS_MS bucket, plus one for the rest
+        counts = [0] * (len(BUCKETS_MS) + 1)
+        for elapsed in self.samples:
+            ms = elapsed * 1000
+            index = next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))
+            counts[index] += 1
+        return counts
+
+    def summary(self):
+        # Times in ms; rows, wait, widgets and queries are per call
+        n = max(1, self.count)
+        return {
+            "count": self.count,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+            "rows": self.rows / n,
+            "wait_ms": self.wait / n * 1000,
+            "widgets": self.widgets / n,
+            "queries": self.queries / n,
+        }
+
+
+class Recorder:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_view_ms=SLOW_VIEW_MS, log_path=SLOW_LOG):
+        self.slow_query_ms = slow_query_ms
+        self.slow_view_ms = slow_view_ms
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._queries = {}
+        self._views = {}
+        self._open_views = {}
+        # Running totals the view spans take deltas of
+        self._query_count = 0
+        self._wait_total = 0.0
+
+    def record_wait(self, waited):
+        with self._lock:
+            self._wait_total += waited
+
+    def record_query(self, operation, elapsed, rows=0, wait=0.0):
+        name = statement_name(operation)
+        with self._lock:
+            self._query_count += 1
+            series = self._queries.get(name)
+            if series is None:
+                if len(self._queries) >= MAX_SERIES:
+                    name = OTHER
+                series = self._queries.setdefault(name, Series())
+            series.add(elapsed, rows, wait)
+        if elapsed * 1000 >= self.slow_query_ms:
+            self._log({"kind": "query", "name": name, "ms": round(elapsed * 1000, 1), "rows": rows,
+                       "wait_ms": round(wait * 1000, 1)})
+
+    def start_view(self, name):
+        # A later start of the same view replaces an unfinished one
+        with self._lock:
+            self._open_views[name] = (time.perf_counter(), self._query_count, self._wait_total)
+
+    def finish_view(self, name, widget=None, rows=None):
+        # No-op unless the view was started and not yet finished, so the
+        # same call can sit on a path that also runs for later pages
+        with self._lock:
+            started = self._open_views.pop(name, None)
+            if started is None:
+                return
+            start, queries, wait = started
+            elapsed = time.perf_counter() - start
+            queries = self._query_count - queries
+            wait = self._wait_total - wait
+        widgets = count_widgets(widget) if widget is not None else 0
+        with self._lock:
+            self._views.setdefault(name, Series()).add(elapsed, rows, wait, widgets, queries)
+        if elapsed * 1000 >= self.slow_view_ms:
+            self._log({"kind": "view", "name": name, "ms": round(elapsed * 1000, 1), "rows": rows,
+                       "wait_ms": round(wait * 1000, 1), "queries": queries, "widgets": widgets})
+
+    def cancel_view(self, name):
+        with self._lock:
+            self._open_views.pop(name, None)
+
+    def record_error(self, context, error):
+        self._log({"kind": "error", "name": context, "error": f"{type(error).__name__}: {error}"})
+
+    def queries(self):
+        with self._lock:
+            return {name: series.summary() for name, series in self._queries.items()}
+
+    def views(self):
+        with self._lock:
+            return {name: series.summary() for name, series in self._views.items()}
+
+    def histogram(self, kind, name):
+        with self._lock:
+            series = (self._views if kind == "view" else self._queries).get(name)
+            return series.histogram() if series is not None else [0] * (len(BUCKETS_MS) + 1)
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+            self._views.clear()
+
+    def _log(self, entry):
+        entry = {"ts": datetime.now().isoformat(timespec="milliseconds"), **entry,
+                 "thread": threading.current_thread().name}
+        line = json.dumps(entry, default=str)
+        with self._log_lock:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError:
+                pass
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = Recorder()
+        return _recorder
@@ -0,0 +1,146 @@
+# Archive of ended loans.
+#
+#   python LoanHistory.py partitions
+#   python LoanHistory.py member <username>
+#
+# borrowed_books holds only active loans. A return moves the loan's row to
+# loan_history in the same transaction, with when it came back and the
+# fine it settled. loan_history is partitioned by month of return, so a
+# report over a period only reads the months it covers and old months can
+# be dropped whole. Partitions are added a few months ahead by
+# ensure_partitions(), which the admin app runs at login; a return past the
+# last month still lands safely in p_future. On the SQLite backend the
+# table is a plain one (see Migrations.py) and there is nothing to maintain.
+import sys
+from datetime import datetime, date
+from Database import get_db_connection, dialect
+
+PARTITION_MONTHS_AHEAD = 3
+HISTORY_LIMIT = 50
+
+
+def _month(d, offset=0):
+    # First day of the month `offset` months after d's
+    index = d.year * 12 + d.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition(month):
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{_month(month, 1)}')"
+
+
+def create_history_table(cursor, first_month=None, months_ahead=PARTITION_MONTHS_AHEAD):
+    # Monthly partitions from first_month (default: this month) to
+    # months_ahead from now. Anything returned before first_month goes to
+    # p_before.
+    first = _month(first_month or date.today())
+    last = _month(date.today(), months_ahead)
+    months = [first]
+    while months[-1] < last:
+        months.append(_month(months[-1], 1))
+    partitions = ",\n            ".join(_partition(month) for month in months)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS loan_history (
+            id INT NOT NULL,
+            username VARCHAR(100) NOT NULL,
+            book_id INT NOT NULL,
+            book_title VARCHAR(255) NOT NULL,
+            borrowed_at DATETIME NOT NULL,
+            due_date DATETIME NOT NULL,
+            is_claimed BOOLEAN NOT NULL DEFAULT FALSE,
+            returned_at DATETIME NOT NULL,
+            fine DECIMAL(10, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (id, returned_at),
+            INDEX idx_history_returned (returned_at, id),
+            INDEX idx_history_username (username, returned_at),
+            INDEX idx_history_book (book_id, returned_at)
+        )
+        PARTITION BY RANGE COLUMNS (returned_at) (
+            PARTITION p_before VALUES LESS THAN ('{first}'),
+            {partitions},
+            PARTITION p_future VALUES LESS THAN (MAXVALUE)
+        )
+    """)
+
+
+def ensure_partitions(cursor, months_ahead=PARTITION_MONTHS_AHEAD):
+    # Splits the months up to months_ahead from now out of p_future.
+    # Returns the partitions added.
+    if dialect() != "mysql":
+        return []
+    cursor.execute("""
+        SELECT partition_name FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = 'loan_history'
+    """)
+    months = [datetime.strptime(name[1:], "%Y%m").date()
+              for (name,) in cursor.fetchall() if name and name[1:].isdigit()]
+    month = _month(max(months), 1) if months else _month(date.today())
+    last = _month(date.today(), months_ahead)
+    added = []
+    while month <= last:
+        added.append(month)
+        month = _month(month, 1)
+    if added:
+        partitions = ", ".join(_partition(month) for month in added)
+        cursor.execute(f"""
+            ALTER TABLE loan_history REORGANIZE PARTITION p_future INTO (
+                {partitions}, PARTITION p_future VALUES LESS THAN (MAXVALUE))
+        """)
+    return [f"p{month:%Y%m}" for month in added]
+
+
+def maintain_partitions():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        return ensure_partitions(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def archive_loan(cursor, borrow_id, fine=0, now=None):
+    # Moves an active loan to the history. Call inside the return's
+    # transaction; the caller commits.
+    now = now or datetime.now()
+    cursor.execute("""
+        INSERT INTO loan_history
+            (id, username, book_id, book_title, borrowed_at, due_date, is_claimed, returned_at, fine)
+        SELECT id, username, book_id, book_title, borrowed_at, due_date, is_claimed, %s, %s
+        FROM borrowed_books WHERE id = %s
+    """, (now, fine, borrow_id))
+    cursor.execute("DELETE FROM borrowed_books WHERE id = %s", (borrow_id,))
+
+
+def fetch_member_history(username, limit=HISTORY_LIMIT):
+    # A member's most recent returns, newest first
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT book_title, borrowed_at, due_date, returned_at, fine FROM loan_history
+            WHERE username = %s ORDER BY returned_at DESC LIMIT %s
+        """, (username, limit))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def main(argv):
+    if not argv or argv[0] not in ("partitions", "member") or (argv[0] == "member" and len(argv) < 2):
+        print("usage: python LoanHistory.py partitions | member <username>")
+        return 1
+
+    if argv[0] == "partitions":
+        added = maintain_partitions()
+        print("added " + ", ".join(added) if added else "partitions are up to date")
+        return 0
+
+    for title, borrowed_at, due_date, returned_at, fine in fetch_member_history(argv[1]):
+        print(f"{returned_at}  {title}  (borrowed {borrowed_at}, due {due_date}, fine ${fine:.2f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
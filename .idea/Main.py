@@ -1,35 +1,217 @@
 import sys
-import bcrypt
+import time
 import mysql.connector
-import subprocess
 from datetime import datetime, timedelta
+from functools import partial
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLineEdit, QPushButton,
     QMessageBox, QStackedWidget, QLabel, QHBoxLayout, QCheckBox,
-    QMainWindow, QScrollArea, QFrame, QSizePolicy, QGridLayout, QDialog, QTextEdit
+    QMainWindow, QScrollArea, QFrame, QSizePolicy, QGridLayout, QDialog, QTextEdit, QShortcut
 )
-from PyQt5.QtGui import QFont, QIcon
-from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QIcon, QKeySequence
+from PyQt5.QtCore import Qt, QTimer
+from Database import get_db_connection, close_pool
+from Workers import QueryExecutor
+from Migrations import check_schema, SchemaError
+from Passwords import get_password_service
+from Availability import invalidate as invalidate_availability
+from Catalog import BookListModel, BookCardDelegate, CatalogView, SEARCH_LIMIT, SYNC_LIMIT
+from ChangeFeed import ChangeFeed, BOOK_EVENTS, LOAN_EVENTS
+from Repositories import BookRepository, LoanRepository, UserRepository
+from Cache import get_cache, apply_events as invalidate_events, is_catalog_page, page_covers, CATALOG, MEMBER_LOANS
+from Instrumentation import get_recorder
+from DiagnosticsPanel import DiagnosticsPanel
+from Theme import apply_theme, font, set_role, styled_background
+
+
+def authenticate_member(username, password):
+    with get_db_connection() as conn:
+        users = UserRepository(conn)
+        hashed = users.password(username)
+        if not hashed:
+            return False
+
+        ok, new_hash = get_password_service().verify_and_upgrade(password, hashed)
+        if new_hash:
+            # Stored hash predates the current cost factor
+            users.set_password(username, new_hash)
+            conn.commit()
+        return ok
+
+
+def register_member(username, password):
+    hashed_pwd = get_password_service().hash(password)
+
+    with get_db_connection() as conn:
+        UserRepository(conn).add(username, hashed_pwd)
+        conn.commit()
+
+
+# The catalog reads below go through the CATALOG cache (see Cache.py), so
+# going back to a view already loaded runs no queries
+
+EPOCH_MARKER = (datetime(1970, 1, 1), 0)
+# How far behind its marker a catalog sync starts: longer than a writer
+# waits for a row lock, so a transaction that stamped a book and then
+# waited still commits inside the window
+SYNC_WINDOW = timedelta(seconds=60)
+
+
+def _load_available_page(after_id, limit):
+    with get_db_connection() as conn:
+        return BookRepository(conn).available_page(after_id, limit)
+
+
+def fetch_available_page(after_id, limit):
+    return get_cache(CATALOG).get(("page", after_id, limit), partial(_load_available_page, after_id, limit))
+
+
+def _load_first_page(limit):
+    with get_db_connection() as conn:
+        books = BookRepository(conn)
+        return books.latest_change() or EPOCH_MARKER, books.available_page(0, limit)
+
 
+def fetch_first_page(limit):
+    # The current change marker and the first page, read in that order
+    cache = get_cache(CATALOG)
+    key = ("first", limit)
+    if key not in cache:
+        # Pages cached before the new marker could be missing changes that
+        # a sync from it would skip
+        cache.invalidate_where(lambda key, value: key[0] == "page")
+    return cache.get(key, partial(_load_first_page, limit))
 
 
+def _load_catalog_changes(marker, limit):
+    since, seen = marker[:2], marker[2] if len(marker) > 2 else marker
+    with get_db_connection() as conn:
+        rows = BookRepository(conn).changes_after(*since, limit)
+    # Cached pages holding books changed past the marker are out of date.
+    # This also keeps such a change set itself out of the cache. Rows
+    # re-read from the window behind it were applied before, or committed
+    # late, and their change feed event drops those pages.
+    ids = [row.id for row in rows if (row.updated_at, row.id) > seen]
+    if ids:
+        get_cache(CATALOG).invalidate_where(
+            lambda key, value: is_catalog_page(key) and any(page_covers(key, value, i) for i in ids))
+    if rows:
+        seen = (rows[-1].updated_at, rows[-1].id)
+    return [row[:4] for row in rows], seen
+
+
+def fetch_catalog_changes(marker, limit):
+    # Books changed after marker, a (updated_at, id) keyset, as
+    # (id, title, author, available) rows plus the marker to pass next time.
+    # A rewound marker (see rewind_marker) reads from its window's start.
+    # With marker None, just the current marker.
+    if marker is None:
+        with get_db_connection() as conn:
+            return [], BookRepository(conn).latest_change() or EPOCH_MARKER
+    return get_cache(CATALOG).get(("changes", marker, limit), partial(_load_catalog_changes, marker, limit))
+
+
+def fetch_books(book_ids):
+    # (id, title, author, available) now for each of book_ids, as catalog
+    # changes; a book that is gone reads as unavailable
+    rows = {}
+    with get_db_connection() as conn:
+        books = BookRepository(conn)
+        for start in range(0, len(book_ids), SYNC_LIMIT):
+            for row in books.changes_for(book_ids[start:start + SYNC_LIMIT]):
+                rows[row.id] = row[:4]
+    return [rows.get(book_id, (book_id, None, None, False)) for book_id in book_ids]
+
+
+def rewind_marker(marker):
+    # The marker a sync starts from: SYNC_WINDOW behind marker, carrying
+    # marker itself to tell re-read rows from new ones (see Catalog.py)
+    return max(marker[0] - SYNC_WINDOW, EPOCH_MARKER[0]), 0, marker
+
+
+SEARCH_DEBOUNCE_MS = 250
+
+
+def _load_search(term, limit):
+    with get_db_connection() as conn:
+        return BookRepository(conn).search_available(term, limit)
+
+
+def search_available_books(term, limit=SEARCH_LIMIT):
+    return get_cache(CATALOG).get(("search", term, limit), partial(_load_search, term, limit))
+
+
+# checkout_book results
+BORROWED = "borrowed"
+ALREADY_TAKEN = "already_taken"
+NOT_FOUND = "not_found"
+
+BORROW_RETRIES = 3
+# InnoDB deadlock and lock wait timeout: the transaction was rolled back
+# and is safe to run again
+RETRYABLE_ERRORS = (1213, 1205)
+DUPLICATE_KEY = 1062
+
+
+def _checkout_once(conn, username, book_id, due_date):
+    books = BookRepository(conn)
+    try:
+        book = books.lock(book_id)
+        if book is None:
+            conn.rollback()
+            return NOT_FOUND
+        if not book.available:
+            conn.rollback()
+            return ALREADY_TAKEN
+
+        books.set_available(book_id, False)
+        LoanRepository(conn).create(username, book_id, book.title, due_date)
+        conn.commit()
+        return BORROWED
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def checkout_book(username, book_id, due_date):
+    # One transaction: lock the book, mark it out, record the loan. Returns
+    # BORROWED, ALREADY_TAKEN or NOT_FOUND. Only the locked row decides: the
+    # availability cache can be seconds behind a return, so it is never
+    # asked here.
+    conn = get_db_connection()
+    try:
+        for attempt in range(BORROW_RETRIES):
+            try:
+                return _checkout_once(conn, username, book_id, due_date)
+            except mysql.connector.Error as e:
+                if e.errno == DUPLICATE_KEY:
+                    # The one-active-loan-per-book key caught a borrow that
+                    # got past the lock (e.g. available edited by hand)
+                    return ALREADY_TAKEN
+                if e.errno not in RETRYABLE_ERRORS or attempt == BORROW_RETRIES - 1:
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+    finally:
+        conn.close()
+        # Either we took it or someone else has; a cached "Available" is wrong
+        invalidate_availability(book_id)
+
 
+def _load_user_loans(username):
+    with get_db_connection() as conn:
+        return LoanRepository(conn).for_member(username)
 
-def get_db_connection():
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="",
-        database="LibraryDb"
-    )
+
+def fetch_user_loans(username):
+    return get_cache(MEMBER_LOANS).get(username, partial(_load_user_loans, username))
 
 
 class StyledLineEdit(QLineEdit):
     def __init__(self, placeholder):
         super().__init__()
         self.setPlaceholderText(placeholder)
-        self.setStyleSheet("padding: 8px; border-radius: 5px; border: 1px solid gray;")
-        self.setFont(QFont("Arial", 10))
+        set_role(self, "field")
+        self.setFont(font("field"))
 
 
 class SignupPage(QWidget):
@@ -43,11 +225,7 @@ class SignupPage(QWidget):
         form_layout.setContentsMargins(40, 40, 40, 40)
         form_layout.setSpacing(18)
         form_container.setMaximumWidth(450)
-        form_container.setStyleSheet("""
-                background-color: #fefefe;
-                border-radius: 15px;
-                border: 1px solid #e0e0e0;
-            """)
+        styled_background(form_container, "signupForm")
 
         # Optional logo
         # logo = QLabel()
@@ -56,7 +234,7 @@ class SignupPage(QWidget):
         # form_layout.addWidget(logo)
 
         self.title = QLabel("Create Your Account")
-        self.title.setFont(QFont("Segoe UI", 16, QFont.Bold))
+        self.title.setFont(font("signup_title"))
         self.title.setAlignment(Qt.AlignCenter)
         form_layout.addWidget(self.title)
 
@@ -72,30 +250,19 @@ class SignupPage(QWidget):
         form_layout.addWidget(self.confirm_password)
 
         self.show_password = QCheckBox("Show Password")
-        self.show_password.setStyleSheet("font-size: 12px;")
+        self.show_password.setObjectName("signupShowPassword")
         self.show_password.stateChanged.connect(self.toggle_password_visibility)
         form_layout.addWidget(self.show_password)
 
         self.signup_button = QPushButton("Sign Up")
         self.signup_button.setCursor(Qt.PointingHandCursor)
-        self.signup_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #3498db;
-                    color: white;
-                    border-radius: 8px;
-                    padding: 10px;
-                    font-weight: bold;
-                }
-                QPushButton:hover {
-                    background-color: #2980b9;
-                }
-            """)
+        self.signup_button.setObjectName("signupButton")
         self.signup_button.clicked.connect(self.signup)
         form_layout.addWidget(self.signup_button)
 
         self.switch_button = QPushButton("Already have an account? Log in")
         self.switch_button.setCursor(Qt.PointingHandCursor)
-        self.switch_button.setStyleSheet("color: #555; background: none; border: none;")
+        self.switch_button.setObjectName("switchButton")
         self.switch_button.clicked.connect(self.main_window.show_login)
         form_layout.addWidget(self.switch_button)
 
@@ -129,23 +296,24 @@ class SignupPage(QWidget):
             QMessageBox.warning(self, "Error", "Password must be at least 6 characters.")
             return
 
-        hashed_pwd = bcrypt.hashpw(pwd.encode('utf-8'), bcrypt.gensalt())
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)", (user, hashed_pwd))
-            conn.commit()
-            QMessageBox.information(self, "Success", "Account created!")
-            self.username.clear()
-            self.password.clear()
-            self.confirm_password.clear()
-            self.main_window.show_login()
-        except mysql.connector.errors.IntegrityError:
+        self.signup_button.setEnabled(False)
+        self.main_window.executor.submit("signup", register_member, user, pwd,
+                                         on_result=self.signup_finished, on_error=self.signup_failed)
+
+    def signup_finished(self, _):
+        self.signup_button.setEnabled(True)
+        QMessageBox.information(self, "Success", "Account created!")
+        self.username.clear()
+        self.password.clear()
+        self.confirm_password.clear()
+        self.main_window.show_login()
+
+    def signup_failed(self, error):
+        self.signup_button.setEnabled(True)
+        if isinstance(error, mysql.connector.errors.IntegrityError):
             QMessageBox.warning(self, "Error", "Username already exists.")
-        finally:
-            cursor.close()
-            conn.close()
+        else:
+            QMessageBox.warning(self, "Error", str(error))
 
 
 class LoginPage(QWidget):
@@ -161,7 +329,7 @@ class LoginPage(QWidget):
         form_container.setMaximumWidth(500)
 
         self.title = QLabel("Login")
-        self.title.setFont(QFont("Arial", 16, QFont.Bold))
+        self.title.setFont(font("form_title"))
         self.title.setAlignment(Qt.AlignCenter)
         form_layout.addWidget(self.title)
 
@@ -207,12 +375,14 @@ class LoginPage(QWidget):
             QMessageBox.warning(self, "Error", "Please enter username and password.")
             return
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT password FROM users WHERE username=%s", (user,))
-        result = cursor.fetchone()
+        self.login_button.setEnabled(False)
+        self.main_window.executor.submit("login", authenticate_member, user, pwd,
+                                         on_result=partial(self.login_finished, user),
+                                         on_error=self.login_failed)
 
-        if result and bcrypt.checkpw(pwd.encode('utf-8'), result[0].encode('utf-8')):
+    def login_finished(self, user, ok):
+        self.login_button.setEnabled(True)
+        if ok:
             QMessageBox.information(self, "Success", "Login successful!")
             self.username.clear()
             self.password.clear()
@@ -221,8 +391,9 @@ class LoginPage(QWidget):
         else:
             QMessageBox.warning(self, "Error", "Invalid credentials.")
 
-        cursor.close()
-        conn.close()
+    def login_failed(self, error):
+        self.login_button.setEnabled(True)
+        QMessageBox.warning(self, "Error", str(error))
 
 
 class MainWindow(QMainWindow):
@@ -230,30 +401,82 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.setWindowTitle("Library Management System")
         self.resize(600, 400)
+        apply_theme()
 
         self.stack = QStackedWidget()
         self.setCentralWidget(self.stack)
         self.current_user = None
+        self.executor = QueryExecutor(self)
+
+        self.catalog_model = BookListModel(fetch_available_page, self.executor,
+                                           search=search_available_books,
+                                           fetch_changes=fetch_catalog_changes,
+                                           fetch_first=fetch_first_page,
+                                           rewind=rewind_marker)
+        self.catalog_model.pageLoaded.connect(self._catalog_page_loaded)
+        self.catalog_delegate = BookCardDelegate(self)
+        self.catalog_delegate.borrowClicked.connect(self.borrow_book)
+        self.catalog_status = None
+        self.showing_loans = False
+
+        # Changes made by other clients arrive on the feed while logged in
+        self.feed = ChangeFeed(self.executor, parent=self)
+        self.feed_books = set()
+        self.feed.eventsArrived.connect(self.apply_events)
+
+        # Searches run once typing pauses, not on every keystroke
+        self.search_bar = None
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_search)
 
         self.login_page = LoginPage(self)
         self.signup_page = SignupPage(self)
         self.blank_screen = QWidget()
-        self.blank_screen.setStyleSheet("background-color: white;")
+        styled_background(self.blank_screen, "blankScreen")
 
         self.stack.addWidget(self.login_page)
         self.stack.addWidget(self.signup_page)
         self.stack.addWidget(self.blank_screen)
 
-    def show_home(self):
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, title, author FROM books WHERE id NOT IN (SELECT book_id FROM borrowed_books)")
-        books = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        self.recorder = get_recorder()
+        self.diagnostics = None
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, activated=self.show_diagnostics)
+
+    def show_diagnostics(self):
+        if self.diagnostics is None:
+            self.diagnostics = DiagnosticsPanel(self)
+        self.diagnostics.show()
+        self.diagnostics.raise_()
+
+    def replace_main_panel(self, widget):
+        self.catalog_status = None
+        self.showing_loans = False
+        self.search_bar = None
+        self.search_timer.stop()
+        for i in reversed(range(self.main_panel_layout.count())):
+            old = self.main_panel_layout.itemAt(i).widget()
+            if old:
+                old.setParent(None)
+
+        self.main_panel_layout.addWidget(widget)
 
-        
+    def show_loading(self, message="Loading..."):
+        loading_label = QLabel(message)
+        loading_label.setAlignment(Qt.AlignCenter)
+        loading_label.setFont(font("message"))
+        set_role(loading_label, "muted")
+        self.replace_main_panel(loading_label)
+
+    def show_load_error(self, error, view="main_panel"):
+        self.recorder.cancel_view(view)
+        self.recorder.record_error(view, error)
+        QMessageBox.warning(self, "Error", f"Could not reach the library database.\n{error}")
+
+    def show_home(self):
+        # Timed until the first page of cards is in (_catalog_page_loaded)
+        self.recorder.start_view("show_home")
         home_panel = QWidget()
         main_layout = QVBoxLayout(home_panel)
         main_layout.setContentsMargins(30, 30, 30, 30)
@@ -263,25 +486,19 @@ class MainWindow(QMainWindow):
         header_container = QWidget()
         header_layout = QHBoxLayout(header_container)
         header_layout.setContentsMargins(0, 0, 0, 0)
-        header_container.setStyleSheet("background-color: #f5f5f5; border-radius: 10px; padding: 12px;")
+        styled_background(header_container, "catalogHeader")
 
         title = QLabel("📚 Library Catalog")
-        title.setFont(QFont("Segoe UI", 18, QFont.Bold))
-        title.setStyleSheet("color: #2c3e50;")
+        title.setObjectName("catalogTitle")
+        title.setFont(font("page_title"))
 
         search_bar = QLineEdit()
-        search_bar.setPlaceholderText("Search by title, author, or genre...")
+        search_bar.setPlaceholderText("Search by title or author...")
+        search_bar.setClearButtonEnabled(True)
         search_bar.setFixedHeight(30)
-        search_bar.setStyleSheet("""
-            QLineEdit {
-                padding: 5px 12px;
-                border: 1px solid #ccc;
-                border-radius: 15px;
-                background-color: #fff;
-                font-size: 13px;
-            }
-        """)
+        search_bar.setObjectName("searchBar")
         search_bar.setFixedWidth(300)
+        search_bar.textChanged.connect(self.search_timer.start)
 
         header_layout.addWidget(title)
         header_layout.addStretch()
@@ -291,112 +508,49 @@ class MainWindow(QMainWindow):
 
         # Section Label
         section_label = QLabel("Available Books")
-        section_label.setFont(QFont("Segoe UI", 14, QFont.Bold))
-        section_label.setStyleSheet("color: #34495e;")
+        section_label.setObjectName("sectionLabel")
+        section_label.setFont(font("section"))
         main_layout.addWidget(section_label)
 
-        # Scrollable book area
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        scroll_area.setStyleSheet("border: none;")
-
-        scroll_content = QWidget()
-        grid_layout = QGridLayout(scroll_content)
-        grid_layout.setSpacing(20)
-        grid_layout.setContentsMargins(10, 10, 10, 10)
-
-        if books:
-            for idx, (book_id, book_title, author) in enumerate(books):
-                book_card = QWidget()
-                book_card.setFixedSize(200, 270)
-                book_card.setStyleSheet("""
-                    background-color: #ffffff;
-                    border-radius: 8px;
-                    border: 1px solid #e0e0e0;
-                """)
-
-                card_layout = QVBoxLayout(book_card)
-                card_layout.setContentsMargins(0, 0, 0, 0)
-                card_layout.setSpacing(0)
-
-                # Book cover
-                cover = QLabel()
-                cover.setFixedHeight(100)
-                cover.setStyleSheet(f"""
-                    background-color: #{hash(book_title) % 0xffffff:06x};
-                    border-top-left-radius: 8px;
-                    border-top-right-radius: 8px;
-                """)
-
-                icon = QLabel("📚", alignment=Qt.AlignCenter)
-                icon.setFont(QFont("Arial", 22))
-                cover_layout = QVBoxLayout(cover)
-                cover_layout.addWidget(icon)
-
-                # Info area
-                info_container = QWidget()
-                info_layout = QVBoxLayout(info_container)
-                info_layout.setContentsMargins(10, 10, 10, 10)
-                info_layout.setSpacing(5)
-
-                title_label = QLabel(book_title)
-                title_label.setFont(QFont("Segoe UI", 10, QFont.Bold))
-                title_label.setWordWrap(True)
-
-                author_label = QLabel(f"by {author}")
-                author_label.setFont(QFont("Segoe UI", 9))
-                author_label.setStyleSheet("color: #666666;")
-                author_label.setWordWrap(True)
-
-                status_label = QLabel("Available")
-                status_label.setFont(QFont("Segoe UI", 8))
-                status_label.setStyleSheet("color: #27ae60; font-weight: bold;")
-
-                borrow_btn = QPushButton("Borrow Book")
-                borrow_btn.setCursor(Qt.PointingHandCursor)
-                borrow_btn.setStyleSheet("""
-                    QPushButton {
-                        background-color: #3498db;
-                        color: white;
-                        border-radius: 12px;
-                        padding: 6px;
-                        font-size: 11px;
-                        font-weight: bold;
-                    }
-                    QPushButton:hover {
-                        background-color: #2980b9;
-                    }
-                """)
-                borrow_btn.clicked.connect(lambda _, b_id=book_id, b_title=book_title: self.borrow_book(b_id, b_title))
-
-                info_layout.addWidget(title_label)
-                info_layout.addWidget(author_label)
-                info_layout.addWidget(status_label)
-                info_layout.addStretch()
-                info_layout.addWidget(borrow_btn)
-
-                card_layout.addWidget(cover)
-                card_layout.addWidget(info_container)
-
-                row = idx // 4  # 4 books per row
-                col = idx % 4
-                grid_layout.addWidget(book_card, row, col)
-        else:
-            empty_label = QLabel("No books are currently available.")
-            empty_label.setAlignment(Qt.AlignCenter)
-            empty_label.setStyleSheet("color: #999; font-size: 14px; margin: 30px;")
-            grid_layout.addWidget(empty_label, 0, 0)
-
-        scroll_area.setWidget(scroll_content)
-        main_layout.addWidget(scroll_area)
-
-        # Replace existing content
-        for i in reversed(range(self.main_panel_layout.count())):
-            widget = self.main_panel_layout.itemAt(i).widget()
-            if widget:
-                widget.setParent(None)
-
-        self.main_panel_layout.addWidget(home_panel)
+        # Loading / empty state
+        catalog_status = QLabel("Loading catalog...")
+        catalog_status.setAlignment(Qt.AlignCenter)
+        catalog_status.setObjectName("catalogStatus")
+        main_layout.addWidget(catalog_status)
+
+        # Book grid: only the cards in view are painted, pages load on scroll
+        catalog_view = CatalogView()
+        catalog_view.setItemDelegate(self.catalog_delegate)
+        catalog_view.setModel(self.catalog_model)
+        main_layout.addWidget(catalog_view)
+
+        self.replace_main_panel(home_panel)
+        self.catalog_status = catalog_status
+        self.search_bar = search_bar
+        self.catalog_model.refresh()
+
+    def run_search(self):
+        if self.search_bar is None:
+            return
+        if self.catalog_status is not None:
+            self.catalog_status.setText("Searching...")
+            self.catalog_status.show()
+        self.recorder.start_view("run_search")
+        self.catalog_model.set_search(self.search_bar.text())
+
+    def _catalog_page_loaded(self, rows, exhausted):
+        for view in ("show_home", "run_search"):
+            self.recorder.finish_view(view, self.main_panel, rows)
+        if self.catalog_status is None:
+            return
+        if rows:
+            self.catalog_status.hide()
+        elif exhausted:
+            if self.catalog_model.search_term:
+                self.catalog_status.setText("No books match your search.")
+            else:
+                self.catalog_status.setText("No books are currently available.")
+            self.catalog_status.show()
 
     def show_login(self):
         self.stack.setCurrentWidget(self.login_page)
@@ -405,53 +559,79 @@ class MainWindow(QMainWindow):
         self.stack.setCurrentWidget(self.signup_page)
 
     def logout_clicked(self):
+        self.executor.cancel("main_panel")
+        self.feed.stop()
+        self.feed_books.clear()
         self.stack.setCurrentWidget(self.login_page)
         self.showNormal()
         QMessageBox.information(self, "Success", "Logout successful!")
 
     def borrow_book(self, book_id, book_title):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        try:
-            due_date = (datetime.now() + timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M:%S')
-
-            # Insert into DB
-            cursor.execute("""
-                INSERT INTO borrowed_books (username, book_id, book_title, due_date)
-                VALUES (%s, %s, %s, %s)
-            """, (self.current_user, book_id, book_title, due_date))
-            conn.commit()
-
-            # Inform user
-            QMessageBox.information(
-                self, 
-                "Book Borrowed", 
-                f"✅ You borrowed '{book_title}'.\n📅 Due on: {due_date}.\n\n📌 Please claim the book at the library front desk."
-            )
-
-            # Generate receipt dialog
-            self.show_receipt_dialog(book_title, due_date)
-
-            self.show_home()
+        due_date = (datetime.now() + timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M:%S')
+        self.executor.submit(f"borrow_{book_id}", checkout_book,
+                             self.current_user, book_id, due_date,
+                             on_result=partial(self.borrow_finished, book_id, book_title, due_date),
+                             on_error=lambda e: QMessageBox.warning(self, "Error", str(e)))
+
+    def borrow_finished(self, book_id, book_title, due_date, result):
+        # Each result is the locked row's answer: the book is off the shelf
+        # (ours, someone else's, or deleted). Drop its card and pick up
+        # anything else that changed, without reloading the catalog
+        self.catalog_model.remove_book(book_id)
+        self.catalog_model.sync()
+
+        if result != BORROWED:
+            if result == ALREADY_TAKEN:
+                message = f"Sorry, '{book_title}' has just been borrowed by someone else."
+            else:
+                message = f"Sorry, '{book_title}' is no longer in the catalog."
+            QMessageBox.warning(self, "Not Available", message)
+            return
 
-        except Exception as e:
-            QMessageBox.warning(self, "Error", str(e))
-        finally:
-            cursor.close()
-            conn.close()
+        # Inform user
+        QMessageBox.information(
+            self, 
+            "Book Borrowed", 
+            f"✅ You borrowed '{book_title}'.\n📅 Due on: {due_date}.\n\n📌 Please claim the book at the library front desk."
+        )
+
+        # Generate receipt dialog
+        self.show_receipt_dialog(book_title, due_date)
+
+    def apply_events(self, events):
+        # The books the events name are read again and applied as they are
+        # now, whenever their transactions committed. An event naming no
+        # book (an import) falls back to a sync from the change marker.
+        invalidate_events(events)
+        book_events = [event for event in events if event.kind in BOOK_EVENTS]
+        self.feed_books.update(event.book_id for event in book_events if event.book_id is not None)
+        if self.feed_books:
+            # Still-pending ids ride along, so a newer read that makes an
+            # older one stale loses nothing
+            book_ids = sorted(self.feed_books)
+            self.executor.submit("catalog_books", fetch_books, book_ids,
+                                 on_result=partial(self._feed_books_loaded, book_ids),
+                                 on_error=partial(self.recorder.record_error, "catalog_books"))
+        if any(event.book_id is None for event in book_events):
+            self.catalog_model.sync()
+        if self.showing_loans and any(event.kind in LOAN_EVENTS and event.username == self.current_user
+                                      for event in events):
+            self.executor.submit("main_panel", fetch_user_loans, self.current_user,
+                                 on_result=self._build_borrowed_books, on_error=self.show_load_error)
+
+    def _feed_books_loaded(self, book_ids, changes):
+        self.feed_books.difference_update(book_ids)
+        self.catalog_model.apply_changes(changes)
 
     def show_borrowed_books(self):
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT book_title, due_date, is_claimed FROM borrowed_books
-                WHERE username = %s
-            """, (self.current_user,))
-            books = cursor.fetchall()
-            cursor.close()
-            conn.close()
+        self.recorder.start_view("show_borrowed_books")
+        self.show_loading("Loading your books...")
+        self.executor.submit("main_panel", fetch_user_loans, self.current_user,
+                             on_result=self._build_borrowed_books,
+                             on_error=partial(self.show_load_error, view="show_borrowed_books"))
 
+    def _build_borrowed_books(self, books):
+        try:
             book_panel = QWidget()
             layout = QVBoxLayout(book_panel)
             layout.setContentsMargins(30, 30, 30, 30)
@@ -459,22 +639,15 @@ class MainWindow(QMainWindow):
 
             # Header with gradient background
             header = QLabel("📚 Borrowed Books")
-            header.setFont(QFont("Georgia", 24, QFont.Bold))
-            header.setStyleSheet("""
-                QLabel {
-                    color: white;
-                    background: qlineargradient(x1:0, y1:0, x2:1, y2:0, stop:0 #6dd5ed, stop:1 #2193b0);
-                    padding: 15px;
-                    border-radius: 12px;
-                }
-            """)
+            header.setObjectName("loansHeader")
+            header.setFont(font("banner"))
             header.setAlignment(Qt.AlignCenter)
             layout.addWidget(header)
 
             # Scroll Area
             scroll_area = QScrollArea()
             scroll_area.setWidgetResizable(True)
-            scroll_area.setStyleSheet("border: none;")
+            scroll_area.setObjectName("loansScroll")
 
             scroll_content = QWidget()
             scroll_layout = QVBoxLayout(scroll_content)
@@ -485,39 +658,28 @@ class MainWindow(QMainWindow):
             if books:
                 for title, due_date, is_claimed in books:
                     card = QFrame()
-                    card.setStyleSheet("""
-                        QFrame {
-                            background-color: #fdfefe;
-                            border-radius: 12px;
-                            border: 1px solid #ecf0f1;
-                            padding: 12px;
-                            box-shadow: 0px 2px 6px rgba(0, 0, 0, 0.05);
-                        }
-                        QFrame:hover {
-                            background-color: #f0f8ff;
-                        }
-                    """)
+                    set_role(card, "loanCard")
                     card_layout = QHBoxLayout(card)
                     card_layout.setContentsMargins(15, 8, 15, 8)
                     card_layout.setSpacing(20)
 
                     icon = QLabel("📖")
-                    icon.setFont(QFont("Arial", 24))
+                    icon.setFont(font("card_icon"))
                     icon.setFixedWidth(40)
 
                     info_layout = QVBoxLayout()
                     title_label = QLabel(title)
-                    title_label.setFont(QFont("Segoe UI", 11, QFont.Bold))
+                    title_label.setFont(font("card_title"))
                     due_label = QLabel(f"Due: {due_date}")
-                    due_label.setFont(QFont("Segoe UI", 9))
-                    due_label.setStyleSheet("color: #e67e22;")
+                    due_label.setFont(font("card_detail"))
+                    set_role(due_label, "due")
 
                     # Add claimed status
                     claimed_status = "Claimed" if is_claimed else "Not Claimed"
-                    claimed_color = "#27ae60" if is_claimed else "#3498db"
                     claimed_label = QLabel(claimed_status)
-                    claimed_label.setFont(QFont("Segoe UI", 9, QFont.Bold))
-                    claimed_label.setStyleSheet(f"color: {claimed_color}; padding: 3px 8px; background-color: #f8f9fa; border-radius: 4px;")
+                    claimed_label.setFont(font("card_badge"))
+                    set_role(claimed_label, "claimed")
+                    claimed_label.setProperty("claimed", bool(is_claimed))
 
                     info_layout.addWidget(title_label)
                     info_layout.addWidget(due_label)
@@ -530,42 +692,25 @@ class MainWindow(QMainWindow):
                     scroll_layout.addWidget(card)
             else:
                 empty_msg = QLabel("😔 You haven't borrowed any books yet.\nExplore the catalog and start reading!")
-                empty_msg.setFont(QFont("Segoe UI", 12))
+                empty_msg.setFont(font("message"))
                 empty_msg.setAlignment(Qt.AlignCenter)
-                empty_msg.setStyleSheet("color: #7f8c8d; padding: 60px;")
+                set_role(empty_msg, "empty")
                 scroll_layout.addWidget(empty_msg)
 
             scroll_content.setLayout(scroll_layout)
             scroll_area.setWidget(scroll_content)
             layout.addWidget(scroll_area)
 
-            # Replace main content
-            if self.main_panel_layout is not None:
-                for i in reversed(range(self.main_panel_layout.count())):
-                    widget = self.main_panel_layout.itemAt(i).widget()
-                    if widget:
-                        widget.setParent(None)
-
-            self.main_panel_layout.addWidget(book_panel)
+            self.replace_main_panel(book_panel)
+            self.showing_loans = True
+            self.recorder.finish_view("show_borrowed_books", book_panel, len(books))
 
         except Exception as e:
-            print(f"[error] failed to show books : {e}")
+            self.recorder.cancel_view("show_borrowed_books")
+            self.recorder.record_error("show_borrowed_books", e)
+            QMessageBox.warning(self, "Error", f"Could not show your books.\n{e}")
 
 
-
-    def get_borrowed_books(self, username):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-          SELECT book_title, due_date 
-          FROM borrowed_books 
-          WHERE username = %s
-        """, (username,))
-        books = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return books
-    
     def show_receipt_dialog(self, book_title, due_date):
             dialog = QDialog(self)
             dialog.setWindowTitle("Borrow Receipt")
@@ -575,7 +720,7 @@ class MainWindow(QMainWindow):
 
             receipt_text = QTextEdit()
             receipt_text.setReadOnly(True)
-            receipt_text.setStyleSheet("font-family: Consolas; font-size: 12pt; background-color: #f9f9f9; padding: 10px;")
+            receipt_text.setObjectName("receipt")
             
             now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             receipt_content = f"""
@@ -607,54 +752,34 @@ class MainWindow(QMainWindow):
         # Top navigation bar
         top_panel = QWidget()
         top_panel.setFixedHeight(70)
-        top_panel.setStyleSheet("""
-            background-color: #A1C6EA;
-            border-bottom: 2px solid #7FB3D5;
-        """)
+        styled_background(top_panel, "topBar")
 
         top_layout = QHBoxLayout(top_panel)
         top_layout.setContentsMargins(20, 10, 20, 10)
         top_layout.setSpacing(15)
 
-        button_style = """
-            QPushButton {
-                background-color: #ffffff;
-                color: #34495e;
-                border: none;
-                padding: 10px 18px;
-                border-radius: 10px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #d6eaf8;
-            }
-        """
-
         home_btn = QPushButton("🏠 Home")
-        home_btn.setStyleSheet(button_style)
         home_btn.clicked.connect(self.show_home)
 
         books_btn = QPushButton("📚 My Books")
-        books_btn.setStyleSheet(button_style)
         books_btn.clicked.connect(self.show_borrowed_books)
 
         settings_btn = QPushButton("⚙️ Settings")
-        settings_btn.setStyleSheet(button_style)
         # settings_btn.clicked.connect(...)  # Optional
 
         logout_btn = QPushButton("🚪 Logout")
-        logout_btn.setStyleSheet(button_style)
         logout_btn.clicked.connect(self.logout_clicked)
 
         # Add buttons
         for btn in [home_btn, books_btn, settings_btn, logout_btn]:
+            set_role(btn, "nav")
             top_layout.addWidget(btn)
 
         top_layout.addStretch()
 
         # Main content area
         self.main_panel = QWidget()
-        self.main_panel.setStyleSheet("background-color: #fdfdfd; border-top: 1px solid #ddd;")
+        styled_background(self.main_panel, "mainPanel")
         self.main_panel_layout = QVBoxLayout(self.main_panel)
         self.main_panel_layout.setContentsMargins(20, 20, 20, 20)
 
@@ -670,11 +795,19 @@ class MainWindow(QMainWindow):
         self.stack.setCurrentWidget(container)
         self.showMaximized()
 
+        self.feed.start()
         self.show_home()
 
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    app.aboutToQuit.connect(close_pool)
+
+    try:
+        check_schema()
+    except (SchemaError, mysql.connector.Error) as e:
+        QMessageBox.critical(None, "Database Error", str(e))
+        sys.exit(1)
     main_window = MainWindow()
     main_window.show()
     sys.exit(app.exec_())
\ No newline at end of file
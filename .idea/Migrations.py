@@ -0,0 +1,578 @@
+# Versioned schema migrations for LibraryDb.
+#
+#   python Migrations.py status
+#   python Migrations.py migrate [version]
+#   python Migrations.py rollback <version>
+#
+# Every step is safe to run twice (tables, columns and indexes are only
+# created when missing), so a database built by hand from the old
+# database.txt can simply be migrated from version 0.
+#
+# The same migrations build the SQLite backend's schema. The guarded steps
+# read SQLite's catalog there, and a migration whose SQL SQLite can't run
+# carries its own SQLite steps.
+import sys
+import mysql.connector
+import Database
+from Database import get_db_connection
+from LoanHistory import create_history_table
+
+VERSION_TABLE = "schema_version"
+LOCK_NAME = "library_migrations"
+
+
+class SchemaError(Exception):
+    pass
+
+
+def _exists(cursor, query, args):
+    cursor.execute(query, args)
+    return cursor.fetchone()[0] > 0
+
+
+def _sqlite():
+    return Database.dialect() == "sqlite"
+
+
+def table_exists(cursor, table):
+    if _sqlite():
+        return _exists(cursor, "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = %s",
+                       (table,))
+    return _exists(cursor, """
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = %s
+    """, (table,))
+
+
+def column_exists(cursor, table, column):
+    if _sqlite():
+        return _exists(cursor, "SELECT COUNT(*) FROM pragma_table_info(%s) WHERE name = %s",
+                       (table, column))
+    return _exists(cursor, """
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+
+
+def index_exists(cursor, table, index):
+    if _sqlite():
+        return _exists(cursor, "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+                       (table, index))
+    return _exists(cursor, """
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, index))
+
+
+# Guarded steps. Each returns a function of the cursor.
+
+def add_column(table, column, definition):
+    def step(cursor):
+        if not column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def drop_column(table, column):
+    def step(cursor):
+        if column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+    return step
+
+
+def add_index(table, index, columns, kind="INDEX"):
+    def step(cursor):
+        if index_exists(cursor, table, index):
+            return
+        if not _sqlite():
+            cursor.execute(f"ALTER TABLE {table} ADD {kind} {index} ({columns})")
+        elif kind != "FULLTEXT INDEX":
+            # No full-text index on SQLite; its search falls back to LIKE
+            cursor.execute(f"CREATE {kind} {index} ON {table} ({columns})")
+    return step
+
+
+def drop_index(table, index):
+    def step(cursor):
+        if index_exists(cursor, table, index):
+            cursor.execute(f"DROP INDEX {index}" if _sqlite() else f"ALTER TABLE {table} DROP INDEX {index}")
+    return step
+
+
+# MySQL keeps an index behind every foreign key. The one it makes itself is
+# named after the column, and it drops it on its own once a later index can
+# serve the key instead; that index then can't be dropped (error 1553) until
+# another takes over. A down step restores the key's own index first, and
+# the up step drops it again once its replacement is in. SQLite needs none.
+
+def restore_fk_index(table, column):
+    def step(cursor):
+        if not _sqlite():
+            add_index(table, column, column)(cursor)
+    return step
+
+
+def drop_fk_index(table, column):
+    def step(cursor):
+        if not _sqlite():
+            drop_index(table, column)(cursor)
+    return step
+
+
+def insert_if_empty(table, columns, rows):
+    def step(cursor):
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        if cursor.fetchone()[0] == 0:
+            placeholders = ", ".join(["%s"] * len(rows[0]))
+            cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+    return step
+
+
+def refuse_duplicates(table, column):
+    # Stops the migration, naming the offending values, if a unique key on
+    # `column` can't be built. Which duplicate to keep is for a person to
+    # decide.
+    def step(cursor):
+        cursor.execute(f"SELECT {column} FROM {table} GROUP BY {column} HAVING COUNT(*) > 1 LIMIT 20")
+        duplicates = [row[0] for row in cursor.fetchall()]
+        if duplicates:
+            raise SchemaError(
+                f"{table}.{column} has duplicate values {duplicates}; resolve them and migrate again")
+    return step
+
+
+class Migration:
+    def __init__(self, version, name, up, down, sqlite=None):
+        # up/down: SQL strings or step functions, run in order. sqlite: the
+        # steps run instead of `up` on the SQLite backend, if they differ.
+        self.version = version
+        self.name = name
+        self.up = up
+        self.down = down
+        self.sqlite = sqlite
+
+    def steps(self):
+        return self.sqlite if self.sqlite is not None and _sqlite() else self.up
+
+
+# SQLite keeps times as text with milliseconds (see Backends.py); this is
+# its CURRENT_TIMESTAMP(6) in the app's local time
+SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+STARTER_BOOKS = insert_if_empty("books", "title, author", [
+    ("To Kill a Mockingbird", "Harper Lee"),
+    ("1984", "George Orwell"),
+    ("The Great Gatsby", "F. Scott Fitzgerald"),
+    ("Pride and Prejudice", "Jane Austen"),
+    ("The Hobbit", "J.R.R. Tolkien"),
+])
+
+
+MIGRATIONS = [
+    Migration(1, "initial schema", [
+        """CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(100) NOT NULL UNIQUE,
+            password VARCHAR(255) NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS books (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            title VARCHAR(255) NOT NULL,
+            author VARCHAR(255) NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS borrowed_books (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(100) NOT NULL,
+            book_id INT NOT NULL,
+            book_title VARCHAR(255) NOT NULL,
+            due_date DATE NOT NULL,
+            FOREIGN KEY (username) REFERENCES users(username),
+            FOREIGN KEY (book_id) REFERENCES books(id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS admins (
+            adminid INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(100) NOT NULL UNIQUE,
+            password VARCHAR(100) NOT NULL
+        )""",
+        # Starter catalog for a fresh install
+        STARTER_BOOKS,
+    ], [
+        "DROP TABLE IF EXISTS borrowed_books",
+        "DROP TABLE IF EXISTS admins",
+        "DROP TABLE IF EXISTS books",
+        "DROP TABLE IF EXISTS users",
+    ], sqlite=[
+        # Names compare case-insensitively, as under MySQL's default
+        # collation. The foreign keys are checked at commit so a member can
+        # be renamed along with their loans.
+        """CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(100) NOT NULL UNIQUE COLLATE NOCASE,
+            password VARCHAR(255) NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title VARCHAR(255) NOT NULL COLLATE NOCASE,
+            author VARCHAR(255) NOT NULL COLLATE NOCASE
+        )""",
+        """CREATE TABLE IF NOT EXISTS borrowed_books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(100) NOT NULL COLLATE NOCASE,
+            book_id INT NOT NULL,
+            book_title VARCHAR(255) NOT NULL COLLATE NOCASE,
+            due_date DATETIME NOT NULL,
+            FOREIGN KEY (username) REFERENCES users(username) DEFERRABLE INITIALLY DEFERRED,
+            FOREIGN KEY (book_id) REFERENCES books(id) DEFERRABLE INITIALLY DEFERRED
+        )""",
+        """CREATE TABLE IF NOT EXISTS admins (
+            adminid INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(100) NOT NULL UNIQUE COLLATE NOCASE,
+            password VARCHAR(100) NOT NULL
+        )""",
+        STARTER_BOOKS,
+    ]),
+
+    Migration(2, "loan claim flag", [
+        add_column("borrowed_books", "is_claimed", "BOOLEAN DEFAULT FALSE"),
+    ], [
+        drop_column("borrowed_books", "is_claimed"),
+    ]),
+
+    # Loans are due at a time of day, and the app has always written one
+    Migration(3, "due_date as DATETIME", [
+        "ALTER TABLE borrowed_books MODIFY due_date DATETIME NOT NULL",
+    ], [
+        "ALTER TABLE borrowed_books MODIFY due_date DATE NOT NULL",
+    ], sqlite=[
+        # Created as DATETIME there
+    ]),
+
+    # Availability is kept on the book row so the catalog is an index range
+    # scan instead of a NOT IN over every loan. Borrow and return update it
+    # in the same transaction as the loan row.
+    Migration(4, "books.available", [
+        add_column("books", "available", "BOOLEAN NOT NULL DEFAULT TRUE"),
+        "UPDATE books SET available = (id NOT IN (SELECT book_id FROM borrowed_books))",
+        add_index("books", "idx_books_available", "available, id"),
+    ], [
+        drop_index("books", "idx_books_available"),
+        drop_column("books", "available"),
+    ]),
+
+    # Full-text index behind the catalog search bar
+    Migration(5, "catalog search index", [
+        add_index("books", "ft_books_title_author", "title, author", kind="FULLTEXT INDEX"),
+    ], [
+        drop_index("books", "ft_books_title_author"),
+    ]),
+
+    # The admin tables sort and page in SQL (ORDER BY col, id LIMIT n), so
+    # each sortable column has an index that serves that order. Overdue
+    # detection is a range on due_date and a member's loans are read by
+    # username in due date order. users(username) is already covered by its
+    # UNIQUE key and borrowed_books(book_id) by its foreign key's index.
+    Migration(6, "query plan indexes", [
+        add_index("books", "idx_books_title", "title, id"),
+        add_index("books", "idx_books_author", "author, id"),
+        add_index("borrowed_books", "idx_borrowed_username", "username, id"),
+        drop_fk_index("borrowed_books", "username"),
+        add_index("borrowed_books", "idx_borrowed_book_title", "book_title, id"),
+        add_index("borrowed_books", "idx_borrowed_due_date", "due_date, id"),
+        add_index("borrowed_books", "idx_borrowed_username_due", "username, due_date"),
+    ], [
+        drop_index("borrowed_books", "idx_borrowed_username_due"),
+        drop_index("borrowed_books", "idx_borrowed_due_date"),
+        drop_index("borrowed_books", "idx_borrowed_book_title"),
+        restore_fk_index("borrowed_books", "username"),
+        drop_index("borrowed_books", "idx_borrowed_username"),
+        drop_index("books", "idx_books_author"),
+        drop_index("books", "idx_books_title"),
+    ]),
+
+    # Loans leave borrowed_books when they end, so every row is an active
+    # loan and a book can only appear once. The key backs up the row lock
+    # in checkout_book.
+    Migration(7, "one active loan per book", [
+        refuse_duplicates("borrowed_books", "book_id"),
+        add_index("borrowed_books", "uq_borrowed_book", "book_id", kind="UNIQUE INDEX"),
+        drop_fk_index("borrowed_books", "book_id"),
+    ], [
+        restore_fk_index("borrowed_books", "book_id"),
+        drop_index("borrowed_books", "uq_borrowed_book"),
+    ]),
+
+    # Change marker for the member catalog: books changed since a client's
+    # last (updated_at, id) are read from this index
+    Migration(8, "books.updated_at", [
+        add_column("books", "updated_at",
+                   "TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)"),
+        add_index("books", "idx_books_updated", "updated_at, id"),
+    ], [
+        drop_index("books", "idx_books_updated"),
+        drop_column("books", "updated_at"),
+    ], sqlite=[
+        # An added column can't default to the time, so triggers stamp it
+        add_column("books", "updated_at", "DATETIME"),
+        f"UPDATE books SET updated_at = {SQLITE_NOW} WHERE updated_at IS NULL",
+        f"""CREATE TRIGGER IF NOT EXISTS books_inserted AFTER INSERT ON books
+        BEGIN
+            UPDATE books SET updated_at = {SQLITE_NOW} WHERE id = NEW.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS books_updated AFTER UPDATE OF title, author, available ON books
+        BEGIN
+            UPDATE books SET updated_at = {SQLITE_NOW} WHERE id = NEW.id;
+        END""",
+        add_index("books", "idx_books_updated", "updated_at, id"),
+    ]),
+
+    # Change feed: writers append an event in their own transaction and
+    # clients read the ones after the last id they saw (see ChangeFeed.py)
+    Migration(9, "change feed", [
+        """CREATE TABLE IF NOT EXISTS events (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            kind VARCHAR(20) NOT NULL,
+            book_id INT NULL,
+            loan_id INT NULL,
+            username VARCHAR(100) NULL,
+            created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+            INDEX idx_events_created (created_at)
+        )""",
+    ], [
+        "DROP TABLE IF EXISTS events",
+    ], sqlite=[
+        f"""CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind VARCHAR(20) NOT NULL,
+            book_id INT NULL,
+            loan_id INT NULL,
+            username VARCHAR(100) NULL,
+            created_at DATETIME NOT NULL DEFAULT ({SQLITE_NOW})
+        )""",
+        add_index("events", "idx_events_created", "created_at"),
+    ]),
+
+    # Penalty ledger kept by the overdue scanner (see Fines.py). A fine
+    # accrues while its loan is out and is settled when the book comes back.
+    Migration(10, "fines ledger", [
+        """CREATE TABLE IF NOT EXISTS fines (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            loan_id INT NOT NULL,
+            username VARCHAR(100) NOT NULL,
+            book_id INT NOT NULL,
+            book_title VARCHAR(255) NOT NULL,
+            due_date DATETIME NOT NULL,
+            days INT NOT NULL,
+            amount DECIMAL(10, 2) NOT NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'accruing',
+            next_accrual DATETIME NOT NULL,
+            settled_at DATETIME NULL,
+            UNIQUE KEY uq_fines_loan (loan_id),
+            INDEX idx_fines_accrual (status, next_accrual),
+            INDEX idx_fines_member (username, status)
+        )""",
+        """CREATE TABLE IF NOT EXISTS scheduled_jobs (
+            name VARCHAR(50) PRIMARY KEY,
+            last_run DATETIME(6) NOT NULL
+        )""",
+    ], [
+        "DROP TABLE IF EXISTS scheduled_jobs",
+        "DROP TABLE IF EXISTS fines",
+    ], sqlite=[
+        """CREATE TABLE IF NOT EXISTS fines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            loan_id INT NOT NULL UNIQUE,
+            username VARCHAR(100) NOT NULL COLLATE NOCASE,
+            book_id INT NOT NULL,
+            book_title VARCHAR(255) NOT NULL,
+            due_date DATETIME NOT NULL,
+            days INT NOT NULL,
+            amount DECIMAL(10, 2) NOT NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'accruing',
+            next_accrual DATETIME NOT NULL,
+            settled_at DATETIME NULL
+        )""",
+        add_index("fines", "idx_fines_accrual", "status, next_accrual"),
+        add_index("fines", "idx_fines_member", "username, status"),
+        """CREATE TABLE IF NOT EXISTS scheduled_jobs (
+            name VARCHAR(50) PRIMARY KEY,
+            last_run DATETIME NOT NULL
+        )""",
+    ]),
+
+    # Returns move loans to a history table partitioned by month (see
+    # LoanHistory.py), so borrowed_books only holds active loans
+    Migration(11, "loan history", [
+        add_column("borrowed_books", "borrowed_at", "DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP"),
+        create_history_table,
+    ], [
+        "DROP TABLE IF EXISTS loan_history",
+        drop_column("borrowed_books", "borrowed_at"),
+    ], sqlite=[
+        add_column("borrowed_books", "borrowed_at", "DATETIME"),
+        f"UPDATE borrowed_books SET borrowed_at = {SQLITE_NOW} WHERE borrowed_at IS NULL",
+        f"""CREATE TRIGGER IF NOT EXISTS borrowed_books_inserted AFTER INSERT ON borrowed_books
+        WHEN NEW.borrowed_at IS NULL
+        BEGIN
+            UPDATE borrowed_books SET borrowed_at = {SQLITE_NOW} WHERE id = NEW.id;
+        END""",
+        # Not partitioned: a file this size is read whole anyway
+        """CREATE TABLE IF NOT EXISTS loan_history (
+            id INT NOT NULL,
+            username VARCHAR(100) NOT NULL COLLATE NOCASE,
+            book_id INT NOT NULL,
+            book_title VARCHAR(255) NOT NULL,
+            borrowed_at DATETIME NOT NULL,
+            due_date DATETIME NOT NULL,
+            is_claimed BOOLEAN NOT NULL DEFAULT FALSE,
+            returned_at DATETIME NOT NULL,
+            fine DECIMAL(10, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (id, returned_at)
+        )""",
+        add_index("loan_history", "idx_history_returned", "returned_at, id"),
+        add_index("loan_history", "idx_history_username", "username, returned_at"),
+        add_index("loan_history", "idx_history_book", "book_id, returned_at"),
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def _run(cursor, steps):
+    for step in steps:
+        if callable(step):
+            step(cursor)
+        else:
+            cursor.execute(step)
+
+
+def _ensure_version_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def current_version(cursor):
+    if not table_exists(cursor, VERSION_TABLE):
+        return 0
+    cursor.execute(f"SELECT COALESCE(MAX(version), 0) FROM {VERSION_TABLE}")
+    return cursor.fetchone()[0]
+
+
+def _locked(fn):
+    # Only one process migrates at a time
+    def wrapper(conn, *args):
+        cursor = conn.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, 30)", (LOCK_NAME,))
+        if cursor.fetchone()[0] != 1:
+            cursor.close()
+            raise SchemaError("Another migration is already running")
+        try:
+            return fn(conn, cursor, *args)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cursor.fetchone()
+            cursor.close()
+    return wrapper
+
+
+@_locked
+def migrate(conn, cursor, target=LATEST_VERSION):
+    # Returns the versions applied
+    _ensure_version_table(cursor)
+    version = current_version(cursor)
+    applied = []
+    for migration in MIGRATIONS:
+        if version < migration.version <= target:
+            _run(cursor, migration.steps())
+            cursor.execute(f"INSERT INTO {VERSION_TABLE} (version, name) VALUES (%s, %s)",
+                           (migration.version, migration.name))
+            conn.commit()
+            applied.append(migration.version)
+    return applied
+
+
+@_locked
+def rollback(conn, cursor, target):
+    # Undoes every applied migration above `target`, newest first
+    if _sqlite():
+        raise SchemaError("Rollback is only supported on MySQL; start a new SQLite file instead")
+    version = current_version(cursor)
+    undone = []
+    for migration in reversed(MIGRATIONS):
+        if target < migration.version <= version:
+            _run(cursor, migration.down)
+            cursor.execute(f"DELETE FROM {VERSION_TABLE} WHERE version = %s", (migration.version,))
+            conn.commit()
+            undone.append(migration.version)
+    return undone
+
+
+def create_database(name=None):
+    Database.get_backend().create_database(name or Database.DB_CONFIG["database"])
+
+
+def check_schema():
+    # Called at startup: refuses to run the apps against a database that
+    # hasn't been migrated to the version this code expects.
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        version = current_version(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+    if version < LATEST_VERSION:
+        raise SchemaError(
+            f"Database schema is at version {version} but this version of the app needs "
+            f"{LATEST_VERSION}. Run: python Migrations.py migrate")
+    if version > LATEST_VERSION:
+        raise SchemaError(
+            f"Database schema is at version {version}, newer than this app ({LATEST_VERSION}). "
+            f"Please update the app.")
+    return version
+
+
+def main(argv):
+    if not argv or argv[0] not in ("status", "migrate", "rollback"):
+        print("usage: python Migrations.py status | migrate [version] | rollback <version>")
+        return 1
+    command = argv[0]
+    if command == "rollback" and len(argv) < 2:
+        print("rollback needs a target version (0 undoes everything)")
+        return 1
+
+    conn = None
+    try:
+        if command == "migrate":
+            create_database()
+        conn = get_db_connection()
+        if command == "status":
+            cursor = conn.cursor()
+            version = current_version(cursor)
+            cursor.close()
+            for migration in MIGRATIONS:
+                mark = "x" if migration.version <= version else " "
+                print(f"[{mark}] {migration.version:>3}  {migration.name}")
+            print(f"schema version {version}, latest {LATEST_VERSION}")
+        elif command == "migrate":
+            target = int(argv[1]) if len(argv) > 1 else LATEST_VERSION
+            applied = migrate(conn, target)
+            print(f"applied: {applied or 'nothing to do'}")
+        else:
+            undone = rollback(conn, int(argv[1]))
+            print(f"rolled back: {undone or 'nothing to do'}")
+    except (SchemaError, mysql.connector.Error) as e:
+        print(f"[error] {e}")
+        return 1
+    finally:
+        if conn is not None:
+            conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,81 @@
+# Password hashing for both apps, run on a bounded worker pool
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get("LIBRARY_BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.environ.get("LIBRARY_HASH_WORKERS", str(os.cpu_count() or 2)))
+
+_ROUNDS_RE = re.compile(rb"^\$2[abxy]?\$(\d{2})\$")
+
+
+def _to_bytes(value):
+    return value.encode("utf-8") if isinstance(value, str) else value
+
+
+def hash_rounds(hashed):
+    match = _ROUNDS_RE.match(_to_bytes(hashed) or b"")
+    return int(match.group(1)) if match else None
+
+
+class PasswordService:
+    # bcrypt releases the GIL while it works, so a thread pool sized to the
+    # CPU count gives real parallelism. The sync methods still go through
+    # the pool: that caps how many hashes run at once no matter how many
+    # query threads are waiting on a login.
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=HASH_WORKERS):
+        self.rounds = rounds
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    def _hash(self, password):
+        return bcrypt.hashpw(_to_bytes(password), bcrypt.gensalt(self.rounds)).decode("utf-8")
+
+    def _verify(self, password, hashed):
+        if not hashed:
+            return False
+        try:
+            return bcrypt.checkpw(_to_bytes(password), _to_bytes(hashed))
+        except ValueError:
+            # Not a bcrypt hash at all
+            return False
+
+    def submit_hash(self, password):
+        return self._pool.submit(self._hash, password)
+
+    def submit_verify(self, password, hashed):
+        return self._pool.submit(self._verify, password, hashed)
+
+    def hash(self, password):
+        return self.submit_hash(password).result()
+
+    def verify(self, password, hashed):
+        return self.submit_verify(password, hashed).result()
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def verify_and_upgrade(self, password, hashed):
+        # Returns (ok, new_hash). new_hash is only set when the password
+        # matched and the stored hash was made with a different cost.
+        if not self.verify(password, hashed):
+            return False, None
+        if self.needs_rehash(hashed):
+            return True, self.hash(password)
+        return True, None
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_password_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = PasswordService()
+        return _service
@@ -0,0 +1,320 @@
+# Data access for the member and admin apps.
+#
+# A repository wraps one pooled connection and owns the SQL for its tables;
+# the Qt handlers and the executor's fetch functions call these methods
+# instead of writing queries. Statements run on prepared cursors cached
+# with the connection (PooledConnection.statement), so the server parses a
+# hot statement once per connection rather than on every call. Rows come
+# back as named tuples, which still index and unpack like the plain tuples
+# the views were written against.
+#
+# Write methods record their change feed events but don't commit: the
+# caller commits, so one action is one transaction however many
+# repositories it uses. Each event also drops what it makes stale from the
+# read-through caches (Cache.py), once that commit has happened.
+#
+# Every statement is timed under "<Repository>.<method>"; query_stats()
+# has the totals, so a statement can be benchmarked without any Qt.
+import re
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from functools import partial
+from Database import dialect
+from Cache import invalidate_event
+from ChangeFeed import (
+    RECORD_EVENT, BORROWED, RETURNED, LOAN_EDITED, BOOK_ADDED, BOOK_EDITED, BOOK_DELETED,
+    MEMBER_ADDED, MEMBER_EDITED, MEMBER_DELETED,
+)
+from Fines import settle_fine, reassess_fine
+from LoanHistory import archive_loan
+
+# Row types
+Book = namedtuple("Book", "id title author")
+BookChange = namedtuple("BookChange", "id title author available updated_at")
+BookLock = namedtuple("BookLock", "title available")
+MemberLoan = namedtuple("MemberLoan", "book_title due_date is_claimed")
+LoanStatus = namedtuple("LoanStatus", "book_title due_date is_claimed overdue_secs fine_days fine_amount")
+LoanOwner = namedtuple("LoanOwner", "book_id username")
+Credentials = namedtuple("Credentials", "id password")
+
+# InnoDB's full-text parser ignores words shorter than innodb_ft_min_token_size
+FULLTEXT_MIN_WORD = 3
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(name, elapsed, rows):
+    with _stats_lock:
+        entry = _stats.get(name)
+        if entry is None:
+            entry = _stats[name] = {"calls": 0, "time": 0.0, "max": 0.0, "rows": 0}
+        entry["calls"] += 1
+        entry["time"] += elapsed
+        entry["max"] = max(entry["max"], elapsed)
+        entry["rows"] += rows
+
+
+def query_stats():
+    # {statement: {calls, time, max, rows}}, times in seconds
+    with _stats_lock:
+        return {name: dict(entry) for name, entry in _stats.items()}
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def build_fulltext_query(term):
+    # "tolk hob" -> "+tolk* +hob*": every word must match, each as a prefix
+    words = re.findall(r"\w+", term)
+    return " ".join(f"+{word}*" for word in words if len(word) >= FULLTEXT_MIN_WORD)
+
+
+def escape_like(text):
+    return text.replace("%", r"\%").replace("_", r"\_")
+
+
+class Repository:
+    def __init__(self, conn, prepared=True):
+        # prepared=False runs the same SQL on plain cursors, for comparison
+        self.conn = conn
+        self.prepared = prepared
+
+    def _execute(self, method, operation, params=(), cached=True):
+        # Runs one statement and reads its rows. Returns (rows, lastrowid);
+        # rows is None for a statement without a result. cached=False is
+        # for SQL built per call, which would only fill the statement cache.
+        prepared = self.prepared and cached
+        cursor = self.conn.statement(operation) if prepared else self.conn.cursor()
+        try:
+            start = time.perf_counter()
+            cursor.execute(operation, params)
+            rows = cursor.fetchall() if cursor.description else None
+            _record(f"{type(self).__name__}.{method}", time.perf_counter() - start, len(rows or ()))
+            return rows, cursor.lastrowid
+        finally:
+            if not prepared:
+                cursor.close()
+
+    def _all(self, method, row_type, operation, params=(), cached=True):
+        rows, _ = self._execute(method, operation, params, cached)
+        return [row_type(*row) for row in rows]
+
+    def _one(self, method, row_type, operation, params=()):
+        rows = self._all(method, row_type, operation, params)
+        return rows[0] if rows else None
+
+    def _scalar(self, method, operation, params=()):
+        rows, _ = self._execute(method, operation, params)
+        return rows[0][0] if rows else None
+
+    def _write(self, method, operation, params=()):
+        # Returns the new row's id for an INSERT
+        return self._execute(method, operation, params)[1]
+
+    def _event(self, kind, book_id=None, loan_id=None, username=None):
+        # ChangeFeed.record_event's statement, prepared like the rest
+        self._write("record_event", RECORD_EVENT, (kind, book_id, loan_id, username))
+        self.conn.after_commit(partial(invalidate_event, kind, book_id, loan_id, username))
+
+    def _helper(self, fn, *args, **kwargs):
+        # The fines and history helpers take a cursor and run their own SQL
+        cursor = self.conn.cursor()
+        try:
+            return fn(cursor, *args, **kwargs)
+        finally:
+            cursor.close()
+
+
+class BookRepository(Repository):
+    def available_page(self, after_id, limit):
+        return self._all("available_page", Book, """
+            SELECT id, title, author FROM books
+            WHERE available = 1 AND id > %s
+            ORDER BY id LIMIT %s
+        """, (after_id, limit))
+
+    def latest_change(self):
+        # (updated_at, id) of the most recently changed book, or None
+        rows, _ = self._execute("latest_change",
+                                "SELECT updated_at, id FROM books ORDER BY updated_at DESC, id DESC LIMIT 1")
+        return tuple(rows[0]) if rows else None
+
+    def changes_after(self, updated_at, book_id, limit):
+        return self._all("changes_after", BookChange, """
+            SELECT id, title, author, available, updated_at FROM books
+            WHERE updated_at > %s OR (updated_at = %s AND id > %s)
+            ORDER BY updated_at, id LIMIT %s
+        """, (updated_at, updated_at, book_id, limit))
+
+    def changes_for(self, book_ids):
+        # The current rows of the given books; deleted ones are left out
+        placeholders = ", ".join(["%s"] * len(book_ids))
+        return self._all("changes_for", BookChange, f"""
+            SELECT id, title, author, available, updated_at FROM books
+            WHERE id IN ({placeholders}) ORDER BY id
+        """, tuple(book_ids), cached=False)
+
+    def search_available(self, term, limit):
+        query = build_fulltext_query(term)
+        if dialect() == "sqlite":
+            # No full-text index there: every word must appear in the title
+            # or author
+            words = re.findall(r"\w+", term) or [term.strip()]
+            patterns = ["%" + escape_like(word) + "%" for word in words]
+            return self._all("search_available", Book, f"""
+                SELECT id, title, author FROM books
+                WHERE {" AND ".join(["(title LIKE %s OR author LIKE %s)"] * len(patterns))}
+                  AND available = 1
+                ORDER BY title, id
+                LIMIT %s
+            """, (*[p for pattern in patterns for p in (pattern, pattern)], limit), cached=False)
+        if query:
+            return self._all("search_available", Book, """
+                SELECT id, title, author FROM books
+                WHERE MATCH(title, author) AGAINST (%s IN BOOLEAN MODE)
+                  AND available = 1
+                ORDER BY MATCH(title, author) AGAINST (%s IN BOOLEAN MODE) DESC, id
+                LIMIT %s
+            """, (query, query, limit))
+        # Too short for the full-text index; fall back to a plain prefix match
+        prefix = escape_like(term.strip()) + "%"
+        return self._all("search_available", Book, """
+            SELECT id, title, author FROM books
+            WHERE (title LIKE %s OR author LIKE %s)
+              AND available = 1
+            ORDER BY title, id
+            LIMIT %s
+        """, (prefix, prefix, limit))
+
+    def lock(self, book_id):
+        # Locks the book row for the rest of the transaction; a second
+        # borrower blocks here until the first commits
+        return self._one("lock", BookLock, "SELECT title, available FROM books WHERE id = %s FOR UPDATE",
+                         (book_id,))
+
+    def set_available(self, book_id, available):
+        self._write("set_available", "UPDATE books SET available = %s WHERE id = %s", (int(available), book_id))
+
+    def add(self, title, author):
+        book_id = self._write("add", "INSERT INTO books (title, author) VALUES (%s, %s)", (title, author))
+        self._event(BOOK_ADDED, book_id)
+        return book_id
+
+    def edit(self, book_id, title, author, available):
+        # A book out on loan stays unavailable whatever the admin asked for
+        self._write("edit", """
+            UPDATE books SET title = %s, author = %s,
+                available = IF(EXISTS (SELECT 1 FROM borrowed_books WHERE book_id = %s), 0, %s)
+            WHERE id = %s
+        """, (title, author, book_id, int(available), book_id))
+        self._event(BOOK_EDITED, book_id)
+
+    def is_on_loan(self, book_id):
+        return self._scalar("is_on_loan", "SELECT COUNT(*) FROM borrowed_books WHERE book_id = %s",
+                            (book_id,)) > 0
+
+    def delete(self, book_id):
+        self._write("delete", "DELETE FROM books WHERE id = %s", (book_id,))
+        self._event(BOOK_DELETED, book_id)
+
+
+class LoanRepository(Repository):
+    def for_member(self, username):
+        return self._all("for_member", MemberLoan, """
+            SELECT book_title, due_date, is_claimed FROM borrowed_books
+            WHERE username = %s
+            ORDER BY due_date
+        """, (username,))
+
+    def count_for_member(self, username):
+        return self._scalar("count_for_member", "SELECT COUNT(*) FROM borrowed_books WHERE username = %s",
+                            (username,))
+
+    def statuses_for_member(self, username, now=None):
+        # A member's loans with their overdue seconds and ledger fine
+        return self._all("statuses_for_member", LoanStatus, """
+            SELECT b.book_title, b.due_date, b.is_claimed,
+                   TIMESTAMPDIFF(SECOND, b.due_date, %s), f.days, f.amount
+            FROM borrowed_books b LEFT JOIN fines f ON f.loan_id = b.id
+            WHERE b.username = %s
+            ORDER BY b.due_date
+        """, (now or datetime.now(), username))
+
+    def is_claimed(self, loan_id):
+        # None if there is no such loan
+        rows, _ = self._execute("is_claimed", "SELECT is_claimed FROM borrowed_books WHERE id = %s", (loan_id,))
+        return bool(rows[0][0]) if rows else None
+
+    def create(self, username, book_id, book_title, due_date):
+        loan_id = self._write("create", """
+            INSERT INTO borrowed_books (username, book_id, book_title, due_date)
+            VALUES (%s, %s, %s, %s)
+        """, (username, book_id, book_title, due_date))
+        self._event(BORROWED, book_id, loan_id, username)
+        return loan_id
+
+    def edit(self, loan_id, book_id, username, due_date, is_claimed):
+        self._write("edit", "UPDATE borrowed_books SET due_date = %s, is_claimed = %s WHERE id = %s",
+                    (due_date, is_claimed, loan_id))
+        self._helper(reassess_fine, loan_id)
+        self._event(LOAN_EDITED, book_id, loan_id, username)
+
+    def release(self, loan_id, paid=False):
+        # Ends a loan, settles its fine (as paid if it was collected), moves
+        # it to the loan history and puts its book back on the shelf. The
+        # caller commits and then invalidates the returned book id's
+        # availability. None if there was no such loan.
+        owner = self._one("release", LoanOwner, "SELECT book_id, username FROM borrowed_books WHERE id = %s",
+                          (loan_id,))
+        if owner is None:
+            return None
+        fine = self._helper(settle_fine, loan_id, paid)
+        self._helper(archive_loan, loan_id, fine)
+        BookRepository(self.conn, self.prepared).set_available(owner.book_id, True)
+        self._event(RETURNED, owner.book_id, loan_id, owner.username)
+        return owner.book_id
+
+
+class UserRepository(Repository):
+    def password(self, username):
+        return self._scalar("password", "SELECT password FROM users WHERE username = %s", (username,))
+
+    def set_password(self, username, hashed):
+        self._write("set_password", "UPDATE users SET password = %s WHERE username = %s", (hashed, username))
+
+    def add(self, username, hashed):
+        self._write("add", "INSERT INTO users (username, password) VALUES (%s, %s)", (username, hashed))
+        self._event(MEMBER_ADDED, username=username)
+
+    def rename(self, user_id, old_name, new_name):
+        # Loans, fines and history follow the member to the new name
+        self._write("rename", "UPDATE users SET username = %s WHERE id = %s", (new_name, user_id))
+        for table in ("borrowed_books", "fines", "loan_history"):
+            self._write("rename", f"UPDATE {table} SET username = %s WHERE username = %s", (new_name, old_name))
+        # The old name's row goes and the new one's arrives
+        self._event(MEMBER_EDITED, username=old_name)
+        self._event(MEMBER_EDITED, username=new_name)
+
+    def delete(self, user_id, username):
+        self._write("delete", "DELETE FROM users WHERE id = %s", (user_id,))
+        self._event(MEMBER_DELETED, username=username)
+
+
+class AdminRepository(Repository):
+    def credentials(self, username):
+        return self._one("credentials", Credentials, "SELECT adminid, password FROM admins WHERE username = %s",
+                         (username,))
+
+    def set_password(self, admin_id, hashed):
+        self._write("set_password", "UPDATE admins SET password = %s WHERE adminid = %s", (hashed, admin_id))
+
+    def add(self, username, hashed):
+        self._write("add", "INSERT INTO admins (username, password) VALUES (%s, %s)", (username, hashed))
+
+    def delete(self, admin_id):
+        self._write("delete", "DELETE FROM admins WHERE adminid = %s", (admin_id,))
@@ -0,0 +1,1388 @@
+# Checks and benchmarks for the library apps.
+# Run one with:  python Tester.py <name> [args...]
+# Qt runs on the offscreen platform, so no display is needed.
+import os
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer, QEventLoop
+
+CHECKS = {}
+
+
+def check(fn):
+    CHECKS[fn.__name__] = fn
+    return fn
+
+
+def get_app():
+    return QApplication.instance() or QApplication(sys.argv[:1])
+
+
+@check
+def event_loop_latency(delay="2.0", tick_ms="10"):
+    # A query delayed by `delay` seconds runs on the executor while a timer
+    # measures how long the event loop goes between ticks.
+    from Workers import QueryExecutor
+
+    delay, tick_ms = float(delay), int(tick_ms)
+    app = get_app()
+    executor = QueryExecutor()
+    loop = QEventLoop()
+    gaps = []
+    last = [time.perf_counter()]
+    result = {}
+
+    def tick():
+        now = time.perf_counter()
+        gaps.append(now - last[0])
+        last[0] = now
+
+    def slow_query():
+        time.sleep(delay)
+        return [(1, "Slow Book", "Someone")]
+
+    def done(rows):
+        result["rows"] = rows
+        loop.quit()
+
+    timer = QTimer()
+    timer.timeout.connect(tick)
+    timer.start(tick_ms)
+    executor.submit("latency", slow_query, on_result=done, on_error=lambda e: loop.quit())
+
+    # A second submit for another key that is immediately superseded must
+    # never reach its callback.
+    executor.submit("stale", slow_query, on_result=lambda rows: result.setdefault("stale", rows))
+    executor.cancel("stale")
+
+    loop.exec_()
+    timer.stop()
+    executor.wait_for_done()
+    app.processEvents()
+
+    worst_ms = max(gaps) * 1000
+    print(f"ticks during query : {len(gaps)}")
+    print(f"worst tick gap     : {worst_ms:.1f} ms (tick {tick_ms} ms)")
+    assert result.get("rows"), "slow query result never arrived"
+    assert "stale" not in result, "stale result was delivered"
+    assert not executor._generations and not executor._pending, "executor still holds finished keys"
+    assert worst_ms < tick_ms * 10, "event loop stalled while the query was in flight"
+    print("event loop stayed responsive")
+
+
+@check
+def login_throughput(concurrency="8", attempts="64", rounds="12"):
+    # Logins/sec when `concurrency` kiosks verify passwords at once. Only the
+    # bcrypt step is measured; the SELECT is negligible next to it.
+    from concurrent.futures import ThreadPoolExecutor
+    from Passwords import PasswordService
+
+    concurrency, attempts, rounds = int(concurrency), int(attempts), int(rounds)
+    service = PasswordService(rounds=rounds)
+    stored = service.hash("correct horse")
+
+    start = time.perf_counter()
+    for _ in range(min(attempts, 4)):
+        service.verify("correct horse", stored)
+    serial = min(attempts, 4) / (time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as kiosks:
+        start = time.perf_counter()
+        results = list(kiosks.map(lambda _: service.verify("correct horse", stored), range(attempts)))
+        elapsed = time.perf_counter() - start
+
+    assert all(results)
+    ok, upgraded = PasswordService(rounds=rounds - 1).verify_and_upgrade("correct horse", stored)
+    assert ok and upgraded and upgraded != stored, "hash was not upgraded to the new cost"
+    service.shutdown()
+
+    print(f"bcrypt cost          : {rounds}")
+    print(f"serial               : {serial:.1f} logins/sec")
+    print(f"{concurrency} concurrent attempts : {attempts / elapsed:.1f} logins/sec")
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@check
+def catalog_render(sizes="1000,10000,100000"):
+    # Time-to-first-paint and RSS growth of the Home catalog for generated
+    # catalogs. Pages come from an in-memory list so only the view is timed.
+    from Catalog import BookListModel, BookCardDelegate, CatalogView
+
+    app = get_app()
+
+    class CountingDelegate(BookCardDelegate):
+        painted = 0
+
+        def paint(self, painter, option, index):
+            CountingDelegate.painted += 1
+            super().paint(painter, option, index)
+
+    for size in (int(n) for n in sizes.split(",")):
+        books = [(i, f"Generated Title {i}", f"Author {i % 997}") for i in range(1, size + 1)]
+
+        def fetch_page(after_id, limit):
+            return books[after_id:after_id + limit]
+
+        app.processEvents()
+        rss_before = current_rss_mb()
+        CountingDelegate.painted = 0
+
+        start = time.perf_counter()
+        model = BookListModel(fetch_page)
+        view = CatalogView()
+        view.setItemDelegate(CountingDelegate(view))
+        view.setModel(model)
+        view.resize(900, 700)
+        view.show()
+        while not CountingDelegate.painted:
+            app.processEvents()
+        first_paint = time.perf_counter() - start
+
+        # Scroll to the bottom a few times to pull more pages in
+        for _ in range(5):
+            view.verticalScrollBar().setValue(view.verticalScrollBar().maximum())
+            app.processEvents()
+        rss_after = current_rss_mb()
+
+        print(f"{size:>7} books: first paint {first_paint * 1000:7.1f} ms, "
+              f"rows loaded {model.rowCount():>5}, cards painted {CountingDelegate.painted:>4}, "
+              f"RSS +{rss_after - rss_before:.1f} MB")
+        view.close()
+        view.deleteLater()
+        app.processEvents()
+
+
+# Benchmarks that need a database work in their own scratch one so they
+# never touch the real catalog: LIBRARY_BENCH_DB on the MySQL server, or
+# LIBRARY_BENCH_DB.sqlite3 with LIBRARY_DB_BACKEND=sqlite. The MySQL-only
+# ones (EXPLAIN plans, partitions) say so.
+BENCH_DATABASE = os.environ.get("LIBRARY_BENCH_DB", "LibraryDb_bench")
+
+WORDS = (
+    "shadow river garden winter silent empire crimson dragon forest ocean "
+    "midnight golden broken secret lost city storm glass iron summer "
+    "whisper kingdom star harbor memory orchard lantern hollow machine "
+    "desert island mountain letter daughter stranger journey circle"
+).split()
+SURNAMES = "Lee Orwell Austen Tolkien Morrison Garcia Okafor Tanaka Novak Silva".split()
+
+
+def use_bench_database():
+    import Database
+    from Migrations import create_database, migrate
+
+    create_database(BENCH_DATABASE)
+    Database.close_pool()
+    Database.DB_CONFIG["database"] = BENCH_DATABASE
+    Database.SQLITE_PATH = None
+    conn = Database.get_db_connection()
+    migrate(conn)
+    return conn
+
+
+def seed_books(conn, count, batch=5000):
+    import random
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM books")
+    existing = cursor.fetchone()[0]
+    rng = random.Random(existing)
+    for start in range(existing, count, batch):
+        rows = [
+            (" ".join(rng.choice(WORDS).title() for _ in range(rng.randint(2, 4))) + f" {n}",
+             f"{rng.choice(WORDS).title()} {rng.choice(SURNAMES)}")
+            for n in range(start, min(start + batch, count))
+        ]
+        cursor.executemany("INSERT INTO books (title, author) VALUES (%s, %s)", rows)
+        conn.commit()
+    cursor.close()
+    return max(existing, count)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+@check
+def search_latency(books="1000000", queries="200"):
+    # p50/p99 of the Home search query against a generated catalog
+    import random
+    from Main import search_available_books
+
+    books, queries = int(books), int(queries)
+    conn = use_bench_database()
+    total = seed_books(conn, books)
+    conn.close()
+
+    rng = random.Random(42)
+    terms = []
+    for _ in range(queries):
+        words = rng.sample(WORDS, rng.randint(1, 2))
+        # Mostly what someone has half typed: a prefix of each word
+        terms.append(" ".join(w[:rng.randint(3, len(w))] for w in words))
+
+    samples = []
+    for term in terms:
+        start = time.perf_counter()
+        search_available_books(term)
+        samples.append(time.perf_counter() - start)
+
+    print(f"catalog size : {total}")
+    print(f"queries      : {len(samples)}")
+    print(f"p50          : {percentile(samples, 50) * 1000:.1f} ms")
+    print(f"p99          : {percentile(samples, 99) * 1000:.1f} ms")
+
+
+def seed_users(conn, count, batch=5000):
+    # Password hashes are placeholders: these accounts are never logged into
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM users WHERE username LIKE 'member%'")
+    existing = cursor.fetchone()[0]
+    for start in range(existing, count, batch):
+        rows = [(f"member{n:07d}", "$2b$12$placeholder") for n in range(start, min(start + batch, count))]
+        cursor.executemany("INSERT INTO users (username, password) VALUES (%s, %s)", rows)
+        conn.commit()
+    cursor.close()
+    return max(existing, count)
+
+
+def seed_loans(conn, count, members=1000, books=10000, overdue_share=0.3, batch=5000):
+    # Loans spread over `members` users, one per book (a book can only be
+    # out once), with about `overdue_share` of them already past due
+    import random
+    from datetime import datetime, timedelta
+
+    seed_users(conn, members)
+    seed_books(conn, max(books, count))
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM borrowed_books")
+    existing = cursor.fetchone()[0]
+    cursor.execute("SELECT id FROM books WHERE available = 1 ORDER BY id LIMIT %s", (max(0, count - existing),))
+    book_ids = [row[0] for row in cursor.fetchall()]
+    rng = random.Random(existing)
+    rng.shuffle(book_ids)
+    now = datetime.now()
+    for start in range(0, len(book_ids), batch):
+        rows = []
+        for book_id in book_ids[start:start + batch]:
+            days = rng.uniform(-60, 0) if rng.random() < overdue_share else rng.uniform(0, 14)
+            rows.append((f"member{rng.randrange(members):07d}", book_id, f"Book {book_id}",
+                         (now + timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')))
+        cursor.executemany(
+            "INSERT INTO borrowed_books (username, book_id, book_title, due_date) VALUES (%s, %s, %s, %s)", rows)
+        placeholders = ", ".join(["%s"] * len(rows))
+        cursor.execute(f"UPDATE books SET available = 0 WHERE id IN ({placeholders})", [row[1] for row in rows])
+        conn.commit()
+    cursor.close()
+    return existing + len(book_ids)
+
+
+@check
+def members_query_count(sizes="10,1000,20000"):
+    # Loading the Members view must cost the same number of queries no
+    # matter how many members there are.
+    import Database
+    from Admin import MEMBERS_TABLE
+    from AdminTables import fetch_page
+
+    conn = use_bench_database()
+    counts = {}
+    for size in (int(n) for n in sizes.split(",")):
+        seed_users(conn, size)
+        before = Database.pool_stats()["queries"]
+        start = time.perf_counter()
+        rows = fetch_page(MEMBERS_TABLE)
+        elapsed = time.perf_counter() - start
+        counts[size] = Database.pool_stats()["queries"] - before
+        print(f"{size:>7} members: {counts[size]} queries, {len(rows)} rows, {elapsed * 1000:.1f} ms")
+    conn.close()
+
+    assert len(set(counts.values())) == 1, f"query count grows with member count: {counts}"
+    print("query count is constant")
+
+
+@check
+def admin_page_cost(sizes="10000,100000,1000000", pages="20"):
+    # The admin grid fetches one keyset page at a time, so the first page and
+    # the Nth page should cost about the same whatever the table size.
+    from Admin import BOOKS_TABLE
+    from AdminTables import fetch_page
+
+    pages = int(pages)
+    conn = use_bench_database()
+    for size in (int(n) for n in sizes.split(",")):
+        seed_books(conn, size)
+        for sort_column in (0, 1):
+            samples, after = [], None
+            for _ in range(pages):
+                start = time.perf_counter()
+                rows = fetch_page(BOOKS_TABLE, sort_column, after=after)
+                samples.append(time.perf_counter() - start)
+                if not rows:
+                    break
+                after = (rows[-1][sort_column], rows[-1][0])
+            print(f"{size:>8} books, sort by {BOOKS_TABLE.columns[sort_column].header:<5}: "
+                  f"first page {samples[0] * 1000:6.1f} ms, page {len(samples)} {samples[-1] * 1000:6.1f} ms")
+    conn.close()
+
+
+@check
+def admin_action_column(sizes="1000,10000"):
+    # Builds an admin grid of `size` loans with Edit / Return actions, first
+    # the old way (a QWidget, layout and two QPushButtons per row) and then
+    # with the model and painted action column. Rows come from memory so
+    # only the widgets are measured.
+    from PyQt5.QtWidgets import QWidget, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem
+    from Admin import BORROWED_TABLE
+    from Theme import set_role
+    from AdminTables import AdminTableModel, AdminTableView
+
+    app = get_app()
+    for size in (int(n) for n in sizes.split(",")):
+        loans = [(i, f"member{i % 500}", i, f"Book {i}", "2030-01-01 00:00:00", i % 2)
+                 for i in range(1, size + 1)]
+
+        def fetch(spec, sort_column, descending, filter_text, after, limit):
+            start = after[1] if after else 0
+            return loans[start:start + limit]
+
+        def build_widgets():
+            table = QTableWidget(len(loans), 7)
+            for i, row in enumerate(loans):
+                for j in range(6):
+                    table.setItem(i, j, QTableWidgetItem(str(row[j])))
+                cell = QWidget()
+                layout = QHBoxLayout(cell)
+                layout.setContentsMargins(0, 0, 0, 0)
+                for label in ("Edit", "Return"):
+                    btn = QPushButton(label)
+                    set_role(btn, "admin")
+                    layout.addWidget(btn)
+                table.setCellWidget(i, 6, cell)
+            return table
+
+        def build_delegate():
+            table = AdminTableView()
+            model = AdminTableModel(fetch=fetch, page_size=size, parent=table)
+            table.setModel(model)
+            model.set_spec(BORROWED_TABLE, [("Edit", print), ("Return", print)])
+            return table
+
+        for name, build in (("cell widgets", build_widgets), ("delegate", build_delegate)):
+            app.processEvents()
+            rss_before = current_rss_mb()
+            widgets_before = len(app.allWidgets())
+            start = time.perf_counter()
+            table = build()
+            table.resize(1000, 700)
+            table.show()
+            app.processEvents()
+            elapsed = time.perf_counter() - start
+            print(f"{size:>6} loans, {name:<12}: built in {elapsed * 1000:8.1f} ms, "
+                  f"{len(app.allWidgets()) - widgets_before:>6} widgets, "
+                  f"RSS {current_rss_mb() - rss_before:+.1f} MB")
+            table.close()
+            table.deleteLater()
+            app.processEvents()
+
+
+@check
+def overdue_latency(loans="1000000", pages="10"):
+    # Opening and scrolling the Overdue view over a large loan table. Days
+    # overdue come from SQL and the penalty from the fines ledger, so this
+    # is the whole cost.
+    from Admin import OVERDUE_TABLE
+    from AdminTables import fetch_page
+
+    pages = int(pages)
+    conn = use_bench_database()
+    total = seed_loans(conn, int(loans))
+
+    cursor = conn.cursor()
+    now = OVERDUE_TABLE.params()[-1]
+    cursor.execute("EXPLAIN SELECT id FROM borrowed_books WHERE due_date < %s "
+                   "ORDER BY due_date, id LIMIT 100", (now,))
+    columns = [d[0] for d in cursor.description]
+    plan = dict(zip(columns, cursor.fetchone()))
+    cursor.close()
+    conn.close()
+
+    samples, after = [], None
+    for _ in range(pages):
+        start = time.perf_counter()
+        rows = fetch_page(OVERDUE_TABLE, after=after)
+        samples.append(time.perf_counter() - start)
+        if not rows:
+            break
+        after = (rows[-1][4], rows[-1][0])
+
+    print(f"loans        : {total}")
+    print(f"plan         : key={plan.get('key')} type={plan.get('type')} extra={plan.get('Extra')}")
+    print(f"first page   : {samples[0] * 1000:.1f} ms")
+    print(f"page {len(samples):<8}: {samples[-1] * 1000:.1f} ms")
+    assert max(samples) < 1.0, "overdue page took longer than a second"
+
+
+@check
+def import_throughput(rows="300000", batch="1000"):
+    # Rows/sec of the bulk book import for a generated CSV, then again for
+    # the same file, where every row is a duplicate
+    import random
+    import tempfile
+    from BookImport import import_books
+
+    rows, batch = int(rows), int(batch)
+    conn = use_bench_database()
+    conn.close()
+
+    rng = random.Random(rows)
+    run = int(time.time())
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="") as f:
+        path = f.name
+        f.write("title,author\n")
+        for n in range(rows):
+            title = " ".join(rng.choice(WORDS).title() for _ in range(rng.randint(2, 4)))
+            f.write(f"{title} {run}-{n},{rng.choice(WORDS).title()} {rng.choice(SURNAMES)}\n")
+
+    try:
+        for label in ("new books", "re-import"):
+            stats = import_books(path, batch_size=batch, resume=False)
+            print(f"{label:<10}: {stats['rows']} rows in {stats['elapsed']:.1f}s, "
+                  f"{stats['rows'] / stats['elapsed']:,.0f} rows/sec, "
+                  f"{stats['inserted']} inserted, {stats['duplicates']} duplicates")
+    finally:
+        os.remove(path)
+
+
+@check
+def export_memory(sizes="100000,1000000", fmt="csv"):
+    # Peak RSS growth while exporting the loans report. It should stay flat
+    # as the loan count grows, since rows are streamed a batch at a time.
+    import tempfile
+    from Admin import BORROWED_TABLE
+    from Exports import export_report
+
+    conn = use_bench_database()
+    cursor = conn.cursor()
+    for size in (int(n) for n in sizes.split(",")):
+        # seed_loans() only tops up, so start each size from no loans
+        cursor.execute("DELETE FROM borrowed_books")
+        cursor.execute("UPDATE books SET available = 1 WHERE available = 0")
+        conn.commit()
+        seed_loans(conn, size)
+        path = os.path.join(tempfile.gettempdir(), f"loans_export.{fmt}")
+        rss_before = current_rss_mb()
+        peak = [rss_before]
+
+        def progress(rows, total):
+            peak[0] = max(peak[0], current_rss_mb())
+
+        stats = export_report(BORROWED_TABLE, path, progress=progress)
+        assert stats['rows'] == size, f"exported {stats['rows']} of {size} loans"
+        print(f"{size:>8} loans: {stats['elapsed']:.1f}s, "
+              f"{stats['rows'] / stats['elapsed']:,.0f} rows/sec, "
+              f"peak RSS +{peak[0] - rss_before:.1f} MB, file {os.path.getsize(path) / 2**20:.1f} MB")
+        os.remove(path)
+    cursor.close()
+    conn.close()
+
+
+@check
+def availability_latency(loans="100000", batch="500", lookups="10000"):
+    # Availability checks in-process (cold, batched, cached) against
+    # spawning the CLI once per check, as callers of the old C# tool did
+    import random
+    import subprocess
+    import Database
+    from Availability import AvailabilityCache
+
+    batch, lookups = int(batch), int(lookups)
+    conn = use_bench_database()
+    seed_loans(conn, int(loans))
+    conn.close()
+    rng = random.Random(7)
+    ids = [rng.randint(1, 10000) for _ in range(batch)]
+    cache = AvailabilityCache()
+
+    start = time.perf_counter()
+    cache.is_available(ids[0])
+    cold = time.perf_counter() - start
+
+    before = Database.pool_stats()["queries"]
+    start = time.perf_counter()
+    cache.availability(ids)
+    batched = time.perf_counter() - start
+    batch_queries = Database.pool_stats()["queries"] - before
+
+    start = time.perf_counter()
+    for n in range(lookups):
+        cache.is_available(ids[n % batch])
+    warm = (time.perf_counter() - start) / lookups
+
+    start = time.perf_counter()
+    for book_id in ids[:5]:
+        subprocess.run([sys.executable, "Availability.py", str(book_id)], capture_output=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                       env=dict(os.environ, LIBRARY_DB_NAME=BENCH_DATABASE))
+    spawned = (time.perf_counter() - start) / 5
+
+    print(f"single, cold      : {cold * 1000:.2f} ms")
+    print(f"batch of {batch:<8} : {batched * 1000:.2f} ms in {batch_queries} queries")
+    print(f"cached            : {warm * 1e6:.1f} us per check")
+    print(f"CLI process spawn : {spawned * 1000:.1f} ms per check")
+
+
+@check
+def borrow_race(threads="16", rounds="20"):
+    # `threads` members borrow the same book at the same moment, `rounds`
+    # times. Exactly one may win each round.
+    import threading
+    from datetime import datetime, timedelta
+    from concurrent.futures import ThreadPoolExecutor
+    from Main import checkout_book, BORROWED, ALREADY_TAKEN
+
+    threads, rounds = int(threads), int(rounds)
+    conn = use_bench_database()
+    seed_users(conn, threads)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO books (title, author) VALUES ('Race Condition', 'Contested Author')")
+    book_id = cursor.lastrowid
+    conn.commit()
+    due = (datetime.now() + timedelta(days=14)).strftime('%Y-%m-%d %H:%M:%S')
+
+    attempts, elapsed = 0, 0.0
+    with ThreadPoolExecutor(max_workers=threads) as kiosks:
+        for _ in range(rounds):
+            cursor.execute("DELETE FROM borrowed_books WHERE book_id = %s", (book_id,))
+            cursor.execute("UPDATE books SET available = 1 WHERE id = %s", (book_id,))
+            conn.commit()
+
+            barrier = threading.Barrier(threads)
+
+            def borrow(n):
+                barrier.wait()
+                return checkout_book(f"member{n:07d}", book_id, due)
+
+            start = time.perf_counter()
+            results = list(kiosks.map(borrow, range(threads)))
+            elapsed += time.perf_counter() - start
+            attempts += threads
+
+            winners = results.count(BORROWED)
+            assert winners == 1, f"{winners} borrows succeeded: {results}"
+            assert results.count(ALREADY_TAKEN) == threads - 1, results
+            cursor.execute("SELECT COUNT(*) FROM borrowed_books WHERE book_id = %s", (book_id,))
+            assert cursor.fetchone()[0] == 1, "more than one loan row for the book"
+
+    cursor.execute("DELETE FROM borrowed_books WHERE book_id = %s", (book_id,))
+    cursor.execute("DELETE FROM books WHERE id = %s", (book_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    print(f"{rounds} rounds of {threads} simultaneous borrows: exactly one winner each")
+    print(f"throughput: {attempts / elapsed:,.0f} borrow attempts/sec")
+
+
+@check
+def borrow_refresh_cost(books="10000,100000", borrows="200"):
+    # After a borrow the catalog drops one card and applies the changes
+    # since its marker. Compares that with reloading the loaded pages.
+    from Catalog import BookListModel
+
+    get_app()
+    borrows = int(borrows)
+    for size in (int(n) for n in books.split(",")):
+        catalog = [(i, f"Generated Title {i}", f"Author {i % 997}") for i in range(1, size + 1)]
+        calls = [0]
+
+        def fetch_page(after_id, limit):
+            calls[0] += 1
+            return catalog[after_id:after_id + limit]
+
+        def fetch_changes(marker, limit):
+            calls[0] += 1
+            return [], marker or (0, 0)
+
+        model = BookListModel(fetch_page, fetch_changes=fetch_changes)
+        while model.canFetchMore():
+            model.fetchMore()
+        loaded = model.rowCount()
+
+        calls[0] = 0
+        start = time.perf_counter()
+        for book_id in range(1, borrows + 1):
+            model.remove_book(book_id * (size // borrows))
+            model.sync()
+        delta = (time.perf_counter() - start) / borrows
+        delta_calls = calls[0] / borrows
+
+        calls[0] = 0
+        start = time.perf_counter()
+        for _ in range(min(borrows, 10)):
+            model.reload()
+            while model.canFetchMore():
+                model.fetchMore()
+        reload = (time.perf_counter() - start) / min(borrows, 10)
+        reload_calls = calls[0] / min(borrows, 10)
+
+        print(f"{loaded:>7} cards: delta {delta * 1000:7.3f} ms / {delta_calls:.0f} queries, "
+              f"reload {reload * 1000:8.1f} ms / {reload_calls:.0f} queries")
+
+
+@check
+def change_feed(changes="200", interval_ms="50", backlog="1000000"):
+    # Time from a borrow/return committing to another client seeing it on
+    # the change feed, and the cost of an idle read with `backlog` older
+    # events in the table.
+    import threading
+    from datetime import datetime, timedelta
+    import Database
+    from Workers import QueryExecutor
+    from ChangeFeed import ChangeFeed, fetch_events
+    from Main import checkout_book
+    from Repositories import LoanRepository
+
+    changes = int(changes)
+    app = get_app()
+    conn = use_bench_database()
+    seed_users(conn, 1)
+    seed_books(conn, 1)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM events")
+    for start in range(cursor.fetchone()[0], int(backlog), 5000):
+        cursor.executemany("INSERT INTO events (kind, book_id) VALUES (%s, %s)",
+                           [("book_edited", 1)] * min(5000, int(backlog) - start))
+        conn.commit()
+    cursor.execute("INSERT INTO books (title, author) VALUES ('Feed Test', 'Feed Author')")
+    book_id = cursor.lastrowid
+    conn.commit()
+
+    executor = QueryExecutor()
+    feed = ChangeFeed(executor, interval_ms=int(interval_ms))
+    committed, seen = [], []
+
+    def arrived(events):
+        now = time.perf_counter()
+        seen.extend(now for event in events if event.book_id == book_id)
+
+    feed.eventsArrived.connect(arrived)
+    feed.start()
+    while feed.cursor is None:
+        app.processEvents()
+
+    def write():
+        due = (datetime.now() + timedelta(days=14)).strftime('%Y-%m-%d %H:%M:%S')
+        writer = Database.get_db_connection()
+        c = writer.cursor()
+        for n in range(changes):
+            if n % 2 == 0:
+                checkout_book("member0000000", book_id, due)
+            else:
+                c.execute("SELECT id FROM borrowed_books WHERE book_id = %s", (book_id,))
+                LoanRepository(writer).release(c.fetchone()[0])
+                writer.commit()
+            committed.append(time.perf_counter())
+            time.sleep(0.01)
+        c.close()
+        writer.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    deadline = time.perf_counter() + 60
+    while (writer.is_alive() or len(seen) < changes) and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+    writer.join()
+    feed.stop()
+    delays = [max(0.0, arrival - commit) for arrival, commit in zip(seen, committed)]
+
+    position = fetch_events(None)[1]
+    before = Database.pool_stats()["queries"]
+    start = time.perf_counter()
+    for _ in range(100):
+        fetch_events(position)
+    idle = (time.perf_counter() - start) / 100
+    idle_queries = (Database.pool_stats()["queries"] - before) / 100
+
+    cursor.execute("DELETE FROM borrowed_books WHERE book_id = %s", (book_id,))
+    cursor.execute("DELETE FROM books WHERE id = %s", (book_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    print(f"changes seen      : {len(delays)} of {changes}")
+    print(f"commit to client  : p50 {percentile(delays, 50) * 1000:.1f} ms, "
+          f"p99 {percentile(delays, 99) * 1000:.1f} ms (poll every {interval_ms} ms)")
+    print(f"idle feed read    : {idle * 1000:.2f} ms, {idle_queries:.0f} query, "
+          f"{position:,} events in the table")
+
+
+@check
+def overdue_scan(loans="1000000", batch="5000"):
+    # The overdue scanner over a large loan table: the first pass writes a
+    # fine for every overdue loan, a second pass straight after has nothing
+    # to do, and one a day later only adds a day to the open fines. Memory
+    # should stay flat however many loans there are.
+    from datetime import datetime, timedelta
+    from Fines import scan_overdue
+
+    batch = int(batch)
+    conn = use_bench_database()
+    total = seed_loans(conn, int(loans))
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM fines")
+    cursor.execute("DELETE FROM scheduled_jobs")
+    conn.commit()
+
+    now = datetime.now()
+    runs = [("first pass", now), ("again", now + timedelta(seconds=1)),
+            ("a day later", now + timedelta(days=1, seconds=1)), ("on the day", None)]
+    for label, when in runs:
+        if when is None:
+            # Exactly when the next fine's day starts, where an accrual
+            # leaves next_accrual equal to now
+            cursor.execute("SELECT MIN(next_accrual) FROM fines WHERE status = %s", ("accruing",))
+            when = cursor.fetchone()[0]
+            conn.commit()
+            if when is None:
+                continue
+        rss_before = current_rss_mb()
+        stats = scan_overdue(batch, now=when)
+        print(f"{label:<12}: {stats['elapsed']:7.2f}s  {stats['assessed']:>9,} assessed  "
+              f"{stats['accrued']:>9,} accrued  {stats['batches']:>4} batches  "
+              f"RSS +{current_rss_mb() - rss_before:.1f} MB")
+
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM fines")
+    fines, amount = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    print(f"loans: {total:,}  fines: {fines:,}  total owed: ${amount:,.2f}")
+
+
+SEEDED_HISTORY_ID = 1000000000
+
+
+def seed_history(conn, count, months=24, members=1000, books=10000, batch=10000):
+    # Returned loans spread evenly over the last `months` months. Their ids
+    # start at SEEDED_HISTORY_ID so they never meet real loan ids.
+    import random
+    from datetime import datetime, timedelta
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM loan_history WHERE id >= %s", (SEEDED_HISTORY_ID,))
+    existing = cursor.fetchone()[0]
+    rng = random.Random(existing)
+    now = datetime.now()
+    span = months * 30 * 86400
+    for start in range(existing, count, batch):
+        rows = []
+        for n in range(start, min(start + batch, count)):
+            returned = now - timedelta(seconds=rng.randrange(span))
+            borrowed = returned - timedelta(days=rng.uniform(1, 30))
+            book_id = rng.randint(1, books)
+            rows.append((SEEDED_HISTORY_ID + n, f"member{rng.randrange(members):07d}", book_id,
+                         f"Book {book_id}", borrowed, borrowed + timedelta(days=14), returned))
+        cursor.executemany(
+            "INSERT INTO loan_history (id, username, book_id, book_title, borrowed_at, due_date, returned_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)", rows)
+        conn.commit()
+    cursor.close()
+    return max(existing, count)
+
+
+@check
+def loan_history(archived="10000000", returns="2000", queries="200"):
+    # Return throughput and history queries with `archived` loans in the
+    # partitioned history, against an active-loan table that stays small
+    import random
+    from datetime import date
+    from Admin import HISTORY_TABLE, BORROWED_TABLE
+    from Repositories import LoanRepository
+    from AdminTables import fetch_page
+    from LoanHistory import create_history_table, fetch_member_history, _month
+
+    returns, queries = int(returns), int(queries)
+    conn = use_bench_database()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM loan_history")
+    if cursor.fetchone()[0] == 0:
+        # Partitions for the two years of seeded history, not just from today
+        cursor.execute("DROP TABLE loan_history")
+        create_history_table(cursor, first_month=_month(date.today(), -24))
+    total = seed_history(conn, int(archived))
+    seed_loans(conn, returns)
+
+    cursor.execute("SELECT id FROM borrowed_books ORDER BY id LIMIT %s", (returns,))
+    loan_ids = [row[0] for row in cursor.fetchall()]
+    start = time.perf_counter()
+    loans = LoanRepository(conn)
+    for loan_id in loan_ids:
+        loans.release(loan_id)
+        conn.commit()
+    elapsed = time.perf_counter() - start
+
+    rng = random.Random(3)
+    samples = []
+    for _ in range(queries):
+        t = time.perf_counter()
+        fetch_member_history(f"member{rng.randrange(1000):07d}")
+        samples.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    fetch_page(HISTORY_TABLE, descending=True)
+    history_page = time.perf_counter() - t
+    t = time.perf_counter()
+    fetch_page(BORROWED_TABLE)
+    active_page = time.perf_counter() - t
+
+    month = _month(date.today(), -3)
+    cursor.execute("EXPLAIN SELECT COUNT(*) FROM loan_history WHERE returned_at >= %s AND returned_at < %s",
+                   (month, _month(month, 1)))
+    columns = [d[0] for d in cursor.description]
+    plan = dict(zip(columns, cursor.fetchone()))
+    t = time.perf_counter()
+    cursor.execute("SELECT COUNT(*) FROM loan_history WHERE returned_at >= %s AND returned_at < %s",
+                   (month, _month(month, 1)))
+    month_count = cursor.fetchone()[0]
+    month_report = time.perf_counter() - t
+    cursor.execute("SELECT COUNT(*) FROM borrowed_books")
+    active = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+
+    print(f"archived loans     : {total:,} (active {active:,})")
+    print(f"returns            : {len(loan_ids) / elapsed:,.0f}/sec ({elapsed / max(1, len(loan_ids)) * 1000:.2f} ms each)")
+    print(f"member history     : p50 {percentile(samples, 50) * 1000:.1f} ms, p99 {percentile(samples, 99) * 1000:.1f} ms")
+    print(f"history view page  : {history_page * 1000:.1f} ms")
+    print(f"active loans page  : {active_page * 1000:.1f} ms")
+    print(f"one month report   : {month_count:,} loans in {month_report * 1000:.1f} ms, "
+          f"partitions read: {plan.get('partitions')}")
+
+
+@check
+def repository_queries(books="100000", loans="10000", calls="2000"):
+    # The hot repository statements on their own, on prepared cursors and
+    # then on plain ones: mean and max per call from query_stats()
+    import random
+    from Repositories import BookRepository, LoanRepository, UserRepository, query_stats, reset_query_stats
+
+    calls = int(calls)
+    conn = use_bench_database()
+    seed_loans(conn, int(loans), books=int(books))
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(id) FROM books")
+    max_id = cursor.fetchone()[0]
+    cursor.close()
+    conn.commit()
+
+    results = {}
+    for prepared in (True, False):
+        reset_query_stats()
+        rng = random.Random(7)
+        books_repo = BookRepository(conn, prepared)
+        loans_repo = LoanRepository(conn, prepared)
+        users_repo = UserRepository(conn, prepared)
+        for _ in range(calls):
+            member = f"member{rng.randrange(1000):07d}"
+            books_repo.available_page(rng.randrange(max_id), 60)
+            books_repo.is_on_loan(rng.randrange(max_id))
+            loans_repo.for_member(member)
+            loans_repo.statuses_for_member(member)
+            users_repo.password(member)
+        conn.commit()
+        results[prepared] = query_stats()
+
+    print(f"{calls} calls each; mean / max per call")
+    print(f"{'statement':<36} {'prepared':>20} {'plain':>20}")
+    for name, stats in sorted(results[True].items()):
+        plain = results[False][name]
+        print(f"{name:<36} {stats['time'] / stats['calls'] * 1e6:>8.0f}us / {stats['max'] * 1e3:>5.1f}ms "
+              f"{plain['time'] / plain['calls'] * 1e6:>8.0f}us / {plain['max'] * 1e3:>5.1f}ms")
+    conn.close()
+
+
+@check
+def instrumentation_overhead(books="10000", calls="20000"):
+    # What Instrumentation adds to a statement: the same point lookup on the
+    # bare connection and through the pool's instrumented cursor
+    import random
+    from Instrumentation import get_recorder
+
+    calls = int(calls)
+    conn = use_bench_database()
+    seed_books(conn, int(books))
+    lookup = "SELECT id, title, author, available FROM books WHERE id = %s"
+    recorder = get_recorder()
+    recorder.reset()
+
+    timings = {}
+    for label, cursor in (("bare", conn._conn.cursor(prepared=True)), ("instrumented", conn.statement(lookup))):
+        rng = random.Random(7)
+        start = time.perf_counter()
+        for _ in range(calls):
+            cursor.execute(lookup, (rng.randrange(1, int(books)),))
+            cursor.fetchall()
+        timings[label] = (time.perf_counter() - start) / calls
+    conn.commit()
+    conn.close()
+
+    stats = recorder.queries()[lookup]
+    print(f"{calls} lookups: {timings['bare'] * 1e6:.1f}us bare, {timings['instrumented'] * 1e6:.1f}us "
+          f"instrumented ({(timings['instrumented'] - timings['bare']) * 1e6:+.1f}us per statement)")
+    print(f"recorded {stats['count']} samples: p50 {stats['p50_ms'] * 1000:.0f}us, "
+          f"p99 {stats['p99_ms'] * 1000:.0f}us, {stats['rows']:.1f} rows each")
+
+
+def settle(app, executors, timeout=60.0):
+    # Runs the event loop until no executor has work in flight, i.e. the
+    # view that was asked for has been built
+    deadline = time.perf_counter() + timeout
+    while True:
+        app.processEvents()
+        if all(executor.is_idle() for executor in executors):
+            app.processEvents()
+            return
+        if time.perf_counter() > deadline:
+            raise TimeoutError("workflow did not finish")
+        time.sleep(0.0005)
+
+
+class _Headless:
+    # Message boxes and dialogs answer at once instead of waiting for a click
+    def __enter__(self):
+        from PyQt5.QtWidgets import QMessageBox, QDialog
+
+        self._saved = {name: getattr(QMessageBox, name)
+                       for name in ("information", "warning", "critical", "question")}
+        self._exec = QDialog.exec_
+        for name in ("information", "warning", "critical"):
+            setattr(QMessageBox, name, staticmethod(lambda *args, **kwargs: QMessageBox.Ok))
+        QMessageBox.question = staticmethod(lambda *args, **kwargs: QMessageBox.Yes)
+        QDialog.exec_ = lambda dialog: QDialog.Rejected
+        return self
+
+    def __exit__(self, *exc):
+        from PyQt5.QtWidgets import QMessageBox, QDialog
+
+        for name, fn in self._saved.items():
+            setattr(QMessageBox, name, staticmethod(fn))
+        QDialog.exec_ = self._exec
+
+
+def _git_commit():
+    import subprocess
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+@check
+def workflows(books="10000", users="1000", loans="3000", rounds="20", out="workflows.json", compare=""):
+    # End-to-end latency of what members and admins do all day, driven
+    # through the real windows: log in, open Home, borrow, open My Books;
+    # open Overdue and Members, return the book. Each workflow is timed
+    # from the call to the view being built, with the queries it ran and
+    # the process RSS. Results go to `out` as JSON; pass an earlier file as
+    # `compare` to see what a change did.
+    import json
+    from datetime import datetime
+    import Database
+    from Main import MainWindow
+    from Admin import AdminWindow
+    from Passwords import get_password_service
+    from Instrumentation import get_recorder
+
+    books, users, loans, rounds = int(books), int(users), int(loans), int(rounds)
+    if books - loans < rounds:
+        raise ValueError("need at least `rounds` books that are not out on loan")
+    app = get_app()
+    conn = use_bench_database()
+    seed_loans(conn, loans, members=users, books=books)
+    cursor = conn.cursor()
+    # The one account that is actually logged into
+    cursor.execute("DELETE FROM users WHERE username = 'bench_member'")
+    cursor.execute("INSERT INTO users (username, password) VALUES ('bench_member', %s)",
+                   (get_password_service().hash("bench-password"),))
+    cursor.execute("SELECT id, title FROM books WHERE available = 1 ORDER BY id LIMIT %s", (rounds,))
+    shelf = cursor.fetchall()
+    conn.commit()
+
+    samples = {}
+    queries = {}
+    rss = {"start": current_rss_mb()}
+    rss["peak"] = rss["start"]
+
+    def timed(name, action, executors):
+        before = Database.pool_stats()["queries"]
+        start = time.perf_counter()
+        action()
+        settle(app, executors)
+        samples.setdefault(name, []).append(time.perf_counter() - start)
+        queries.setdefault(name, []).append(Database.pool_stats()["queries"] - before)
+        rss["peak"] = max(rss["peak"], current_rss_mb())
+
+    with _Headless():
+        member = MainWindow()
+        admin = AdminWindow()
+        admin.current_admin_id = 1
+        admin.current_admin_username = "bench_admin"
+        admin.show_dashboard()
+        settle(app, [admin.executor])
+
+        for i, (book_id, title) in enumerate(shelf):
+            page = member.login_page
+            page.username.setText("bench_member")
+            page.password.setText("bench-password")
+            timed("login", page.login, [member.executor])
+            timed("show_home", member.show_home, [member.executor])
+            timed("borrow_book", lambda: member.borrow_book(book_id, title), [member.executor])
+            timed("show_borrowed_books", member.show_borrowed_books, [member.executor])
+
+            timed("view_overdue", admin.dashboard.view_overdue, [admin.executor])
+            timed("view_members", admin.dashboard.view_members, [admin.executor])
+            cursor.execute("SELECT id FROM borrowed_books WHERE book_id = %s", (book_id,))
+            row = cursor.fetchone()
+            conn.commit()
+            if row is None:
+                raise RuntimeError(f"borrow of book {book_id} did not happen")
+            timed("return_book", lambda: admin.dashboard.return_book(row[0]), [admin.executor])
+
+            member.logout_clicked()
+            settle(app, [member.executor])
+
+        admin.logout()
+        member.close()
+        admin.hide()
+        settle(app, [member.executor, admin.executor])
+    cursor.close()
+    conn.close()
+    rss["end"] = current_rss_mb()
+    # Widgets each view left on screen, as Instrumentation counted them
+    views = get_recorder().views()
+
+    results = {
+        "commit": _git_commit(),
+        "backend": Database.dialect(),
+        "when": datetime.now().isoformat(timespec="seconds"),
+        "seed": {"books": books, "users": users, "loans": loans},
+        "rounds": rounds,
+        "workflows": {
+            name: {
+                "p50_ms": round(percentile(times, 50) * 1000, 2),
+                "p95_ms": round(percentile(times, 95) * 1000, 2),
+                "p99_ms": round(percentile(times, 99) * 1000, 2),
+                "max_ms": round(max(times) * 1000, 2),
+                "queries": round(sum(queries[name]) / len(times), 1),
+                "widgets": round(views[name]["widgets"]) if name in views else None,
+            }
+            for name, times in samples.items()
+        },
+        "rss_mb": {key: round(value, 1) for key, value in rss.items()},
+    }
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = {}
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)["workflows"]
+    print(f"{results['backend']} @ {results['commit']}: {books:,} books, {users:,} members, "
+          f"{loans:,} loans, {rounds} rounds")
+    print(f"{'workflow':<20} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8} {'widgets':>8}")
+    for name, stats in results["workflows"].items():
+        widgets = "" if stats["widgets"] is None else stats["widgets"]
+        line = (f"{name:<20} {stats['p50_ms']:>7.1f}ms {stats['p95_ms']:>7.1f}ms "
+                f"{stats['p99_ms']:>7.1f}ms {stats['queries']:>8} {widgets:>8}")
+        if name in baseline:
+            was = baseline[name]
+            line += (f"   p50 {stats['p50_ms'] - was['p50_ms']:+.1f}ms, "
+                     f"queries {stats['queries'] - was['queries']:+.1f}")
+        print(line)
+    print(f"RSS: {rss['start']:.1f} MB at start, {rss['peak']:.1f} MB peak, {rss['end']:.1f} MB at end")
+    print(f"results written to {out}")
+
+
+@check
+def navigation_cache(books="10000", users="1000", loans="3000", rounds="20"):
+    # Queries per navigation with the read-through caches: a member going
+    # between Home and My Books and an admin between All Books and Members,
+    # first cold, then warm, then after a borrow and a member edit that
+    # each invalidate only what they change. The change feeds and the
+    # fines scanner are stopped so only navigation runs queries.
+    import Database
+    from Main import MainWindow
+    from Admin import AdminWindow
+    from Passwords import get_password_service
+    from Repositories import UserRepository
+    from Cache import cache_stats, clear_caches
+
+    rounds = int(rounds)
+    app = get_app()
+    conn = use_bench_database()
+    seed_loans(conn, int(loans), members=int(users), books=int(books))
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM users WHERE username = 'bench_member'")
+    cursor.execute("INSERT INTO users (username, password) VALUES ('bench_member', %s)",
+                   (get_password_service().hash("bench-password"),))
+    # Earlier checks may have lent out every seeded book
+    title = "Navigation Test"
+    cursor.execute("INSERT INTO books (title, author) VALUES (%s, 'Navigation Author')", (title,))
+    book_id = cursor.lastrowid
+    cursor.execute("SELECT id, username FROM users WHERE username LIKE 'member%%' ORDER BY id LIMIT 1")
+    member_id, member_name = cursor.fetchone()
+    conn.commit()
+    clear_caches()
+
+    with _Headless():
+        member = MainWindow()
+        admin = AdminWindow()
+        admin.current_admin_id = 1
+        admin.current_admin_username = "bench_admin"
+        admin.show_dashboard()
+        page = member.login_page
+        page.username.setText("bench_member")
+        page.password.setText("bench-password")
+        page.login()
+        settle(app, [member.executor, admin.executor])
+        member.feed.stop()
+        admin.dashboard.feed.stop()
+        admin.scan_timer.stop()
+        settle(app, [member.executor, admin.executor])
+
+        steps = [
+            ("show_home", member.show_home, member.executor),
+            ("show_borrowed_books", member.show_borrowed_books, member.executor),
+            ("view_all_books", admin.dashboard.view_all_books, admin.executor),
+            ("view_members", admin.dashboard.view_members, admin.executor),
+        ]
+
+        def navigate(label, repeat):
+            before = Database.pool_stats()["queries"]
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for name, action, executor in steps:
+                    action()
+                    settle(app, [executor])
+            elapsed = time.perf_counter() - start
+            queries = Database.pool_stats()["queries"] - before
+            print(f"{label:<28} {queries / repeat:>8.1f} queries/round {elapsed / repeat * 1000:>8.1f} ms/round")
+
+        navigate("cold (one round)", 1)
+        navigate(f"warm ({rounds} rounds)", rounds)
+
+        member.borrow_book(book_id, title)
+        settle(app, [member.executor])
+        navigate("after a borrow", 1)
+        navigate("warm again", rounds)
+
+        with Database.get_db_connection() as write:
+            UserRepository(write).rename(member_id, member_name, member_name + "_x")
+            write.commit()
+            UserRepository(write).rename(member_id, member_name + "_x", member_name)
+            write.commit()
+        navigate("after a member edit", 1)
+        navigate("warm again", rounds)
+
+        member.close()
+        admin.hide()
+        settle(app, [member.executor, admin.executor])
+    cursor.close()
+    conn.close()
+
+    print(f"{'cache':<14} {'entries':>8} {'hits':>8} {'misses':>8} {'hit rate':>9} {'invalidated':>12}")
+    for name, stats in sorted(cache_stats().items()):
+        print(f"{name:<14} {stats['entries']:>8} {stats['hits']:>8} {stats['misses']:>8} "
+              f"{stats['hit_rate']:>8.0%} {stats['invalidations']:>12}")
+
+
+@check
+def card_build_rate(counts="50,500", repeats="5"):
+    # How fast My Books builds its loan cards: the panel for `count` loans
+    # is built and shown (which is when widgets are polished against the
+    # stylesheet) `repeats` times. Also counts the widgets on the panel that
+    # carry a stylesheet of their own, each of which Qt parses separately.
+    from datetime import datetime, timedelta
+    from PyQt5.QtWidgets import QWidget
+    from Main import MainWindow
+
+    app = get_app()
+    conn = use_bench_database()
+    seed_books(conn, 100)
+    conn.close()
+
+    with _Headless():
+        window = MainWindow()
+        window.current_user = "bench_member"
+        window.Main_screen()
+        settle(app, [window.executor])
+        window.feed.stop()
+        settle(app, [window.executor])
+
+        due = datetime.now() + timedelta(days=14)
+        print(f"{'cards':>6} {'ms/panel':>10} {'cards/s':>10} {'widgets':>8} {'own stylesheets':>16}")
+        for count in [int(c) for c in counts.split(",")]:
+            loans = [(f"Book {i}", due, i % 2) for i in range(count)]
+            times = []
+            for _ in range(int(repeats)):
+                start = time.perf_counter()
+                window._build_borrowed_books(loans)
+                app.processEvents()
+                times.append(time.perf_counter() - start)
+            widgets = window.main_panel.findChildren(QWidget)
+            styled = sum(1 for widget in widgets if widget.styleSheet())
+            best = min(times)
+            print(f"{count:>6} {best * 1000:>10.1f} {count / best:>10,.0f} {len(widgets):>8} {styled:>16}")
+        window.close()
+        settle(app, [window.executor])
+
+
+
+def schema_snapshot(cursor):
+    # {table: sorted [(index, column, position, unique)]} for the current
+    # MySQL database, foreign keys' indexes included
+    cursor.execute("""
+        SELECT table_name, index_name, column_name, seq_in_index, non_unique
+        FROM information_schema.statistics WHERE table_schema = DATABASE()
+    """)
+    snapshot = {}
+    for table, index, column, position, non_unique in cursor.fetchall():
+        snapshot.setdefault(table, []).append((index, column, position, not non_unique))
+    return {table: sorted(rows) for table, rows in snapshot.items()}
+
+
+@check
+def migration_cycle(target="5", loans="200"):
+    # Rolls a migrated database with loans in it back to `target` and
+    # migrates it forward again; the indexes must come back as they were.
+    # MySQL only: it is the backend that keeps an index behind each foreign
+    # key and refuses to drop the last one.
+    import Database
+    from Migrations import rollback, migrate, current_version
+
+    conn = use_bench_database()
+    if Database.dialect() != "mysql":
+        conn.close()
+        print("migration_cycle needs the MySQL backend")
+        return
+    seed_loans(conn, int(loans), members=50, books=int(loans) * 2)
+    cursor = conn.cursor()
+    before = schema_snapshot(cursor)
+    undone = rollback(conn, int(target))
+    print(f"rolled back   : {undone}, now at {current_version(cursor)}")
+    applied = migrate(conn)
+    print(f"migrated again: {applied}, now at {current_version(cursor)}")
+    after = schema_snapshot(cursor)
+    cursor.close()
+    conn.close()
+    for table in sorted(set(before) | set(after)):
+        assert before.get(table) == after.get(table), (
+            f"{table} indexes changed: {before.get(table)} -> {after.get(table)}")
+    print("indexes match after the round trip")
+
+
+@check
+def cover_scroll(books="10000", art="500", steps="200"):
+    # Scrolls a catalog of `books` generated books top to bottom, `art` of
+    # which have cover art (900x1350 JPEGs written to a scratch folder),
+    # timing each scroll step, in wall time and in GUI thread CPU time (on
+    # a single core the workers' decoding shows up in the wall time too);
+    # then until every cover painted on the way is ready. Run twice: with an empty thumbnail
+    # folder, then with memory cleared but the thumbnails kept on disk.
+    # Also times load_cover itself for a cover with art, cold and warm.
+    import shutil
+    import tempfile
+    from PyQt5.QtGui import QImage, QColor
+    from PyQt5.QtCore import QSize
+    from Catalog import BookListModel, BookCardDelegate, CatalogView, CARD_WIDTH, COVER_HEIGHT
+    from Covers import load_cover
+    from Cache import clear_caches
+
+    app = get_app()
+    size, art = int(books), int(art)
+    rows = [(i, f"Generated Title {i}", f"Author {i % 997}") for i in range(1, size + 1)]
+    scratch = tempfile.mkdtemp(prefix="covers-")
+    cover_dir = os.path.join(scratch, "art")
+    thumb_dir = os.path.join(scratch, "thumbs")
+    os.makedirs(cover_dir)
+    source = QImage(900, 1350, QImage.Format_RGB32)
+    for i in range(1, art + 1):
+        # Spread over the catalog so every stretch of the scroll has some
+        source.fill(QColor.fromHsv(i * 37 % 360, 160, 200))
+        source.save(os.path.join(cover_dir, f"{i * size // art}.jpg"), "JPEG", 85)
+
+    def fetch_page(after_id, limit):
+        return rows[after_id:after_id + limit]
+
+    try:
+        cover_size = QSize(CARD_WIDTH, COVER_HEIGHT)
+        book_id = size // art
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            load_cover(book_id, rows[book_id - 1][1], cover_size, cover_dir, thumb_dir)
+            print(f"load_cover with art, {label} thumbnail: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        for run in ("empty thumbnail folder", "thumbnails on disk"):
+            clear_caches()
+            model = BookListModel(fetch_page, page_size=size)
+            delegate = BookCardDelegate()
+            delegate.covers.cover_dir = cover_dir
+            delegate.covers.thumb_dir = thumb_dir
+            view = CatalogView()
+            view.setItemDelegate(delegate)
+            view.setModel(model)
+            view.resize(900, 700)
+            view.show()
+            app.processEvents()
+
+            bar = view.verticalScrollBar()
+            frames, cpu = [], []
+            start = time.perf_counter()
+            for step in range(int(steps) + 1):
+                frame, frame_cpu = time.perf_counter(), time.thread_time()
+                bar.setValue(bar.maximum() * step // int(steps))
+                view.viewport().repaint()
+                app.processEvents()
+                frames.append(time.perf_counter() - frame)
+                cpu.append(time.thread_time() - frame_cpu)
+            scrolled = time.perf_counter() - start
+            while not delegate.covers.is_idle():
+                app.processEvents()
+                time.sleep(0.001)
+            ready = time.perf_counter() - start
+            assert not delegate.covers.executor._generations, "cover batches left keys behind"
+            stats = delegate.covers.cache.stats()
+            print(f"{run}: {len(frames)} steps in {scrolled * 1000:.0f} ms, frame p50 "
+                  f"{percentile(frames, 50) * 1000:.2f} ms, p95 {percentile(frames, 95) * 1000:.2f} ms, "
+                  f"max {max(frames) * 1000:.2f} ms, GUI thread CPU p95 {percentile(cpu, 95) * 1000:.2f} ms; "
+                  f"covers ready after {ready * 1000:.0f} ms, "
+                  f"{stats['entries']} in memory, {len(os.listdir(thumb_dir))} thumbnails on disk")
+            view.close()
+            view.deleteLater()
+            delegate.deleteLater()
+            app.processEvents()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in CHECKS:
+        print("usage: python Tester.py <check> [args...]")
+        print("checks: " + ", ".join(sorted(CHECKS)))
+        sys.exit(1)
+    CHECKS[sys.argv[1]](*sys.argv[2:])
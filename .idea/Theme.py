@@ -0,0 +1,141 @@
+# Look of both apps, compiled once.
+#
+# All styling is one application stylesheet, set by apply_theme() when the
+# first window is created. Widgets are matched by object name when there is
+# one of them (#topBar) or by the "role" property when there are many
+# (QPushButton[role="admin"]), so building a widget never hands Qt a
+# stylesheet of its own to parse. Fonts are built once per name by font()
+# and shared; Qt copies a QFont by reference.
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtGui import QFont
+from PyQt5.QtCore import Qt
+
+# Colors
+TEXT = "#2c3e50"
+MUTED = "#7f8c8d"
+ACCENT = "#3498db"
+ACCENT_DARK = "#2980b9"
+ADMIN = "#4CAF50"
+ADMIN_HOVER = "#45a049"
+ADMIN_PRESSED = "#3e8e41"
+CLAIMED = "#27ae60"
+UNCLAIMED = "#3498db"
+DUE = "#e67e22"
+
+# name: (family, point size, weight)
+FONTS = {
+    "field": ("Arial", 10, QFont.Normal),
+    "form_title": ("Arial", 16, QFont.Bold),
+    "signup_title": ("Segoe UI", 16, QFont.Bold),
+    "page_title": ("Segoe UI", 18, QFont.Bold),
+    "section": ("Segoe UI", 14, QFont.Bold),
+    "message": ("Segoe UI", 12, QFont.Normal),
+    "banner": ("Georgia", 24, QFont.Bold),
+    # Loan cards in My Books
+    "card_icon": ("Arial", 24, QFont.Normal),
+    "card_title": ("Segoe UI", 11, QFont.Bold),
+    "card_detail": ("Segoe UI", 9, QFont.Normal),
+    "card_badge": ("Segoe UI", 9, QFont.Bold),
+    # Book cards painted by Catalog.BookCardDelegate and Covers
+    "tile_icon": ("Arial", 22, QFont.Normal),
+    "tile_title": ("Segoe UI", 10, QFont.Bold),
+    "tile_author": ("Segoe UI", 9, QFont.Normal),
+    "tile_label": ("Segoe UI", 8, QFont.Bold),
+    # Row buttons painted by AdminTables.ActionDelegate
+    "row_action": ("Segoe UI", 9, QFont.Bold),
+}
+
+STYLESHEET = f"""
+QWidget#blankScreen {{ background-color: white; }}
+
+QLineEdit[role="field"] {{ padding: 8px; border-radius: 5px; border: 1px solid gray; }}
+QLineEdit[role="adminField"] {{ border: 1px solid #ccc; border-radius: 8px; padding: 0 10px; font-size: 14px; }}
+QLineEdit[role="adminField"]:focus {{ border-color: #6c63ff; }}
+
+QWidget#signupForm {{ background-color: #fefefe; border-radius: 15px; border: 1px solid #e0e0e0; }}
+QCheckBox#signupShowPassword {{ font-size: 12px; }}
+QPushButton#signupButton {{
+    background-color: {ACCENT}; color: white; border-radius: 8px; padding: 10px; font-weight: bold;
+}}
+QPushButton#signupButton:hover {{ background-color: {ACCENT_DARK}; }}
+QPushButton#switchButton {{ color: #555; background: none; border: none; }}
+
+QWidget#topBar {{ background-color: #A1C6EA; border-bottom: 2px solid #7FB3D5; }}
+QPushButton[role="nav"] {{
+    background-color: #ffffff; color: #34495e; border: none; padding: 10px 18px;
+    border-radius: 10px; font-weight: bold;
+}}
+QPushButton[role="nav"]:hover {{ background-color: #d6eaf8; }}
+QWidget#mainPanel {{ background-color: #fdfdfd; border-top: 1px solid #ddd; }}
+
+QLabel[role="muted"] {{ color: {MUTED}; }}
+QLabel[role="empty"] {{ color: {MUTED}; padding: 60px; }}
+
+QWidget#catalogHeader {{ background-color: #f5f5f5; border-radius: 10px; padding: 12px; }}
+QLabel#catalogTitle {{ color: {TEXT}; }}
+QLineEdit#searchBar {{
+    padding: 5px 12px; border: 1px solid #ccc; border-radius: 15px; background-color: #fff; font-size: 13px;
+}}
+QLabel#sectionLabel {{ color: #34495e; }}
+QLabel#catalogStatus {{ color: #999; font-size: 14px; margin: 30px; }}
+QListView#catalogView {{ border: none; }}
+
+QLabel#loansHeader {{
+    color: white; background: qlineargradient(x1:0, y1:0, x2:1, y2:0, stop:0 #6dd5ed, stop:1 #2193b0);
+    padding: 15px; border-radius: 12px;
+}}
+QScrollArea#loansScroll {{ border: none; }}
+QFrame[role="loanCard"] {{
+    background-color: #fdfefe; border-radius: 12px; border: 1px solid #ecf0f1; padding: 12px;
+}}
+QFrame[role="loanCard"]:hover {{ background-color: #f0f8ff; }}
+QLabel[role="due"] {{ color: {DUE}; }}
+QLabel[role="claimed"] {{ color: {UNCLAIMED}; padding: 3px 8px; background-color: #f8f9fa; border-radius: 4px; }}
+QLabel[role="claimed"][claimed="true"] {{ color: {CLAIMED}; }}
+
+QTextEdit#receipt {{ font-family: Consolas; font-size: 12pt; background-color: #f9f9f9; padding: 10px; }}
+
+QPushButton[role="admin"] {{
+    background-color: {ADMIN}; color: white; border-radius: 4px; padding: 8px 16px; font-weight: bold;
+}}
+QPushButton[role="admin"]:hover {{ background-color: {ADMIN_HOVER}; }}
+QPushButton[role="admin"]:pressed {{ background-color: {ADMIN_PRESSED}; }}
+QTableView[role="admin"] {{ alternate-background-color: #f0f0f0; border: 1px solid #d0d0d0; }}
+QTableView[role="admin"] QHeaderView::section {{
+    background-color: {ADMIN}; color: white; padding: 4px; font-weight: bold;
+}}
+QLabel#owedLabel {{ color: red; }}
+"""
+
+_fonts = {}
+
+
+def font(name):
+    cached = _fonts.get(name)
+    if cached is None:
+        family, size, weight = FONTS[name]
+        cached = _fonts[name] = QFont(family, size, weight)
+    return cached
+
+
+def apply_theme(app=None):
+    # Safe to call from every window: the stylesheet is only set once
+    app = app or QApplication.instance()
+    if app.property("libraryTheme"):
+        return
+    app.setStyleSheet(STYLESHEET)
+    app.setProperty("libraryTheme", True)
+
+
+def set_role(widget, role):
+    # Set before the widget is shown: Qt matches the rules at first show
+    # and doesn't look again when a property changes
+    widget.setProperty("role", role)
+    return widget
+
+
+def styled_background(widget, name):
+    # A plain QWidget only paints a stylesheet background with this set
+    widget.setObjectName(name)
+    widget.setAttribute(Qt.WA_StyledBackground, True)
+    return widget
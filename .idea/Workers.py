@@ -0,0 +1,100 @@
+# Background execution so database calls never block the Qt event loop
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from Database import POOL_SIZE
+
+
+class _TaskSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+
+class QueryTask(QRunnable):
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self.signals = _TaskSignals()
+
+    def run(self):
+        if self.cancelled:
+            # Still report back so the executor can forget the task; the
+            # generation check drops the empty result.
+            self.signals.finished.emit(None)
+            return
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            self.signals.finished.emit(result)
+
+
+class QueryExecutor(QObject):
+    # Runs blocking work on a QThreadPool and delivers the result back on the
+    # GUI thread. Each submit() is tagged with a key (usually the panel being
+    # filled); a newer submit for the same key makes older results stale, so a
+    # view the user has already left is never painted over the current one.
+    # A key is forgotten once nothing is in flight under it, so callers may
+    # use a new key per task.
+    def __init__(self, parent=None, max_threads=POOL_SIZE):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self._generations = {}
+        self._pending = {}
+        self.dropped = 0
+
+    def submit(self, key, fn, *args, on_result=None, on_error=None, **kwargs):
+        self.cancel(key)
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+
+        task = QueryTask(fn, *args, **kwargs)
+        task.signals.finished.connect(
+            lambda result: self._deliver(key, generation, task, on_result, result))
+        task.signals.failed.connect(
+            lambda error: self._deliver(key, generation, task, on_error, error))
+        self._pending.setdefault(key, set()).add(task)
+        self.pool.start(task)
+        return task
+
+    def cancel(self, key):
+        # Tasks still queued are pulled before they touch the database;
+        # ones already running finish, but their result is dropped.
+        self._generations[key] = self._generations.get(key, 0) + 1
+        pending = self._pending.get(key, set())
+        for task in list(pending):
+            task.cancelled = True
+            if self.pool.tryTake(task):
+                pending.discard(task)
+        self._forget_if_done(key)
+
+    def is_busy(self, key):
+        return bool(self._pending.get(key))
+
+    def is_idle(self):
+        # Nothing in flight under any key
+        return not any(self._pending.values())
+
+    def _forget_if_done(self, key):
+        # With no task left to deliver there is no stale result to tell
+        # apart, so the key's generation can start again from nothing
+        if not self._pending.get(key):
+            self._pending.pop(key, None)
+            self._generations.pop(key, None)
+
+    def _deliver(self, key, generation, task, callback, value):
+        self._pending.get(key, set()).discard(task)
+        stale = self._generations.get(key) != generation
+        self._forget_if_done(key)
+        if stale:
+            self.dropped += 1
+            return
+        if callback is not None:
+            callback(value)
+
+    def wait_for_done(self, msecs=-1):
+        return self.pool.waitForDone(msecs)